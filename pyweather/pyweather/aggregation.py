@@ -0,0 +1,524 @@
+import os
+import numpy as np
+from decimal import Decimal
+from .utils.numeric import ARRAY_DTYPE, to_output
+from .utils.settings import parse_service_values, service_key
+
+UNKNOWN_FORECAST_AGE_HOURS = int(os.getenv("UNKNOWN_FORECAST_AGE_HOURS", 1))
+
+# Smallest spread (°C) the robust averages assume between the services, so
+# that a few identical temperatures don't turn the others into outliers.
+# Twice the 0.1 °C the services round their temperatures to
+MIN_ROBUST_SCALE = 0.2
+
+STATISTICS = ["average", "min", "max", "median", "std", "spread", "count"]
+
+SERVICE_WEIGHTS = parse_service_values(os.getenv("SERVICE_WEIGHTS", ""))
+
+
+def soothing(hours):
+    """A soothing factors to compute exponentially decaying data
+    i.e. older forecasts shouldn't count as much as more recent forecasts
+    Works on a single number of hours as well as on arrays of hours
+    """
+    if isinstance(hours, np.ndarray):
+        return 2 / (hours + 1)
+    return 2 / (Decimal(hours) + 1)
+
+
+def sumproduct(*lists):
+    """Excel-style sumproduct function
+    Arrays are multiplied element-wise then summed over their last axis
+    """
+    if all(isinstance(elt, np.ndarray) for elt in lists):
+        product = lists[0]
+        for elt in lists[1:]:
+            product = product * elt
+        return product.sum(axis=-1)
+    return sum([x * y for x, y in zip(*lists)])
+
+
+def indexes_to_cube(indexes, epoch_hours, service_names):
+    """Lays out indexed documents as a (location x hour x service) cube
+
+    Input:
+        indexes
+            One {service_name: index} per location, as in HourlyForecast.indexed
+        epoch_hours
+            One sequence of epoch hours per location, all of the same length
+            [(440721, 440722, 440723), (440722, 440723, 440724)]
+        service_names
+            ["pyweather.api.met", "pyweather.api.yrno"]
+
+    Output:
+        (temperatures, mask)
+            Two arrays of shape (locations, hours, services)
+            mask is True where the service has a forecast for that hour
+    """
+    n_locations, n_services = len(indexes), len(service_names)
+    n_hours = len(epoch_hours[0]) if n_locations else 0
+    temperatures = np.zeros((n_locations, n_hours, n_services), dtype=ARRAY_DTYPE)
+    mask = np.zeros((n_locations, n_hours, n_services), dtype=bool)
+
+    for l, (indexed, hours) in enumerate(zip(indexes, epoch_hours)):
+        for s, service_name in enumerate(service_names):
+            index = indexed.get(service_name)
+            if not index:
+                continue
+            service_temperatures = index["temperatures"]
+            for h, epoch_hour in enumerate(hours):
+                temperature = service_temperatures.get(epoch_hour)
+                if temperature is not None:
+                    temperatures[l, h, s] = temperature
+                    mask[l, h, s] = True
+
+    return temperatures, mask
+
+
+def indexes_to_ages(indexes, service_names):
+    """Forecast ages of the indexed documents, as a (location x service) array
+
+    Output:
+        Array of shape (locations, services), NaN when a service does not
+        supply an issue time
+    """
+    ages = np.full((len(indexes), len(service_names)), np.nan)
+    for l, indexed in enumerate(indexes):
+        for s, service_name in enumerate(service_names):
+            index = indexed.get(service_name)
+            if index and index["metadata"].get("forecast_age_hours") is not None:
+                ages[l, s] = index["metadata"]["forecast_age_hours"]
+    return ages
+
+
+def age_weights(ages, service_names, service_weights=None):
+    """Weights of the services from the age of their forecasts, optionally
+    multiplied by a configured weight per service
+
+    Input:
+        ages
+            Array of shape (locations, services)
+        service_names
+            ["pyweather.api.met", "pyweather.api.yrno"]
+        service_weights (optional)
+            {"MET": 1.5, "YRNO": 0.8}, defaults to SERVICE_WEIGHTS
+
+    Output:
+        Array of shape (locations, 1, services), to broadcast over the hours
+
+    A service without an issue time counts as old as the median of the
+    location's known ages, so that it neither outweighs nor loses to the
+    services that report one. UNKNOWN_FORECAST_AGE_HOURS is only used when
+    no service of the location reports an age
+    """
+    if service_weights is None:
+        service_weights = SERVICE_WEIGHTS
+    ages = np.asarray(ages, dtype=np.float64)
+    unknown = np.isnan(ages)
+    known = ~unknown
+    neutral = np.full(ages.shape[0], float(UNKNOWN_FORECAST_AGE_HOURS))
+    has_known = known.any(axis=-1)
+    if has_known.any():
+        with np.errstate(invalid="ignore"):
+            neutral[has_known] = np.nanmedian(ages[has_known], axis=-1)
+    ages = np.where(unknown, neutral[:, None], ages)
+    configured = np.array(
+        [service_weights.get(service_key(elt), 1.0) for elt in service_names]
+    )
+    return (soothing(ages) * configured)[:, None, :]
+
+
+def weighted_average(temperatures, mask, weights):
+    """Weighted average of every (location, hour) cell over the services axis
+
+    Input:
+        temperatures
+            Array of shape (locations, hours, services)
+        mask
+            Boolean array of the same shape, False for missing values
+        weights
+            Array broadcastable to the same shape
+
+    Output:
+        Array of shape (locations, hours), NaN where no service has a forecast
+    """
+    temperatures = np.asarray(temperatures, dtype=ARRAY_DTYPE)
+    weights = np.where(mask, np.broadcast_to(weights, temperatures.shape), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sumproduct(weights, np.where(mask, temperatures, 0.0)) / weights.sum(
+            axis=-1
+        )
+
+
+class RunningWeightedAverage:
+    """Plain and age-weighted averages of a (location x hour) grid, updated
+    as the services' results arrive
+
+    The weights depend on the ages of all the services (see age_weights()),
+    so the results are kept and the weighted average is computed over all
+    of them when read, exactly as in aggregate_hourly_forecasts()
+    """
+
+    def __init__(self, n_locations, n_hours, service_weights=None):
+        self.service_weights = (
+            SERVICE_WEIGHTS if service_weights is None else service_weights
+        )
+        self.shape = (n_locations, n_hours)
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.sum_temperatures = np.zeros(self.shape, dtype=ARRAY_DTYPE)
+        self.service_names = []
+        self._temperatures = []
+        self._masks = []
+        self._ages = []
+
+    def add(self, service_name, temperatures, mask, ages):
+        """Adds the results of a single service
+
+        Input:
+            service_name
+                'pyweather.api.met'
+            temperatures
+                Array of shape (locations, hours)
+            mask
+                Boolean array of the same shape, False for missing values
+            ages
+                Array of shape (locations,), NaN for unknown ages
+        """
+        mask = np.asarray(mask, dtype=bool)
+        temperatures = np.where(mask, temperatures, 0.0).astype(ARRAY_DTYPE)
+        self.count += mask
+        self.sum_temperatures += temperatures
+        self.service_names.append(service_name)
+        self._temperatures.append(temperatures)
+        self._masks.append(mask)
+        self._ages.append(np.asarray(ages, dtype=np.float64))
+
+    @property
+    def average(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sum_temperatures / self.count
+
+    @property
+    def weighted_average(self):
+        if not self.service_names:
+            return np.full(self.shape, np.nan)
+        return weighted_average(
+            np.stack(self._temperatures, axis=-1),
+            np.stack(self._masks, axis=-1),
+            age_weights(
+                np.stack(self._ages, axis=-1),
+                self.service_names,
+                self.service_weights,
+            ),
+        )
+
+
+class RunningAggregate:
+    """Count, sum, min, max, average and (Welford) variance of a
+    (location x hour) grid, updated incrementally service by service
+    """
+
+    def __init__(self, n_locations, n_hours):
+        shape = (n_locations, n_hours)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.sum = np.zeros(shape, dtype=ARRAY_DTYPE)
+        self.min = np.full(shape, np.inf, dtype=ARRAY_DTYPE)
+        self.max = np.full(shape, -np.inf, dtype=ARRAY_DTYPE)
+        self.mean = np.zeros(shape, dtype=ARRAY_DTYPE)
+        self.m2 = np.zeros(shape, dtype=ARRAY_DTYPE)
+
+    def add(self, temperatures, mask):
+        """Adds the results of a single service
+
+        Input:
+            temperatures
+                Array of shape (locations, hours)
+            mask
+                Boolean array of the same shape, False for missing values
+        """
+        mask = np.asarray(mask, dtype=bool)
+        temperatures = np.where(mask, temperatures, 0.0).astype(ARRAY_DTYPE)
+        self.count += mask
+        self.sum += temperatures
+        self.min = np.where(mask, np.minimum(self.min, temperatures), self.min)
+        self.max = np.where(mask, np.maximum(self.max, temperatures), self.max)
+        delta = temperatures - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(mask, self.mean + delta / self.count, self.mean)
+        self.m2 += np.where(mask, delta * (temperatures - mean), 0.0)
+        self.mean = mean
+
+    def statistics(self):
+        """Current statistics, with NaN for the cells without any forecast
+
+        Output:
+            {
+                "average": array (locations, hours),
+                "min": ...,
+                "max": ...,
+                "std": ...,
+                "spread": ...,
+                "count": int array (locations, hours),
+            }
+        """
+        empty = self.count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.m2 / self.count)
+        minimum = np.where(empty, np.nan, self.min)
+        maximum = np.where(empty, np.nan, self.max)
+        return {
+            "average": np.where(empty, np.nan, self.mean),
+            "min": minimum,
+            "max": maximum,
+            "std": std,
+            "spread": maximum - minimum,
+            "count": self.count.copy(),
+        }
+
+
+def masked_median(values, mask):
+    """Median over the last axis, ignoring the masked out values
+
+    Output:
+        Array with the last axis removed, NaN where every value is masked out
+    """
+    count = mask.sum(axis=-1)
+    if not values.shape[-1]:
+        return np.full(count.shape, np.nan)
+
+    # Missing values are sorted last, the median sits in the first `count` ones
+    ordered = np.sort(np.where(mask, values, np.inf), axis=-1)
+    lower = np.clip((count - 1) // 2, 0, None)[..., None]
+    upper = np.clip(count // 2, 0, None)[..., None]
+    median = (
+        np.take_along_axis(ordered, lower, axis=-1)[..., 0]
+        + np.take_along_axis(ordered, upper, axis=-1)[..., 0]
+    ) / 2
+    return np.where(count == 0, np.nan, median)
+
+
+def masked_mean(values, mask):
+    """Average over the last axis, ignoring the masked out values"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(mask, values, 0.0).sum(axis=-1) / mask.sum(axis=-1)
+
+
+def trimmed_mean(temperatures, mask, proportion=0.2):
+    """Average of every (location, hour) cell once the lowest and highest
+    `proportion` of the services' temperatures are discarded
+
+    Output:
+        Array of shape (locations, hours)
+    """
+    temperatures = np.asarray(temperatures, dtype=ARRAY_DTYPE)
+    mask = np.asarray(mask, dtype=bool)
+    count = mask.sum(axis=-1, keepdims=True)
+    trimmed = np.floor(count * proportion).astype(np.int64)
+
+    # Missing values are sorted last, beyond the first `count` ranks
+    ordered = np.sort(np.where(mask, temperatures, np.inf), axis=-1)
+    ranks = np.arange(ordered.shape[-1])
+    kept = (ranks >= trimmed) & (ranks < count - trimmed)
+    return masked_mean(ordered, kept)
+
+
+def median_absolute_deviation(temperatures, mask, median=None):
+    """Median absolute deviation, scaled to be consistent with the standard
+    deviation of normally distributed temperatures
+
+    Output:
+        Array of shape (locations, hours)
+    """
+    if median is None:
+        median = masked_median(temperatures, mask)
+    deviations = np.abs(temperatures - median[..., None])
+    return 1.4826 * masked_median(deviations, mask)
+
+
+def robust_scale(temperatures, mask, median):
+    """Median absolute deviation, no smaller than MIN_ROBUST_SCALE"""
+    return np.maximum(
+        median_absolute_deviation(temperatures, mask, median), MIN_ROBUST_SCALE
+    )
+
+
+def mad_filtered_mean(temperatures, mask, threshold=3.0):
+    """Average of every (location, hour) cell, ignoring the services that
+    deviate from the median by more than `threshold` median absolute
+    deviations (at least MIN_ROBUST_SCALE)
+
+    Output:
+        Array of shape (locations, hours)
+    """
+    temperatures = np.asarray(temperatures, dtype=ARRAY_DTYPE)
+    mask = np.asarray(mask, dtype=bool)
+    median = masked_median(temperatures, mask)
+    mad = robust_scale(temperatures, mask, median)
+    deviations = np.abs(temperatures - median[..., None])
+    kept = mask & (deviations <= threshold * mad[..., None])
+    return masked_mean(temperatures, kept)
+
+
+def huber_mean(temperatures, mask, delta=1.345, iterations=10):
+    """Huber M-estimate of the location of every (location, hour) cell,
+    by iteratively reweighting the services' temperatures.
+    Residuals beyond `delta` median absolute deviations (at least
+    MIN_ROBUST_SCALE) get a decreasing weight
+
+    Output:
+        Array of shape (locations, hours)
+    """
+    temperatures = np.asarray(temperatures, dtype=ARRAY_DTYPE)
+    mask = np.asarray(mask, dtype=bool)
+    estimate = masked_median(temperatures, mask)
+    scale = robust_scale(temperatures, mask, estimate)
+    # No service for the cell: nothing to reweigh
+    settled = ~(scale > 0)
+    scale = np.where(settled, 1.0, scale)[..., None]
+
+    for _ in range(iterations):
+        residuals = np.abs(temperatures - estimate[..., None]) / scale
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weights = np.where(mask, np.minimum(1.0, delta / residuals), 0.0)
+            updated = sumproduct(weights, np.where(mask, temperatures, 0.0)) / (
+                weights.sum(axis=-1)
+            )
+        updated = np.where(settled, estimate, updated)
+        converged = np.allclose(updated, estimate, rtol=0, atol=1e-6, equal_nan=True)
+        estimate = updated
+        if converged:
+            break
+
+    return estimate
+
+
+def robust_statistics(temperatures, mask):
+    """Outlier-resistant averages of every (location, hour) cell over the
+    services axis
+
+    Output:
+        {
+            "trimmed_mean": array (locations, hours),
+            "mad_mean": ...,
+            "huber_mean": ...,
+        }
+    """
+    return {
+        "trimmed_mean": trimmed_mean(temperatures, mask),
+        "mad_mean": mad_filtered_mean(temperatures, mask),
+        "huber_mean": huber_mean(temperatures, mask),
+    }
+
+
+def aggregate_cube(temperatures, mask):
+    """Computes the statistics of every (location, hour) cell over the
+    services axis, in a single vectorized pass
+
+    Input:
+        temperatures
+            Array of shape (locations, hours, services)
+        mask
+            Boolean array of the same shape, False for missing values
+
+    Output:
+        {
+            "average": array (locations, hours),
+            "min": ...,
+            "max": ...,
+            "median": ...,
+            "std": ...,
+            "spread": ...,
+            "count": int array (locations, hours),
+        }
+        Cells without any forecast are NaN
+    """
+    temperatures = np.asarray(temperatures, dtype=ARRAY_DTYPE)
+    mask = np.asarray(mask, dtype=bool)
+    count = mask.sum(axis=-1)
+    empty = count == 0
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        average = np.where(mask, temperatures, 0.0).sum(axis=-1) / count
+        deviations = np.where(mask, temperatures - average[..., None], 0.0)
+        std = np.sqrt((deviations ** 2).sum(axis=-1) / count)
+    minimum = np.where(mask, temperatures, np.inf).min(axis=-1, initial=np.inf)
+    maximum = np.where(mask, temperatures, -np.inf).max(axis=-1, initial=-np.inf)
+    minimum[empty], maximum[empty] = np.nan, np.nan
+
+    return {
+        "average": average,
+        "min": minimum,
+        "max": maximum,
+        "median": masked_median(temperatures, mask),
+        "std": std,
+        "spread": maximum - minimum,
+        "count": count,
+    }
+
+
+def cell_statistics(aggregated, location, hour):
+    """Extracts the statistics of a single (location, hour) cell, rounded
+    for the output
+
+    Output:
+        {
+            "average": Decimal("14.60"),
+            "min": Decimal("14.30"),
+            "max": Decimal("14.80"),
+            "median": Decimal("14.70"),
+            "std": Decimal("0.22"),
+            "spread": Decimal("0.50"),
+            "count": 3
+        }
+    """
+    statistics = {}
+    for name, values in aggregated.items():
+        if name == "count":
+            statistics[name] = int(values[location, hour])
+        else:
+            statistics[name] = to_output(values[location, hour])
+    return statistics
+
+
+def aggregate_hourly_forecasts(
+    hourly_forecasts, service_weights=None, corrections=None
+):
+    """Aggregates several HourlyForecast objects (one per location) covering
+    the same number of hours, in a single pass
+    The temperatures are bias-corrected first when corrections
+    (pyweather.correction.BiasCorrections) are supplied
+
+    Output:
+        (service_names, aggregated)
+            aggregated as returned by aggregate_cube() and
+            robust_statistics(), along with the age-weighted average
+            as "weighted_average"
+    """
+    service_names = []
+    for hourly_forecast in hourly_forecasts:
+        for service_name in hourly_forecast.indexed:
+            if service_name not in service_names:
+                service_names.append(service_name)
+    indexes = [elt.indexed for elt in hourly_forecasts]
+    epoch_hours = [elt.hour_grid.epoch_hours for elt in hourly_forecasts]
+    temperatures, mask = indexes_to_cube(
+        indexes=indexes, epoch_hours=epoch_hours, service_names=service_names,
+    )
+    if corrections is not None:
+        temperatures = corrections.apply(
+            temperatures,
+            location_names=[elt.location_name for elt in hourly_forecasts],
+            epoch_hours=epoch_hours,
+            service_names=service_names,
+            fetched_hours=[elt.fetched_hour for elt in hourly_forecasts],
+        )
+    aggregated = aggregate_cube(temperatures, mask)
+    aggregated.update(robust_statistics(temperatures, mask))
+    aggregated["weighted_average"] = weighted_average(
+        temperatures,
+        mask,
+        age_weights(
+            indexes_to_ages(indexes, service_names), service_names, service_weights
+        ),
+    )
+    return service_names, aggregated
@@ -1,41 +1,168 @@
 import os
 import random
+import sqlite3
+import threading
 import requests
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
-    format_accuweather,
     timestamp_to_utc_datetime,
 )
 from ..utils.api_keys import find_key
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
 from ..utils.browser_profiles import Browser
+from ..utils.paths import cache_path
 from ..exceptions import HttpError, BadResponse, UnexpectedFormat, OutOfRange
 
 
-ENDPOINT = "http://dataservice.accuweather.com/forecasts/v1/hourly/12hour/{location_key}?apikey={api_key}&language=en-gb&details=true&metric=true"
+# Can point to a local stand-in server
+HOST = os.getenv("ACCUWEATHER_HOST", "http://dataservice.accuweather.com")
+ENDPOINT = "{host}/forecasts/v1/hourly/12hour/{location_key}?apikey={api_key}&language=en-gb&details=true&metric=true"
+GEOPOSITION_ENDPOINT = "{host}/locations/v1/cities/geoposition/search?apikey={api_key}&q={latitude},{longitude}"
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Accuweather"
 
+# Location keys resolved from coordinates, kept across runs. Defaults to
+# accuweather_keys.db in the cache directory, see utils.paths.cache_path
+LOCATION_KEYS_CACHE = os.getenv("ACCUWEATHER_KEYS_CACHE")
+# Coordinates closer than this share their location key (about 1 km)
+GEOPOSITION_DECIMALS = 2
 
-def fetch(location_object):
+
+def find_api_key():
     if os.getenv("ACCUWEATHER_API_KEY_ALT"):
         api_keys = ["ACCUWEATHER_API_KEY", "ACCUWEATHER_API_KEY_ALT"]
         api_key_name = random.choice(api_keys)
-        api_key = find_key(api_key_name)
-    else:
-        api_key = find_key("ACCUWEATHER_API_KEY")
+        return find_key(api_key_name)
+    return find_key("ACCUWEATHER_API_KEY")
+
+
+def geoposition_search(latitude, longitude, host=None):
+    """Location key of the Accuweather location covering coordinates,
+    one call of the API quota
+
+    Output:
+        '12481'
+    """
+    browser_profile = Browser()
+    headers = browser_profile.headers
+    r = requests.get(
+        GEOPOSITION_ENDPOINT.format(
+            host=host or HOST,
+            api_key=find_api_key(),
+            latitude=latitude,
+            longitude=longitude,
+        ),
+        headers=headers,
+    )
+    if not r.ok:
+        raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
+    try:
+        return str(r.json()["Key"])
+    except (ValueError, KeyError, TypeError):
+        raise BadResponse(
+            {"service": SERVICE_NAME, "message": "geoposition search > Key"}
+        )
+
+
+class LocationKeyCache:
+    """Persistent cache of the location keys, by rounded coordinates, so that
+    a location only costs a geoposition search the first time
+    """
+
+    def __init__(self, path, decimals=GEOPOSITION_DECIMALS):
+        self.path = str(path)
+        self.decimals = decimals
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS location_keys (
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                location_key TEXT NOT NULL,
+                PRIMARY KEY (latitude, longitude)
+            )
+            """
+        )
+        self._lock = threading.Lock()
+        self._search_lock = threading.Lock()
+
+    def rounded(self, coordinates):
+        return tuple(round(float(elt), self.decimals) for elt in coordinates)
+
+    def get(self, coordinates):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT location_key FROM location_keys"
+                " WHERE latitude = ? AND longitude = ?",
+                self.rounded(coordinates),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, coordinates, location_key):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO location_keys VALUES (?, ?, ?)",
+                (*self.rounded(coordinates), location_key),
+            )
+
+    def resolve(self, coordinates, search=geoposition_search):
+        """Location key of coordinates, searched only when unknown"""
+        location_key = self.get(coordinates)
+        if location_key is not None:
+            return location_key
+        with self._search_lock:
+            # Unless another thread searched for them in the meantime
+            location_key = self.get(coordinates)
+            if location_key is None:
+                # The key stands for the rounded coordinates
+                location_key = search(*self.rounded(coordinates))
+                self.put(coordinates, location_key)
+        return location_key
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_location_keys():
+    """LocationKeyCache at ACCUWEATHER_KEYS_CACHE"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LocationKeyCache(
+                LOCATION_KEYS_CACHE or cache_path("accuweather_keys.db")
+            )
+        return _default_cache
+
+
+def location_key(location_object):
+    """The location's Accuweather key, resolved from its coordinates when
+    it has none
+
+    Output:
+        12481
+    """
+    key = location_object.get("accuweather_location_key")
+    if key is None:
+        key = default_location_keys().resolve(location_object["coordinates"])
+    return key
+
+
+def fetch(location_object):
+    api_key = find_api_key()
     browser_profile = Browser()
     headers = browser_profile.headers
     r = requests.get(
         ENDPOINT.format(
-            location_key=location_object["accuweather_location_key"], api_key=api_key,
+            host=HOST, location_key=location_key(location_object), api_key=api_key,
         ),
         headers=headers,
     )
     if r.ok:
-        return r.json()
+        record_response(__name__, location_object, r.content)
+        return cached(__name__, location_object, "fetch", r.json)
     else:
         raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
 
@@ -61,16 +188,11 @@ def retrieve(location_object, target_local_time):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_accuweather,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["accuweather"]
 
     forecasts = fetch(location_object)
 
@@ -86,7 +208,7 @@ def retrieve(location_object, target_local_time):
                 raise BadResponse(
                     {"service": SERVICE_NAME, "message": "Temperature > Value"}
                 )
-            temperature = round(Decimal(temperature), DECIMAL_PLACES)
+            temperature = to_output(to_number(temperature))
             try:
                 unit = forecast["Temperature"]["Unit"]
             except KeyError:
@@ -144,16 +266,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_accuweather,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["accuweather"]
 
     forecasts = document
 
@@ -169,7 +286,7 @@ def find_in_document(location_object, target_local_time, document):
                 raise BadResponse(
                     {"service": SERVICE_NAME, "message": "Temperature > Value"}
                 )
-            temperature = round(Decimal(temperature), DECIMAL_PLACES)
+            temperature = to_output(to_number(temperature))
             try:
                 unit = forecast["Temperature"]["Unit"]
             except KeyError:
@@ -197,3 +314,41 @@ def find_in_document(location_object, target_local_time, document):
                 "message": f"Could not find a forecast for {target_time_utc}. Latest is {latest_time}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": None,
+                "forecast_issue_time": None,
+            },
+            "temperatures": {
+                440723: Decimal("17.4"),
+                440724: Decimal("16.6"),
+            }
+        }
+    """
+    temperatures = {}
+    for forecast in document:
+        try:
+            time = forecast["EpochDateTime"]
+        except KeyError:
+            raise BadResponse({"service": SERVICE_NAME, "message": "EpochDateTime"})
+        try:
+            temperature = forecast["Temperature"]["Value"]
+            unit = forecast["Temperature"]["Unit"]
+        except KeyError:
+            raise BadResponse(
+                {"service": SERVICE_NAME, "message": "Temperature > Value, Unit"}
+            )
+        if unit != "C":
+            raise UnexpectedFormat({"service": SERVICE_NAME, "message": "unit == C"})
+        temperatures[time // 3600] = to_number(temperature)
+
+    return {
+        "metadata": {"forecast_age_hours": None, "forecast_issue_time": None},
+        "temperatures": temperatures,
+    }
@@ -1,13 +1,14 @@
-import os
 import random
 import requests
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
-    local_string_to_aeris_string,
     parse_aeris,
+    iso_string_to_epoch_hour,
 )
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
+from ..utils.grid import snap, fetch_shared
 from ..utils.browser_profiles import AerisMobileApp
 from ..utils.api_keys import find_key
 from ..exceptions import HttpError, BadResponse, OutOfRange, UnexpectedFormat
@@ -15,7 +16,6 @@ from ..exceptions import HttpError, BadResponse, OutOfRange, UnexpectedFormat
 
 ENDPOINT = "https://api.aerisapi.com/forecasts/{latitude},{longitude}?client_id={client_id}&client_secret={client_secret}&filter=1hr,precise&plimit=24"
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Aeris"
 
 
@@ -24,20 +24,25 @@ def fetch(location_object):
     """
     api_id = find_key("AERIS_CLIENT_ID")
     api_secret = find_key("AERIS_CLIENT_SECRET")
-    latitude, longitude = location_object["coordinates"]
+    latitude, longitude = snap(__name__, location_object["coordinates"])
     browser_profile = AerisMobileApp()
     headers = browser_profile.headers
-    r = requests.get(
-        ENDPOINT.format(
-            latitude=latitude,
-            longitude=longitude,
-            client_id=api_id,
-            client_secret=api_secret,
-            headers=headers,
-        )
+    r = fetch_shared(
+        __name__,
+        location_object,
+        lambda: requests.get(
+            ENDPOINT.format(
+                latitude=latitude,
+                longitude=longitude,
+                client_id=api_id,
+                client_secret=api_secret,
+                headers=headers,
+            )
+        ),
     )
     if r.ok:
-        response = r.json()
+        record_response(__name__, location_object, r.content)
+        response = cached(__name__, location_object, "fetch", r.json)
         if not response:
             response_excerpt = r.text[:100]
             raise BadResponse(
@@ -83,14 +88,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_aeris_string(
+    target_keys = local_string_to_target_keys(
         time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["aeris"]
 
     if not document.get("success"):
         # The response suggested an error
@@ -137,8 +139,8 @@ def find_in_document(location_object, target_local_time, document):
                             "message": "response[0] > periods > maxTempC",
                         }
                     )
-                # Transforming to str then Decimal then rounding
-                temperature = round(Decimal(str(temperature)), DECIMAL_PLACES)
+                # Converting to the numeric backend then rounding
+                temperature = to_output(to_number(temperature))
                 return {
                     "ok": True,
                     "time_utc": target_time_utc,
@@ -155,3 +157,61 @@ def find_in_document(location_object, target_local_time, document):
                 "message": f"Could not find a forecast for {target_time_utc}. Latest is {latest_time}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": None,
+                "forecast_issue_time": None,
+            },
+            "temperatures": {
+                441786: Decimal("15.8"),
+                441787: Decimal("15.7"),
+            }
+        }
+    """
+    if not document.get("success"):
+        # The response suggested an error
+        raise BadResponse(
+            {
+                "service": SERVICE_NAME,
+                "message": f"Response suggested the following error: {document.get('error')}",
+            }
+        )
+    response = document.get("response", [])
+    if not response:
+        raise BadResponse({"service": SERVICE_NAME, "message": "response[0] empty"})
+    forecasts = response[0].get("periods")
+    if not forecasts:
+        raise BadResponse({"service": SERVICE_NAME, "message": "response[0] > periods"})
+
+    temperatures = {}
+    for forecast in forecasts:
+        hour, hour_iso = forecast.get("validTime"), forecast.get("dateTimeISO")
+        if not hour or not hour_iso:
+            raise BadResponse(
+                {
+                    "service": SERVICE_NAME,
+                    "message": "response[0] > periods > validTime, dateTimeISO",
+                }
+            )
+        if hour != hour_iso:
+            # Not a forecast for an individual hour
+            continue
+        temperature = forecast.get(
+            "maxTempC"
+        )  # "maxTempC" and "minTempC" are the same in that context
+        if temperature is None:
+            raise BadResponse(
+                {"service": SERVICE_NAME, "message": "response[0] > periods > maxTempC"}
+            )
+        temperatures[iso_string_to_epoch_hour(hour)] = to_number(temperature)
+
+    return {
+        "metadata": {"forecast_age_hours": None, "forecast_issue_time": None},
+        "temperatures": temperatures,
+    }
@@ -1,22 +1,21 @@
-import os
 import requests
 from bs4 import BeautifulSoup
-from decimal import Decimal
 from decimal import InvalidOperation
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
     parse_bomgovau_raw_footer_string_to_utc_datetime,
-    parse_bomgovau_merge_date_as_dt_and_hour_as_string,
-    parse_bom_gov,
+    bomgovau_cell_to_epoch_hour,
+    epoch_hour_to_utc_string,
     hours_since_utc_datetime,
     decaminutes_since_utc_datetime,
     utc_string_to_utc_datetime,
 )
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
 from ..utils.browser_profiles import Browser
 from ..exceptions import HttpError, BadResponse, UnexpectedFormat, OutOfRange
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Bom.gov.au"
 
 
@@ -26,6 +25,7 @@ def fetch(location_object):
     headers = browser_profile.headers
     r = requests.get(url, headers=headers)
     if r.ok:
+        record_response(__name__, location_object, r.content)
         return r.text
     else:
         raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
@@ -39,14 +39,14 @@ def parse_string_temperature(raw_string):
         "16"
 
     Ouput:
-        Decimal(0)
-        Decimal(16)
+        None
+        Decimal(16) (or 16.0, depending on the numeric backend)
     """
     if raw_string == "–":
         return None
     try:
-        return Decimal(raw_string)
-    except InvalidOperation:
+        return to_number(raw_string)
+    except (InvalidOperation, ValueError):
         raise UnexpectedFormat(
             {
                 "service": SERVICE_NAME,
@@ -65,11 +65,11 @@ def soup_to_forecast_object(soup, timezone):
             "forecasts": 
                 [
                     {
-                        "time_utc": "2020-04-11T11:00:00Z",
+                        "epoch_hour": 440723,
                         "temperature_celcius": 12
                     },
                     {
-                        "time_utc": "2020-04-11T12:00:00Z",
+                        "epoch_hour": 440724,
                         "temperature_celcius": 13
                     }
                 ]
@@ -110,7 +110,6 @@ def soup_to_forecast_object(soup, timezone):
             date_string = day["id"]
         except KeyError:
             raise BadResponse({"service": SERVICE_NAME, "message": "day id=''"})
-        date = parse_bom_gov(date_string, timezone)
         search_string = "temperature"
         tables = day.find_all("table")
         if not tables:
@@ -141,14 +140,12 @@ def soup_to_forecast_object(soup, timezone):
 
         ### Composing a full date string
         ### Prepend with the date
-        time_utc_strings = []
-        for t in times_raw:
-            time = format_standard(
-                parse_bomgovau_merge_date_as_dt_and_hour_as_string(
-                    date_dt=date, hour_string=t, target_timezone=timezone
-                )
+        epoch_hours = [
+            bomgovau_cell_to_epoch_hour(
+                date_attribute=date_string, hour_string=t, target_timezone=timezone
             )
-            time_utc_strings.append(time)
+            for t in times_raw
+        ]
 
         # Listing the temperatures
         #
@@ -182,20 +179,20 @@ def soup_to_forecast_object(soup, timezone):
             )
 
         # Ensuring as many hours as temperatures
-        if len(time_utc_strings) != len(temperature_values):
+        if len(epoch_hours) != len(temperature_values):
             raise BadReponse(
                 {
                     "service": SERVICE_NAME,
-                    "message": f"Date: {date}. Found {len(time_utc_strings)} hours, but {len(temperature_values)} hours",
+                    "message": f"Date: {date_string}. Found {len(epoch_hours)} hours, but {len(temperature_values)} hours",
                 }
             )
 
         # Saving the temperature forecasts
-        for time, temperature in zip(time_utc_strings, temperature_values):
+        for epoch_hour, temperature in zip(epoch_hours, temperature_values):
             if temperature:
                 # Otherwise, the cell is empty because this time has passed
                 forecast["forecasts"].append(
-                    {"time_utc": time, "temperature_celcius": temperature}
+                    {"epoch_hour": epoch_hour, "temperature_celcius": temperature}
                 )
     return forecast
 
@@ -221,11 +218,11 @@ def retrieve(location_object, target_local_time):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_epoch_hour = target_keys["epoch_hour"]
 
     html = fetch(location_object)
     soup = BeautifulSoup(html, "lxml")
@@ -246,10 +243,8 @@ def retrieve(location_object, target_local_time):
     # Retrieving the forecasted temperature
     forecasts = forecast_object["forecasts"]
     for forecast in forecasts:
-        if forecast["time_utc"] == target_time_utc:
-            temperature = round(
-                Decimal(forecast["temperature_celcius"]), DECIMAL_PLACES
-            )
+        if forecast["epoch_hour"] == target_epoch_hour:
+            temperature = to_output(to_number(forecast["temperature_celcius"]))
 
             return {
                 "ok": True,
@@ -264,7 +259,7 @@ def retrieve(location_object, target_local_time):
         raise OutOfRange(
             {
                 "service": SERVICE_NAME,
-                "message": f"Could not find a forecast for {target_time_utc}. Latest is {forecast['time_utc']}.",
+                "message": f"Could not find a forecast for {target_time_utc}. Latest is {epoch_hour_to_utc_string(forecast['epoch_hour'])}.",
             }
         )
 
@@ -274,12 +269,14 @@ def retrieve_document(location_object):
     May perform additional transformation depending on the service
     """
     html = fetch(location_object)
-    soup = BeautifulSoup(html, "lxml")
 
-    # Composing a forecast object
-    forecast_object = soup_to_forecast_object(soup, location_object["timezone"])
+    def parse():
+        soup = BeautifulSoup(html, "lxml")
+        # Composing a forecast object
+        return soup_to_forecast_object(soup, location_object["timezone"])
 
-    return forecast_object
+    # Parsed once per distinct page
+    return cached(__name__, location_object, "document", parse)
 
 
 def find_in_document(location_object, target_local_time, document):
@@ -303,11 +300,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_epoch_hour = target_keys["epoch_hour"]
 
     # Retrieving a forecast object
     forecast_object = document
@@ -325,10 +322,8 @@ def find_in_document(location_object, target_local_time, document):
     # Retrieving the forecasted temperature
     forecasts = forecast_object["forecasts"]
     for forecast in forecasts:
-        if forecast["time_utc"] == target_time_utc:
-            temperature = round(
-                Decimal(forecast["temperature_celcius"]), DECIMAL_PLACES
-            )
+        if forecast["epoch_hour"] == target_epoch_hour:
+            temperature = to_output(to_number(forecast["temperature_celcius"]))
 
             return {
                 "ok": True,
@@ -343,6 +338,37 @@ def find_in_document(location_object, target_local_time, document):
         raise OutOfRange(
             {
                 "service": SERVICE_NAME,
-                "message": f"Could not find a forecast for {target_time_utc}. Latest is {forecast['time_utc']}.",
+                "message": f"Could not find a forecast for {target_time_utc}. Latest is {epoch_hour_to_utc_string(forecast['epoch_hour'])}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied document by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": None,
+                "forecast_age_decaminutes": None,
+                "forecast_issue_time": None,
+            },
+            "temperatures": {
+                440723: Decimal("12"),
+                440724: Decimal("13"),
+            }
+        }
+    """
+    temperatures = {
+        forecast["epoch_hour"]: to_number(forecast["temperature_celcius"])
+        for forecast in document["forecasts"]
+    }
+
+    return {
+        "metadata": {
+            "forecast_age_hours": None,  # The issue time appears incorrect
+            "forecast_age_decaminutes": None,
+            "forecast_issue_time": None,  # The issue time appears incorrect
+        },
+        "temperatures": temperatures,
+    }
@@ -1,24 +1,24 @@
-import os
 import requests
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
     gwc_next_24h_start_end,
     format_gwc_url_dates,
-    local_string_to_gwc_string_search,
     parse_gwc,
     normalize_gwc,
+    gwc_string_to_epoch_hour,
 )
 from ..utils.conversions import farenheit_to_celcius
 from ..utils.api_keys import find_key
+from ..utils.numeric import to_output
+from ..utils.responses import record_response, cached
+from ..utils.grid import snap, fetch_shared
 from ..utils.browser_profiles import Browser
 from ..exceptions import HttpError, BadResponse, UnexpectedFormat, OutOfRange
 
 
 ENDPOINT = "https://service.globalweathercorp.com/webservices/resources/v2/weatherdata/{latitude}/{longitude}/{start_date}-{end_date}timeinterval=%7B1%7D?gwctoken={api_key}"
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "GWC"
 
 
@@ -26,21 +26,27 @@ def fetch(location_object, start_date, end_date):
     """
     """
     api_key = find_key("GWC_API_KEY")
-    latitude, longitude = location_object["coordinates"]
+    latitude, longitude = snap(__name__, location_object["coordinates"])
     browser_profile = Browser()
     headers = browser_profile.headers
-    r = requests.get(
-        ENDPOINT.format(
-            latitude=latitude,
-            longitude=longitude,
-            api_key=api_key,
-            start_date=start_date,
-            end_date=end_date,
+    r = fetch_shared(
+        __name__,
+        location_object,
+        lambda: requests.get(
+            ENDPOINT.format(
+                latitude=latitude,
+                longitude=longitude,
+                api_key=api_key,
+                start_date=start_date,
+                end_date=end_date,
+            ),
+            headers=headers,
         ),
-        headers=headers,
+        part=f"{start_date}-{end_date}",
     )
     if r.ok:
-        return r.json()
+        record_response(__name__, location_object, r.content)
+        return cached(__name__, location_object, "fetch", r.json)
     else:
         raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
 
@@ -88,14 +94,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_gwc_string_search(
+    target_keys = local_string_to_target_keys(
         time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["gwc"]
 
     forecasts = document.get("times", [])
     for forecast in forecasts:
@@ -127,8 +130,7 @@ def find_in_document(location_object, target_local_time, document):
                                 "message": "times > points > value",
                             }
                         )
-                    temperature = farenheit_to_celcius(temperature)
-                    temperature = round(Decimal(temperature), DECIMAL_PLACES)
+                    temperature = to_output(farenheit_to_celcius(temperature))
                     return {
                         "ok": True,
                         "time_utc": target_time_utc,
@@ -155,3 +157,42 @@ def find_in_document(location_object, target_local_time, document):
                 "message": f"Could not find a forecast for {target_time_utc}. Latest is {latest_time}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": None,
+                "forecast_issue_time": None,
+            },
+            "temperatures": {
+                441446: Decimal("7.22"),
+                441447: Decimal("6.72"),
+            }
+        }
+    """
+    temperatures = {}
+    for forecast in document.get("times", []):
+        hour = forecast.get("validDate")
+        if not hour:
+            raise BadResponse({"service": SERVICE_NAME, "message": "times > validDate"})
+        for measurement in forecast.get("points") or []:
+            if measurement.get("dataType") == "temp":
+                temperature = measurement.get("value")
+                if not temperature:
+                    raise BadResponse(
+                        {"service": SERVICE_NAME, "message": "times > points > value"}
+                    )
+                epoch_hour = gwc_string_to_epoch_hour(
+                    hour, timezone=location_object["timezone"]
+                )
+                temperatures[epoch_hour] = farenheit_to_celcius(temperature)
+                break
+
+    return {
+        "metadata": {"forecast_age_hours": None, "forecast_issue_time": None},
+        "temperatures": temperatures,
+    }
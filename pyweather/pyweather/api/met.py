@@ -1,21 +1,21 @@
-import os
 import requests
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
-    format_met,
     hours_since_utc_datetime,
     decaminutes_since_utc_datetime,
     utc_string_to_utc_datetime,
+    iso_string_to_epoch_hour,
 )
 from ..utils.api_keys import find_key
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
+from ..utils.grid import snap, fetch_shared
 from ..utils.browser_profiles import Browser
 from ..exceptions import HttpError, BadResponse, OutOfRange
 
 ENDPOINT = "https://api-metoffice.apiconnect.ibmcloud.com/metoffice/production/v0/forecasts/point/hourly?excludeParameterMetadata=123&includeLocationName=true&latitude={latitude}&longitude={longitude}"
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Met"
 
 
@@ -25,16 +25,21 @@ def fetch(location_object):
         find_key("MET_CLIENT_SECRET"),
         find_key("MET_CLIENT_ID"),
     )
-    latitude, longitude = location_object["coordinates"]
+    latitude, longitude = snap(__name__, location_object["coordinates"])
     browser_profile = Browser()
     headers = browser_profile.headers
     headers["X-IBM-Client-Secret"] = api_client_secret
     headers["X-IBM-Client-Id"] = api_client_id
-    r = requests.get(
-        ENDPOINT.format(latitude=latitude, longitude=longitude), headers=headers,
+    r = fetch_shared(
+        __name__,
+        location_object,
+        lambda: requests.get(
+            ENDPOINT.format(latitude=latitude, longitude=longitude), headers=headers,
+        ),
     )
     if r.ok:
-        return r.json()
+        record_response(__name__, location_object, r.content)
+        return cached(__name__, location_object, "fetch", r.json)
     else:
         raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
 
@@ -60,16 +65,11 @@ def retrieve(location_object, target_local_time):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_met,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["met"]
 
     response = fetch(location_object)
 
@@ -107,7 +107,7 @@ def retrieve(location_object, target_local_time):
                 raise BadResponse(
                     {"service": SERVICE_NAME, "message": "screenTemperature"}
                 )
-            temperature = round(Decimal(str(temperature)), DECIMAL_PLACES)
+            temperature = to_output(to_number(temperature))
 
             issue_time_formatted = format_standard(
                 utc_string_to_utc_datetime(issue_time)
@@ -159,16 +159,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_met,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["met"]
 
     response = document
 
@@ -206,7 +201,7 @@ def find_in_document(location_object, target_local_time, document):
                 raise BadResponse(
                     {"service": SERVICE_NAME, "message": "screenTemperature"}
                 )
-            temperature = round(Decimal(str(temperature)), DECIMAL_PLACES)
+            temperature = to_output(to_number(temperature))
 
             issue_time_formatted = format_standard(
                 utc_string_to_utc_datetime(issue_time)
@@ -228,3 +223,52 @@ def find_in_document(location_object, target_local_time, document):
                 "message": f"Could not find a forecast for {target_time_utc}. Latest is {latest_time}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": 1,
+                "forecast_age_decaminutes": 8.3,
+                "forecast_issue_time": "2020-04-11T09:00:00Z",
+            },
+            "temperatures": {
+                440721: Decimal("17.81"),
+                440722: Decimal("17.11"),
+            }
+        }
+    """
+    try:
+        properties = document["features"][0]["properties"]
+        issue_time = properties["modelRunDate"]
+        forecasts = properties["timeSeries"]
+    except KeyError:
+        raise BadResponse(
+            {
+                "service": SERVICE_NAME,
+                "message": "features > properties > modelRunDate, timeSeries",
+            }
+        )
+    issue_datetime = utc_string_to_utc_datetime(issue_time)
+
+    temperatures = {}
+    for forecast in forecasts:
+        try:
+            time, temperature = forecast["time"], forecast["screenTemperature"]
+        except KeyError:
+            raise BadResponse(
+                {"service": SERVICE_NAME, "message": "time, screenTemperature"}
+            )
+        temperatures[iso_string_to_epoch_hour(time)] = to_number(temperature)
+
+    return {
+        "metadata": {
+            "forecast_age_hours": hours_since_utc_datetime(issue_datetime),
+            "forecast_age_decaminutes": decaminutes_since_utc_datetime(issue_datetime),
+            "forecast_issue_time": format_standard(issue_datetime),
+        },
+        "temperatures": temperatures,
+    }
@@ -1,22 +1,23 @@
 import os
 import random
 import requests
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
+    local_string_to_target_keys,
     format_standard,
-    local_string_to_weathercom_string,
     parse_weathercom,
+    iso_string_to_epoch_hour,
 )
 from ..utils.conversions import farenheit_to_celcius, celcius_to_farenheit
 from ..utils.api_keys import find_key
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
+from ..utils.grid import snap, fetch_shared
 from ..utils.browser_profiles import Browser
 from ..exceptions import HttpError, BadResponse, OutOfRange, UnexpectedFormat
 
 
 ENDPOINT = "https://api.weather.com/v2/turbo/vt1hourlyForecast?apiKey={api_key}&format=json&geocode={latitude}%2C{longitude}&language=en-US&units={units}"
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Weather.com"
 
 
@@ -33,17 +34,23 @@ def fetch(location_object, units="m"):
         api_key = find_key(api_key_name)
     else:
         api_key = find_key("WEATHERCOM_API_KEY")
-    latitude, longitude = location_object["coordinates"]
+    latitude, longitude = snap(__name__, location_object["coordinates"])
     browser_profile = Browser()
     headers = browser_profile.headers
-    r = requests.get(
-        ENDPOINT.format(
-            latitude=latitude, longitude=longitude, api_key=api_key, units=units
+    r = fetch_shared(
+        __name__,
+        location_object,
+        lambda: requests.get(
+            ENDPOINT.format(
+                latitude=latitude, longitude=longitude, api_key=api_key, units=units
+            ),
+            headers=headers,
         ),
-        headers=headers,
+        part=units,
     )
     if r.ok:
-        response = r.json()
+        record_response(__name__, location_object, r.content, part=units)
+        response = cached(__name__, location_object, f"fetch-{units}", r.json)
         if not response:
             response_excerpt = r.text[:100]
             raise BadResponse(
@@ -74,7 +81,19 @@ def retrieve_document(location_object):
     """
     doc_farenheit = fetch(location_object, units="e")
     doc_celcius = fetch(location_object, units="m")
+    # Averaged once per distinct pair of responses
+    return cached(
+        __name__,
+        location_object,
+        "document",
+        lambda: average_documents(doc_farenheit, doc_celcius),
+    )
+
 
+def average_documents(doc_farenheit, doc_celcius):
+    """Averages the temperatures of both documents, in celcius
+    Returns a copy of doc_celcius, the fetched documents being left as is
+    """
     temperatures = {}
     temperatures["farenheit"] = doc_farenheit.get("vt1hourlyForecast", {}).get(
         "temperature"
@@ -89,7 +108,7 @@ def retrieve_document(location_object):
 
     # Converting all to decimals
     for u in ["farenheit", "celcius"]:
-        temperatures[u] = [Decimal(str(elt)) for elt in temperatures[u]]
+        temperatures[u] = [to_number(elt) for elt in temperatures[u]]
     # 1) Converting celcius to Farenheits
     temperatures["celcius"] = [
         celcius_to_farenheit(elt) for elt in temperatures["celcius"]
@@ -105,9 +124,13 @@ def retrieve_document(location_object):
     # 4) Back to celcius
     celcius_average = [farenheit_to_celcius(elt) for elt in farenheit_averaged]
 
-    doc_celcius["vt1hourlyForecast"]["temperature"] = celcius_average
-
-    return doc_celcius
+    return {
+        **doc_celcius,
+        "vt1hourlyForecast": {
+            **doc_celcius["vt1hourlyForecast"],
+            "temperature": celcius_average,
+        },
+    }
 
 
 def find_in_document(location_object, target_local_time, document):
@@ -131,14 +154,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_weathercom_string(
+    target_keys = local_string_to_target_keys(
         time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["weathercom"]
 
     forecasts = document.get("vt1hourlyForecast", {})
     hours_local, temperatures = (
@@ -163,7 +183,7 @@ def find_in_document(location_object, target_local_time, document):
 
     for hour, temperature in zip(hours_local, temperatures):
         if hour == target_time_formatted:
-            temperature = round(Decimal(temperature), DECIMAL_PLACES)
+            temperature = to_output(to_number(temperature))
             return {
                 "ok": True,
                 "time_utc": target_time_utc,
@@ -180,3 +200,48 @@ def find_in_document(location_object, target_local_time, document):
                 "message": f"Could not find a forecast for {target_time_utc}. Latest is {latest_time}.",
             }
         )
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": None,
+                "forecast_issue_time": None,
+            },
+            "temperatures": {
+                441329: Decimal("15"),
+                441330: Decimal("15"),
+            }
+        }
+    """
+    forecasts = document.get("vt1hourlyForecast", {})
+    hours_local, temperatures = (
+        forecasts.get("processTime"),
+        forecasts.get("temperature"),
+    )
+    if not hours_local:
+        raise BadResponse(
+            {"service": SERVICE_NAME, "message": "vt1hourlyForecast > processTime"}
+        )
+    if not temperatures:
+        raise BadResponse(
+            {"service": SERVICE_NAME, "message": "vt1hourlyForecast > temperatures"}
+        )
+    if len(hours_local) != len(temperatures):
+        raise UnexpectedFormat(
+            {
+                "service": SERVICE_NAME,
+                "message": "Different number of hours and temperatures",
+            }
+        )
+
+    return {
+        "metadata": {"forecast_age_hours": None, "forecast_issue_time": None},
+        "temperatures": {
+            iso_string_to_epoch_hour(hour): to_number(temperature)
+            for hour, temperature in zip(hours_local, temperatures)
+        },
+    }
@@ -1,15 +1,15 @@
-import os
 import requests
 from bs4 import BeautifulSoup
-from decimal import Decimal
 from ..utils.time import (
-    local_string_to_utc_string,
-    format_standard,
-    format_yrno,
+    local_string_to_target_keys,
     utc_string_to_utc_datetime,
     hours_since_utc_datetime,
     decaminutes_since_utc_datetime,
+    iso_string_to_epoch_hour,
 )
+from ..utils.numeric import to_number, to_output
+from ..utils.responses import record_response, cached
+from ..utils.grid import snap, fetch_shared
 from ..utils.browser_profiles import Browser
 from ..exceptions import HttpError, BadResponse
 
@@ -17,18 +17,22 @@ ENDPOINT = (
     "https://api.met.no/weatherapi/locationforecast/1.9/?lat={latitude}&lon={longitude}"
 )
 
-DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
 SERVICE_NAME = "Yr.no"
 
 
 def fetch(location_object):
-    latitude, longitude = location_object["coordinates"]
+    latitude, longitude = snap(__name__, location_object["coordinates"])
     browser_profile = Browser()
     headers = browser_profile.headers
-    r = requests.get(
-        ENDPOINT.format(latitude=latitude, longitude=longitude), headers=headers
+    r = fetch_shared(
+        __name__,
+        location_object,
+        lambda: requests.get(
+            ENDPOINT.format(latitude=latitude, longitude=longitude), headers=headers
+        ),
     )
     if r.ok:
+        record_response(__name__, location_object, r.content)
         return r.text
     else:
         raise HttpError({"service": SERVICE_NAME, "response": r.status_code})
@@ -55,16 +59,11 @@ def retrieve(location_object, target_local_time):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_yrno,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["yrno"]
 
     xml = fetch(location_object)
     soup = BeautifulSoup(xml, "lxml")
@@ -112,7 +111,7 @@ def retrieve(location_object, target_local_time):
         BadResponse({"service": SERVICE_NAME, "message": "temperature/value"})
     if not temperature:
         BadResponse({"service": SERVICE_NAME, "message": "temperature id=TTT"})
-    temperature = round(Decimal(temperature), DECIMAL_PLACES)
+    temperature = to_output(to_number(temperature))
 
     if temperature:
         return {
@@ -132,8 +131,10 @@ def retrieve_document(location_object):
     May perform additional transformation depending on the service
     """
     xml = fetch(location_object)
-    soup = BeautifulSoup(xml, "lxml")
-    return soup
+    # Parsed once per distinct response
+    return cached(
+        __name__, location_object, "document", lambda: BeautifulSoup(xml, "lxml")
+    )
 
 
 def find_in_document(location_object, target_local_time, document):
@@ -157,16 +158,11 @@ def find_in_document(location_object, target_local_time, document):
             "temperature_celcius": ""
         }
     """
-    target_time_utc = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_standard,
-    )
-    target_time_formatted = local_string_to_utc_string(
-        time_local=target_local_time,
-        timezone=location_object["timezone"],
-        format_func=format_yrno,
+    target_keys = local_string_to_target_keys(
+        time_local=target_local_time, timezone=location_object["timezone"]
     )
+    target_time_utc = target_keys["standard"]
+    target_time_formatted = target_keys["yrno"]
 
     xml = document
 
@@ -213,7 +209,7 @@ def find_in_document(location_object, target_local_time, document):
         BadResponse({"service": SERVICE_NAME, "message": "temperature/value"})
     if not temperature:
         BadResponse({"service": SERVICE_NAME, "message": "temperature id=TTT"})
-    temperature = round(Decimal(temperature), DECIMAL_PLACES)
+    temperature = to_output(to_number(temperature))
 
     if temperature:
         return {
@@ -226,3 +222,62 @@ def find_in_document(location_object, target_local_time, document):
         }
     else:
         return {"ok": False}
+
+
+def index_document(location_object, document):
+    """Indexes all the forecasts of the supplied API response by epoch hour
+
+    Output:
+        {
+            "metadata": {
+                "forecast_age_hours": 3,
+                "forecast_age_decaminutes": 19.6,
+                "forecast_issue_time": "2020-04-11T13:23:15Z",
+                "forecast_next_issue_time": "2020-04-11T19:28:22Z",
+            },
+            "temperatures": {
+                440729: Decimal("12.4"),
+                440730: Decimal("12.1"),
+            }
+        }
+    """
+    metadata = document.find("model", attrs={"name": "met_public_forecast"})
+    if not metadata:
+        raise BadResponse(
+            {"service": SERVICE_NAME, "message": "model name=met_public_forecast"}
+        )
+    try:
+        issue_time = metadata["runended"]
+    except KeyError:
+        raise BadResponse({"service": SERVICE_NAME, "message": "model/runended"})
+    issue_datetime = utc_string_to_utc_datetime(issue_time)
+
+    pointdata = document.find("product", attrs={"class": "pointData"})
+    if not pointdata:
+        raise BadResponse(
+            {"service": SERVICE_NAME, "message": "product class=pointData"}
+        )
+
+    temperatures = {}
+    for forecast in pointdata.find_all(name="time", attrs={"datatype": "forecast"}):
+        if forecast.get("from") != forecast.get("to"):
+            # Periods carry precipitations and min/max temperatures only
+            continue
+        temperature = forecast.find(
+            name="temperature", attrs={"id": "TTT", "unit": "celsius"}
+        )
+        if not temperature or not temperature.get("value"):
+            raise BadResponse({"service": SERVICE_NAME, "message": "temperature id=TTT"})
+        temperatures[iso_string_to_epoch_hour(forecast["from"])] = to_number(
+            temperature["value"]
+        )
+
+    return {
+        "metadata": {
+            "forecast_age_hours": hours_since_utc_datetime(issue_datetime),
+            "forecast_age_decaminutes": decaminutes_since_utc_datetime(issue_datetime),
+            "forecast_issue_time": issue_time,
+            "forecast_next_issue_time": metadata.get("nextrun"),
+        },
+        "temperatures": temperatures,
+    }
@@ -0,0 +1,347 @@
+import os
+import sqlite3
+import threading
+import pendulum
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .exceptions import MissingDependency
+from .utils.responses import content_hash
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_LEVEL = 19
+DICTIONARY_SIZE = 112640  # Bytes
+TRAINING_SAMPLES = 64
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    service TEXT NOT NULL,
+    location TEXT NOT NULL,
+    part TEXT NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_service_location_fetched_at
+    ON responses (service, location, part, fetched_at, digest);
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    service TEXT NOT NULL,
+    dictionary_id INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_by_service_dictionary
+    ON objects (service, dictionary_id);
+CREATE TABLE IF NOT EXISTS dictionaries (
+    service TEXT PRIMARY KEY,
+    dictionary_id INTEGER NOT NULL
+);
+"""
+
+
+def location_key(location_object):
+    """
+    Input:
+        {"coordinates": (-33.86, 151.21), ...}
+
+    Output:
+        '-33.86,151.21'
+    """
+    latitude, longitude = location_object["coordinates"]
+    return f"{latitude},{longitude}"
+
+
+class ResponseArchive:
+    """Archive of the raw responses of the services, for audit and replay
+
+        <path>/index.db
+        <path>/dictionaries/<dictionary id>.zdict
+        <path>/objects/<digest[:2]>/<digest>.zst
+
+    Every response is compressed on its own, with the zstd dictionary of its
+    service once one has been trained, and stored under its content hash:
+    a response seen before costs an index row only, and any response can be
+    read back without decompressing others
+
+    The fetches archive their responses with submit(), which compresses and
+    writes them in a background thread. The dictionaries are trained in
+    another one once a service has `training_samples` responses
+    """
+
+    def __init__(
+        self,
+        path,
+        level=COMPRESSION_LEVEL,
+        dictionary_size=DICTIONARY_SIZE,
+        training_samples=TRAINING_SAMPLES,
+    ):
+        if zstandard is None:
+            raise MissingDependency(
+                {"module": "zstandard", "message": "pip install zstandard"}
+            )
+        self.path = Path(path)
+        (self.path / "dictionaries").mkdir(parents=True, exist_ok=True)
+        (self.path / "objects").mkdir(exist_ok=True)
+        self.level = level
+        self.dictionary_size = dictionary_size
+        self.training_samples = training_samples
+        self.connection = sqlite3.connect(
+            str(self.path / "index.db"), check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._dictionaries = {}
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._trainer = ThreadPoolExecutor(max_workers=1)
+        self._training = set()  # Services queued for training
+
+    def _object_path(self, digest):
+        return self.path / "objects" / digest[:2] / f"{digest}.zst"
+
+    def _dictionary(self, dictionary_id):
+        if dictionary_id not in self._dictionaries:
+            data = (self.path / "dictionaries" / f"{dictionary_id}.zdict").read_bytes()
+            self._dictionaries[dictionary_id] = zstandard.ZstdCompressionDict(data)
+        return self._dictionaries[dictionary_id]
+
+    def _service_dictionary_id(self, service_name):
+        row = self.connection.execute(
+            "SELECT dictionary_id FROM dictionaries WHERE service = ?", (service_name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _compress(self, content, dictionary_id):
+        if dictionary_id:
+            compressor = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dictionary(dictionary_id)
+            )
+        else:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor.compress(content)
+
+    def _decompress(self, data, dictionary_id):
+        if dictionary_id:
+            decompressor = zstandard.ZstdDecompressor(
+                dict_data=self._dictionary(dictionary_id)
+            )
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+    def put(self, service_name, location_object, content, part="", fetched_at=None):
+        """Archives a raw response, returns its content hash
+
+        Input:
+            service_name
+                'pyweather.api.met'
+            location_object
+                {"coordinates": (-33.86, 151.21), ...}
+            content
+                Raw body of the response
+            part (optional)
+                Distinguishes the responses of services calling several endpoints
+            fetched_at (optional)
+                Timestamp of the fetch, defaults to now
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        if fetched_at is None:
+            fetched_at = pendulum.now().int_timestamp
+        digest = content_hash(content)
+        dictionary_id = None
+
+        with self._lock, self.connection:
+            known = self.connection.execute(
+                "SELECT 1 FROM objects WHERE digest = ?", (digest,)
+            ).fetchone()
+            if not known:
+                dictionary_id = self._service_dictionary_id(service_name)
+                data = self._compress(content, dictionary_id)
+                object_path = self._object_path(digest)
+                object_path.parent.mkdir(exist_ok=True)
+                temporary = object_path.with_suffix(".tmp")
+                temporary.write_bytes(data)
+                temporary.replace(object_path)
+                self.connection.execute(
+                    "INSERT INTO objects VALUES (?, ?, ?, ?, ?)",
+                    (digest, service_name, dictionary_id, len(content), len(data)),
+                )
+            self.connection.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?)",
+                (service_name, location_key(location_object), part, fetched_at, digest),
+            )
+
+        if dictionary_id == 0:
+            self._train_when_ready(service_name)
+        return digest
+
+    def submit(self, service_name, location_object, content, part=""):
+        """Same as put(), in the background, so that the caller does not wait
+        for the compression. Errors are printed
+        """
+        fetched_at = pendulum.now().int_timestamp
+        self._writer.submit(
+            self._put_in_background,
+            service_name,
+            location_object,
+            content,
+            part,
+            fetched_at,
+        )
+
+    def _put_in_background(
+        self, service_name, location_object, content, part, fetched_at
+    ):
+        try:
+            self.put(
+                service_name, location_object, content, part=part, fetched_at=fetched_at
+            )
+        except Exception as e:
+            print(f"Archive ({service_name}):")
+            print(e)
+
+    def read(self, digest):
+        """Returns the raw response of a content hash"""
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT dictionary_id FROM objects WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        return self._decompress(self._object_path(digest).read_bytes(), row[0])
+
+    def get(self, service_name, location_object, at=None, part=""):
+        """Returns the last raw response fetched at or before `at` (timestamp),
+        None if there is none
+
+        Input:
+            'pyweather.api.met', {"coordinates": (-33.86, 151.21), ...}, 1586600000
+        """
+        if at is None:
+            at = pendulum.now().int_timestamp
+        with self._lock:
+            row = self.connection.execute(
+                """
+                SELECT digest FROM responses
+                WHERE service = ? AND location = ? AND part = ? AND fetched_at <= ?
+                ORDER BY fetched_at DESC
+                LIMIT 1
+                """,
+                (service_name, location_key(location_object), part, at),
+            ).fetchone()
+        return self.read(row[0]) if row else None
+
+    def fetches(self, service_name, location_object, start=None, end=None, part=""):
+        """Lists the (fetched_at, digest) of a service and location within
+        [start, end] (timestamps)
+        """
+        with self._lock:
+            return self.connection.execute(
+                """
+                SELECT fetched_at, digest FROM responses
+                WHERE service = ? AND location = ? AND part = ?
+                    AND fetched_at BETWEEN ? AND ?
+                ORDER BY fetched_at
+                """,
+                (
+                    service_name,
+                    location_key(location_object),
+                    part,
+                    start if start is not None else 0,
+                    end if end is not None else 2 ** 62,
+                ),
+            ).fetchall()
+
+    def _train_when_ready(self, service_name):
+        """Queues the training of a service's dictionary once it has enough
+        responses
+        """
+        with self._lock:
+            if service_name in self._training:
+                return
+            count = self.connection.execute(
+                "SELECT COUNT(*) FROM objects WHERE service = ? AND dictionary_id = 0",
+                (service_name,),
+            ).fetchone()[0]
+            if count < self.training_samples:
+                return
+            self._training.add(service_name)
+        self._trainer.submit(self._train_in_background, service_name)
+
+    def _train_in_background(self, service_name):
+        try:
+            self.train(service_name)
+        except Exception as e:
+            print(f"Dictionary training ({service_name}):")
+            print(e)
+        finally:
+            with self._lock:
+                self._training.discard(service_name)
+
+    def train(self, service_name):
+        """Trains the zstd dictionary of a service on its archived responses
+        The responses archived from then on are compressed with it
+        Returns the dictionary id
+        """
+        with self._lock:
+            digests = [
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT digest FROM objects WHERE service = ?", (service_name,)
+                )
+            ]
+        # Archiving goes on while the dictionary is trained
+        samples = [self.read(digest) for digest in digests]
+        dictionary = zstandard.train_dictionary(self.dictionary_size, samples)
+        dictionary_id = dictionary.dict_id()
+        (self.path / "dictionaries" / f"{dictionary_id}.zdict").write_bytes(
+            dictionary.as_bytes()
+        )
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dictionaries VALUES (?, ?)",
+                (service_name, dictionary_id),
+            )
+        return dictionary_id
+
+    def statistics(self):
+        """Number of objects, raw and compressed sizes of every service"""
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT service, COUNT(*), SUM(size), SUM(compressed_size)
+                FROM objects GROUP BY service
+                """
+            ).fetchall()
+        return {
+            service: {"objects": count, "size": size, "compressed_size": compressed}
+            for service, count, size, compressed in rows
+        }
+
+    def close(self):
+        """Waits for the pending writes and the dictionaries being trained,
+        then closes the index
+        """
+        self._writer.shutdown(wait=True)
+        self._trainer.shutdown(wait=True)
+        self.connection.close()
+
+
+_default_archive = None
+_default_archive_lock = threading.Lock()
+
+
+def default_archive():
+    """Archive set with the RESPONSE_ARCHIVE environment variable, if any"""
+    global _default_archive
+    path = os.getenv("RESPONSE_ARCHIVE")
+    if not path:
+        return None
+    with _default_archive_lock:
+        if _default_archive is None or _default_archive[0] != path:
+            _default_archive = (path, ResponseArchive(path))
+        return _default_archive[1]
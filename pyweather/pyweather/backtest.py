@@ -0,0 +1,208 @@
+import csv
+import numpy as np
+
+# Lead time buckets, in hours: [0, 6), [6, 12), ... [168, inf)
+LEAD_BUCKETS = [0, 6, 12, 24, 48, 72, 120, 168]
+
+METRICS = ["count", "mae", "rmse", "bias", "skill"]
+
+
+def load_reference(path, location_names):
+    """Loads observed temperatures from a CSV file
+
+    Input:
+        path
+            CSV file with a header, e.g.
+                location,time_utc,temperature_celcius
+                SYDNEY,2020-04-11T09:00:00Z,17.4
+            An epoch_hour column may be supplied instead of time_utc
+        location_names
+            Locations codes, as in HistoryStore.catalog["locations"]
+
+    Output:
+        {
+            "location": array([0, 0, 1]),  # Codes, -1 for unknown locations
+            "target_hour": array([440721, 440722, 440721]),
+            "temperature": array([17.4, 17.1, 12.9])
+        }
+    """
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    codes = {name: code for code, name in enumerate(location_names)}
+
+    location = np.fromiter(
+        (codes.get(row["location"], -1) for row in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    if rows and "epoch_hour" in rows[0]:
+        target_hour = np.array([row["epoch_hour"] for row in rows], dtype=np.int64)
+    else:
+        times = [row["time_utc"].rstrip("Z") for row in rows]
+        target_hour = np.array(times, dtype="datetime64[h]").astype(np.int64)
+    temperature = np.array(
+        [row["temperature_celcius"] for row in rows], dtype=np.float64
+    )
+    return {
+        "location": location,
+        "target_hour": target_hour,
+        "temperature": temperature,
+    }
+
+
+def _keys(location, hour):
+    # Epoch hours fit in 32 bits for the next few hundred thousand years
+    return np.asarray(location, dtype=np.int64) << 32 | np.asarray(hour, dtype=np.int64)
+
+
+def lookup_reference(reference, location, hour):
+    """Observed temperatures of every (location, hour), NaN when unknown"""
+    keys = _keys(reference["location"], reference["target_hour"])
+    order = np.argsort(keys, kind="stable")
+    keys, temperatures = keys[order], reference["temperature"][order]
+
+    wanted = _keys(location, hour)
+    positions = np.searchsorted(keys, wanted).clip(0, max(len(keys) - 1, 0))
+    observed = np.full(len(wanted), np.nan)
+    if len(keys):
+        found = keys[positions] == wanted
+        observed[found] = temperatures[positions[found]]
+    return observed
+
+
+def lead_time_hours(rows):
+    """Hours between the fetch of every forecast and its target hour"""
+    return rows["target_hour"] - rows["fetched_at"] // 3600
+
+
+def backtest(rows, reference, services_count, locations_count, lead_buckets=None):
+    """Scores the forecasts against the observed temperatures, by
+    service x location x lead time bucket, in a few vectorized passes
+
+    Input:
+        rows
+            Array of HISTORY_DTYPE rows, as returned by HistoryStore.load()
+        reference
+            As returned by load_reference()
+        services_count, locations_count
+            Sizes of the HistoryStore catalog
+        lead_buckets (optional)
+            Lower bounds of the lead time buckets, in hours
+
+    Output:
+        {
+            "count": array of shape (services, locations, buckets),
+            "mae": ...,
+            "rmse": ...,
+            "bias": ...,  # Forecast - observed, positive when running warm
+            "skill": ...,  # 1 - MSE / MSE of persistence, NaN when unknown
+            "lead_buckets": [0, 6, 12, ...]
+        }
+        Cells without any scored forecast hold NaN (count 0)
+    """
+    lead_buckets = np.asarray(LEAD_BUCKETS if lead_buckets is None else lead_buckets)
+    shape = (services_count, locations_count, len(lead_buckets))
+
+    leads = lead_time_hours(rows)
+    observed = lookup_reference(reference, rows["location"], rows["target_hour"])
+    # Persistence: the temperature observed when the forecast was fetched
+    persisted = lookup_reference(
+        reference, rows["location"], rows["fetched_at"] // 3600
+    )
+    scored = ~np.isnan(observed) & (leads >= lead_buckets[0])
+
+    rows, leads = rows[scored], leads[scored]
+    observed, persisted = observed[scored], persisted[scored]
+    errors = rows["temperature"].astype(np.float64) - observed
+    buckets = np.searchsorted(lead_buckets, leads, side="right") - 1
+    cells = np.ravel_multi_index(
+        (rows["service"].astype(np.int64), rows["location"].astype(np.int64), buckets),
+        shape,
+    )
+    size = int(np.prod(shape))
+
+    def total(weights=None):
+        return np.bincount(cells, weights=weights, minlength=size).reshape(shape)
+
+    count = total()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        squared = total(errors ** 2)
+        mae = total(np.abs(errors)) / count
+        rmse = np.sqrt(squared / count)
+        bias = total(errors) / count
+
+        # Skill over the forecasts whose persistence is known
+        known = ~np.isnan(persisted)
+        squared_known = np.bincount(
+            cells[known], weights=errors[known] ** 2, minlength=size
+        ).reshape(shape)
+        squared_persistence = np.bincount(
+            cells[known],
+            weights=(persisted[known] - observed[known]) ** 2,
+            minlength=size,
+        ).reshape(shape)
+        skill = 1 - squared_known / squared_persistence
+        skill[~np.isfinite(skill)] = np.nan
+
+    return {
+        "count": count.astype(np.int64),
+        "mae": mae,
+        "rmse": rmse,
+        "bias": bias,
+        "skill": skill,
+        "lead_buckets": lead_buckets.tolist(),
+    }
+
+
+def backtest_store(
+    store, reference_path, start_hour=None, end_hour=None, lead_buckets=None
+):
+    """Scores all the forecasts of a HistoryStore targeting [start_hour, end_hour]
+
+    Output:
+        As backtest()
+    """
+    reference = load_reference(reference_path, store.catalog["locations"])
+    return backtest(
+        store.load(start_hour, end_hour),
+        reference,
+        services_count=len(store.catalog["services"]),
+        locations_count=len(store.catalog["locations"]),
+        lead_buckets=lead_buckets,
+    )
+
+
+def backtest_records(scores, service_names, location_names):
+    """Lists the scored cells of backtest()
+
+    Output:
+        [
+            {
+                "service": "pyweather.api.met",
+                "location": "SYDNEY",
+                "lead_hours": "[6, 12)",
+                "count": 124,
+                "mae": 1.21,
+                "rmse": 1.56,
+                "bias": 0.35,
+                "skill": 0.42
+            },
+        ]
+    """
+    lead_buckets = scores["lead_buckets"]
+    labels = [
+        f"[{low}, {high})"
+        for low, high in zip(lead_buckets, lead_buckets[1:] + ["inf"])
+    ]
+    records = []
+    for s, l, b in zip(*np.nonzero(scores["count"])):
+        record = {
+            "service": service_names[s],
+            "location": location_names[l],
+            "lead_hours": labels[b],
+        }
+        for metric in METRICS:
+            value = scores[metric][s, l, b]
+            record[metric] = int(value) if metric == "count" else float(value)
+        records.append(record)
+    return records
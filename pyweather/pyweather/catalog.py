@@ -0,0 +1,230 @@
+"""Location catalogs too large for locations.py, kept on disk as
+memory-mapped NumPy arrays and only materialized record by record
+
+    <path>/records.npy      One fixed-size row per location
+    <path>/strings.npy      UTF-8 names and BOM pages, back to back
+    <path>/by_name.npy      Rows sorted by name
+    <path>/by_id.npy        Rows sorted by id
+    <path>/ids.npy          Sorted ids
+    <path>/timezones.json   Timezone of every code
+"""
+import os
+import csv
+import json
+import threading
+import numpy as np
+from pathlib import Path
+from functools import lru_cache
+from collections.abc import Mapping
+from .locations import LOCATIONS
+
+RECORD_DTYPE = np.dtype(
+    [
+        ("id", np.int64),
+        ("latitude", np.float64),
+        ("longitude", np.float64),
+        ("accuweather_location_key", np.int64),  # -1 when unknown
+        ("timezone", np.uint16),
+        ("name_start", np.uint64),
+        ("name_end", np.uint64),
+        ("bom_start", np.uint64),  # bom_start == bom_end when unknown
+        ("bom_end", np.uint64),
+    ]
+)
+# Location objects kept once materialized
+CACHED_RECORDS = 4096
+
+
+def write_catalog(path, locations, ids=None):
+    """Writes a catalog
+
+    Input:
+        path
+            Directory, created if needed
+        locations
+            {"SYDNEY": {"coordinates": (-33.86, 151.21), ...}}, as in LOCATIONS
+        ids (optional)
+            {"SYDNEY": 1001}, defaults to the position of every location
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    names = list(locations)
+    timezones = sorted({locations[name]["timezone"] for name in names})
+    timezone_codes = {timezone: i for i, timezone in enumerate(timezones)}
+
+    records = np.zeros(len(names), dtype=RECORD_DTYPE)
+    strings = bytearray()
+    for row, name in enumerate(names):
+        location_object = locations[name]
+        record = records[row]
+        record["id"] = ids[name] if ids is not None else row
+        record["latitude"], record["longitude"] = location_object["coordinates"]
+        record["accuweather_location_key"] = location_object.get(
+            "accuweather_location_key", -1
+        )
+        record["timezone"] = timezone_codes[location_object["timezone"]]
+        for field, value in [
+            ("name", name),
+            ("bom", location_object.get("bom.gov.au", "")),
+        ]:
+            record[f"{field}_start"] = len(strings)
+            strings.extend(value.encode("utf-8"))
+            record[f"{field}_end"] = len(strings)
+
+    encoded = [name.encode("utf-8") for name in names]
+    by_name = np.array(
+        sorted(range(len(names)), key=encoded.__getitem__), dtype=np.int64
+    )
+    np.save(path / "records.npy", records)
+    np.save(path / "strings.npy", np.frombuffer(bytes(strings), dtype=np.uint8))
+    np.save(path / "by_name.npy", by_name)
+    by_id = np.argsort(records["id"], kind="stable")
+    np.save(path / "by_id.npy", by_id)
+    np.save(path / "ids.npy", records["id"][by_id])
+    (path / "timezones.json").write_text(json.dumps(timezones))
+
+
+def read_csv_locations(csv_path):
+    """Locations and ids of a CSV file with the columns
+    id,name,latitude,longitude,timezone,bom_url,accuweather_location_key
+    (the last two may be empty)
+
+    Output:
+        ({"SYDNEY": {...}}, {"SYDNEY": 1001})
+    """
+    locations, ids = {}, {}
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f):
+            name = row["name"].strip().upper()
+            location_object = {
+                "coordinates": (float(row["latitude"]), float(row["longitude"])),
+                "timezone": row["timezone"].strip(),
+            }
+            if row.get("bom_url"):
+                location_object["bom.gov.au"] = row["bom_url"].strip()
+            if row.get("accuweather_location_key"):
+                location_object["accuweather_location_key"] = int(
+                    row["accuweather_location_key"]
+                )
+            locations[name] = location_object
+            ids[name] = int(row["id"])
+    return locations, ids
+
+
+class LocationCatalog(Mapping):
+    """Read-only mapping of names to location objects, as LOCATIONS, backed
+    by a memory-mapped catalog. Opening it reads nothing but the timezones;
+    a record is only materialized when it is looked up
+
+    Names are found by binary search over the rows sorted by name, ids over
+    the rows sorted by id
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.records = self._load("records")
+        self.strings = self._load("strings")
+        self.by_name = self._load("by_name")
+        self.by_id = self._load("by_id")
+        self.ids = self._load("ids")
+        self.timezones = json.loads((self.path / "timezones.json").read_text())
+        # Views of the memory-mapped columns, cheaper to index than records
+        self._columns = {name: self.records[name] for name in RECORD_DTYPE.names}
+        self._name_starts = self._columns["name_start"]
+        self._name_ends = self._columns["name_end"]
+        self._blob = memoryview(self.strings) if len(self.strings) else b""
+        self.location_object = lru_cache(maxsize=CACHED_RECORDS)(self._materialize)
+
+    def _load(self, name):
+        # A plain view of the memory map, much faster to index one by one
+        return np.asarray(np.load(self.path / f"{name}.npy", mmap_mode="r"))
+
+    def _string(self, start, end):
+        return bytes(self._blob[int(start) : int(end)]).decode("utf-8")
+
+    def _name_bytes(self, row):
+        start, end = int(self._name_starts[row]), int(self._name_ends[row])
+        return bytes(self._blob[start:end])
+
+    def name(self, row):
+        return self._name_bytes(row).decode("utf-8")
+
+    def _materialize(self, row):
+        record = {name: column[row].item() for name, column in self._columns.items()}
+        location_object = {}
+        if record["accuweather_location_key"] >= 0:
+            location_object["accuweather_location_key"] = record[
+                "accuweather_location_key"
+            ]
+        if record["bom_end"] > record["bom_start"]:
+            location_object["bom.gov.au"] = self._string(
+                record["bom_start"], record["bom_end"]
+            )
+        location_object["coordinates"] = (record["latitude"], record["longitude"])
+        location_object["timezone"] = self.timezones[record["timezone"]]
+        return location_object
+
+    def row(self, name):
+        """Row of a location, None if it is not in the catalog"""
+        target = name.encode("utf-8")
+        low, high = 0, len(self.by_name)
+        while low < high:
+            middle = (low + high) // 2
+            if self._name_bytes(self.by_name[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.by_name):
+            row = int(self.by_name[low])
+            if self._name_bytes(row) == target:
+                return row
+        return None
+
+    def __getitem__(self, name):
+        row = self.row(name)
+        if row is None:
+            raise KeyError(name)
+        return self.location_object(row)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and self.row(name) is not None
+
+    def __iter__(self):
+        for row in range(len(self.records)):
+            yield self.name(row)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_by_id(self, location_id):
+        """(name, location object) of an id, None if it is not in the catalog"""
+        position = int(np.searchsorted(self.ids, location_id))
+        if position == len(self.ids) or self.ids[position] != location_id:
+            return None
+        row = int(self.by_id[position])
+        return self.name(row), self.location_object(row)
+
+    @property
+    def coordinates(self):
+        """Array of shape (locations, 2), (latitude, longitude)"""
+        return np.column_stack(
+            (self.records["latitude"], self.records["longitude"])
+        )
+
+
+_default_locations = None
+_default_locations_lock = threading.Lock()
+
+
+def default_locations():
+    """LocationCatalog at the LOCATION_CATALOG path if set, LOCATIONS
+    otherwise
+    """
+    global _default_locations
+    path = os.getenv("LOCATION_CATALOG")
+    if not path:
+        return LOCATIONS
+    with _default_locations_lock:
+        if _default_locations is None or _default_locations[0] != path:
+            _default_locations = (path, LocationCatalog(path))
+        return _default_locations[1]
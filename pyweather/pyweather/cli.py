@@ -0,0 +1,328 @@
+"""Command-line batch tool
+
+    pyweather forecast --locations SYDNEY,MELBOURNE --hours 48 --format csv
+    pyweather forecast --hours 72 --format parquet -o forecasts.parquet
+    pyweather catalog --input locations.csv -o catalog/
+
+Every location is fetched concurrently and its rows are written as soon as it
+completes, one row per (location, hour)
+"""
+import sys
+import csv
+import json
+import argparse
+import pendulum
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .services import SERVICES
+from .locations import LOCATIONS
+from .catalog import default_locations, read_csv_locations, write_catalog
+from .forecast import HourlyForecast
+from .parallel import ShardedExecutor
+from .aggregation import STATISTICS
+from .exceptions import MissingDependency
+from .utils.numeric import to_output
+from .utils.time import epoch_hour_to_utc_string
+from .utils.settings import service_key
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_SERVICES = "BOM,MET,ACCUWEATHER,YRNO,WEATHERCOM,GWC"
+AGGREGATES = STATISTICS + ["trimmed_mean", "mad_mean", "huber_mean", "weighted_average"]
+
+
+def columns(services):
+    """
+    Output:
+        ["location", "time_local", "time_utc", "average", ..., "MET", "YRNO"]
+    """
+    return (
+        ["location", "time_local", "time_utc"]
+        + AGGREGATES
+        + [service_key(service.__name__) for service in services]
+    )
+
+
+def forecast_rows(
+    location_name, location_object, start, hours, services, indexed=None
+):
+    """Forecasts a location and lays it out as rows
+    `indexed` are the services' indexes, when they were already retrieved
+
+    Output:
+        [
+            {
+                "location": "SYDNEY",
+                "time_local": "2020-04-14T13:00",
+                "time_utc": "2020-04-14T03:00:00Z",
+                "average": Decimal("14.60"),
+                ...
+                "MET": Decimal("14.30"),
+                "YRNO": None
+            },
+        ]
+    """
+    if start is None:
+        start = pendulum.now(location_object["timezone"]).format("YYYY-MM-DDTHH:00")
+    forecast = HourlyForecast(
+        location_object,
+        start,
+        next_n_hours=hours,
+        services=services,
+        name=location_name,
+        indexed=indexed,
+    )
+    aggregated = forecast.aggregated
+    rows = []
+    for time_local, epoch_hour in zip(
+        forecast.local_dates, forecast.hour_grid.epoch_hours
+    ):
+        row = {
+            "location": location_name,
+            "time_local": time_local,
+            "time_utc": epoch_hour_to_utc_string(epoch_hour),
+        }
+        statistics = aggregated[time_local]
+        for name in AGGREGATES:
+            row[name] = statistics.get(name)
+        for service in services:
+            index = forecast.indexed.get(service.__name__)
+            temperature = index["temperatures"].get(epoch_hour) if index else None
+            row[service_key(service.__name__)] = (
+                to_output(temperature) if temperature is not None else None
+            )
+        rows.append(row)
+    return rows
+
+
+def plain(value):
+    """Decimals become floats, for the JSON and Parquet outputs"""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return float(value)
+
+
+class NdjsonWriter:
+    def __init__(self, output, columns):
+        self.output = output
+
+    def write(self, rows):
+        for row in rows:
+            self.output.write(json.dumps({k: plain(v) for k, v in row.items()}))
+            self.output.write("\n")
+        self.output.flush()
+
+    def close(self):
+        pass
+
+
+class CsvWriter:
+    def __init__(self, output, columns):
+        self.output = output
+        self.writer = csv.DictWriter(output, fieldnames=columns)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.output.flush()
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """Writes a row group per location"""
+
+    def __init__(self, output, columns):
+        if pyarrow is None:
+            raise MissingDependency(
+                {"module": "pyarrow", "message": "pip install pyarrow"}
+            )
+        self.columns = columns
+        types = {"location": pyarrow.string(), "time_local": pyarrow.string()}
+        types.update({"time_utc": pyarrow.string(), "count": pyarrow.int64()})
+        self.schema = pyarrow.schema(
+            [(name, types.get(name, pyarrow.float64())) for name in columns]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(output, self.schema)
+
+    def write(self, rows):
+        table = pyarrow.table(
+            {name: [plain(row[name]) for row in rows] for name in self.columns},
+            schema=self.schema,
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"ndjson": NdjsonWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+
+def run_forecast(
+    location_names, start, hours, services, writer, workers=8, locations=LOCATIONS
+):
+    """Forecasts the locations concurrently, writing the rows of every
+    location as soon as it completes
+    At most 2 x `workers` locations are in flight, so memory stays flat
+    """
+    pending = set()
+    names = iter(location_names)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit():
+            for location_name in names:
+                future = executor.submit(
+                    forecast_rows,
+                    location_name,
+                    locations[location_name],
+                    start,
+                    hours,
+                    services,
+                )
+                future.location_name = location_name
+                pending.add(future)
+                if len(pending) >= 2 * workers:
+                    return
+
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                try:
+                    writer.write(future.result())
+                except Exception as e:
+                    print(f"{future.location_name}: {e!r}", file=sys.stderr)
+            submit()
+
+
+def run_forecast_sharded(
+    location_names, start, hours, services, writer, processes, locations=LOCATIONS
+):
+    """Same as run_forecast(), the documents being fetched and parsed by
+    worker processes
+    """
+    selected = {elt: locations[elt] for elt in location_names}
+    with ShardedExecutor(processes) as executor:
+        for location_name, indexed in executor.indexes(selected, services):
+            try:
+                rows = forecast_rows(
+                    location_name,
+                    selected[location_name],
+                    start,
+                    hours,
+                    services,
+                    indexed=indexed,
+                )
+                writer.write(rows)
+            except Exception as e:
+                print(f"{location_name}: {e!r}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pyweather")
+    commands = parser.add_subparsers(dest="command", required=True)
+    forecast = commands.add_parser("forecast", help="Hourly forecasts of locations")
+    forecast.add_argument(
+        "--locations",
+        default=None,
+        help="Comma-separated names, as in pyweather.locations (default: all)",
+    )
+    forecast.add_argument("--hours", type=int, default=24)
+    forecast.add_argument(
+        "--start",
+        default=None,
+        help="Local time of the first hour, e.g. 2020-04-14T13:00 (default: now)",
+    )
+    forecast.add_argument(
+        "--services",
+        default=DEFAULT_SERVICES,
+        help="Comma-separated services, as in pyweather.services",
+    )
+    forecast.add_argument("--format", choices=list(WRITERS), default="ndjson")
+    forecast.add_argument("-o", "--output", default=None, help="Default: stdout")
+    forecast.add_argument("--workers", type=int, default=8)
+    forecast.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="Parses the documents in this many worker processes",
+    )
+    catalog = commands.add_parser(
+        "catalog", help="Builds a location catalog, for LOCATION_CATALOG"
+    )
+    catalog.add_argument(
+        "--input",
+        required=True,
+        help="CSV file: id,name,latitude,longitude,timezone,bom_url,"
+        "accuweather_location_key",
+    )
+    catalog.add_argument("-o", "--output", required=True, help="Directory")
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "catalog":
+        locations, ids = read_csv_locations(arguments.input)
+        write_catalog(arguments.output, locations, ids=ids)
+        return
+
+    locations = default_locations()
+    if arguments.locations:
+        location_names = [
+            elt.strip().upper() for elt in arguments.locations.split(",") if elt.strip()
+        ]
+        unknown = [elt for elt in location_names if elt not in locations]
+        if unknown:
+            parser.error(f"Unknown locations: {', '.join(unknown)}")
+    else:
+        location_names = iter(locations)
+    service_names = [elt.strip().upper() for elt in arguments.services.split(",")]
+    unknown = [elt for elt in service_names if elt not in SERVICES]
+    if unknown:
+        parser.error(
+            f"Unknown services: {', '.join(unknown)}"
+            f" (available: {', '.join(SERVICES)})"
+        )
+    services = [SERVICES[elt] for elt in service_names]
+    if arguments.format == "parquet" and not arguments.output:
+        parser.error("--format parquet requires --output")
+
+    if arguments.output:
+        mode = "wb" if arguments.format == "parquet" else "w"
+        output = open(arguments.output, mode, newline="" if mode == "w" else None)
+    else:
+        output = sys.stdout
+    try:
+        writer = WRITERS[arguments.format](output, columns(services))
+        if arguments.processes:
+            run_forecast_sharded(
+                location_names,
+                arguments.start,
+                arguments.hours,
+                services,
+                writer,
+                processes=arguments.processes,
+                locations=locations,
+            )
+        else:
+            run_forecast(
+                location_names,
+                arguments.start,
+                arguments.hours,
+                services,
+                writer,
+                workers=arguments.workers,
+                locations=locations,
+            )
+        writer.close()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import threading
+import numpy as np
+from .backtest import LEAD_BUCKETS, load_reference, lookup_reference, lead_time_hours
+
+# Prior number of unbiased forecasts each correction is shrunk towards
+SHRINKAGE = 24
+
+
+class BiasCorrections:
+    """Per (service, location, hour of day, lead time bucket) temperature
+    corrections, subtracted from the forecasts before they are aggregated
+
+    The hour of day is the UTC one (epoch hour % 24), which for a given
+    location stands for a fixed local hour outside of daylight saving shifts
+    """
+
+    def __init__(self, corrections, service_names, location_names, lead_buckets):
+        self.corrections = np.asarray(corrections, dtype=np.float32)
+        self.service_names = list(service_names)
+        self.location_names = list(location_names)
+        self.lead_buckets = np.asarray(lead_buckets, dtype=np.int64)
+        self._service_codes = {name: i for i, name in enumerate(self.service_names)}
+        self._location_codes = {name: i for i, name in enumerate(self.location_names)}
+        # A trailing zero slot for the services and locations without corrections
+        self._table = np.zeros(
+            (len(self.service_names) + 1, len(self.location_names) + 1)
+            + self.corrections.shape[2:],
+            dtype=np.float32,
+        )
+        self._table[:-1, :-1] = np.nan_to_num(self.corrections)
+
+    def save(self, path):
+        """Saves the corrections as a compressed .npz file"""
+        np.savez_compressed(
+            path,
+            corrections=self.corrections,
+            service_names=np.array(self.service_names),
+            location_names=np.array(self.location_names),
+            lead_buckets=self.lead_buckets,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                corrections=data["corrections"],
+                service_names=data["service_names"].tolist(),
+                location_names=data["location_names"].tolist(),
+                lead_buckets=data["lead_buckets"],
+            )
+
+    def apply(
+        self, temperatures, location_names, epoch_hours, service_names, fetched_hours
+    ):
+        """Corrects a (location x hour x service) cube, as built by
+        indexes_to_cube(), with a single gather and subtraction
+
+        Input:
+            temperatures
+                Array of shape (locations, hours, services)
+            location_names
+                ["SYDNEY", "MELBOURNE"], None for an unknown location
+            epoch_hours
+                One sequence of epoch hours per location
+            service_names
+                ["pyweather.api.met", "pyweather.api.yrno"]
+            fetched_hours
+                Epoch hour the forecasts of every location were fetched at
+
+        Output:
+            Array of the same shape
+        """
+        epoch_hours = np.asarray(epoch_hours, dtype=np.int64).reshape(
+            temperatures.shape[:2]
+        )
+        services = np.array(
+            [self._service_codes.get(elt, -1) for elt in service_names], dtype=np.int64
+        )
+        locations = np.array(
+            [self._location_codes.get(elt, -1) for elt in location_names],
+            dtype=np.int64,
+        )
+        leads = epoch_hours - np.asarray(fetched_hours, dtype=np.int64)[:, None]
+        buckets = np.searchsorted(self.lead_buckets, leads, side="right") - 1
+        buckets = buckets.clip(0)
+        corrections = self._table[
+            services[None, None, :],
+            locations[:, None, None],
+            (epoch_hours % 24)[..., None],
+            buckets[..., None],
+        ]
+        return temperatures - corrections.astype(temperatures.dtype)
+
+
+def fit_corrections(
+    rows,
+    reference,
+    service_names,
+    location_names,
+    lead_buckets=None,
+    shrinkage=SHRINKAGE,
+):
+    """Fits the corrections to the mean error of the stored forecasts, in a
+    single vectorized pass
+
+    Input:
+        rows
+            Array of HISTORY_DTYPE rows, as returned by HistoryStore.load()
+        reference
+            As returned by pyweather.backtest.load_reference()
+        service_names, location_names
+            The HistoryStore catalog
+        lead_buckets (optional)
+            Lower bounds of the lead time buckets, in hours
+        shrinkage (optional)
+            The corrections are sum(errors) / (count + shrinkage), so that
+            the cells with few forecasts are barely corrected
+
+    Output:
+        BiasCorrections
+    """
+    lead_buckets = np.asarray(LEAD_BUCKETS if lead_buckets is None else lead_buckets)
+    shape = (len(service_names), len(location_names), 24, len(lead_buckets))
+
+    leads = lead_time_hours(rows)
+    observed = lookup_reference(reference, rows["location"], rows["target_hour"])
+    scored = ~np.isnan(observed) & (leads >= lead_buckets[0])
+    rows, leads, observed = rows[scored], leads[scored], observed[scored]
+
+    cells = np.ravel_multi_index(
+        (
+            rows["service"].astype(np.int64),
+            rows["location"].astype(np.int64),
+            rows["target_hour"] % 24,
+            np.searchsorted(lead_buckets, leads, side="right") - 1,
+        ),
+        shape,
+    )
+    size = int(np.prod(shape))
+    errors = rows["temperature"].astype(np.float64) - observed
+    sums = np.bincount(cells, weights=errors, minlength=size)
+    counts = np.bincount(cells, minlength=size)
+    corrections = (sums / (counts + shrinkage)).reshape(shape)
+
+    return BiasCorrections(corrections, service_names, location_names, lead_buckets)
+
+
+def fit_store(store, reference_path, start_hour=None, end_hour=None, **kwargs):
+    """Fits the corrections to the forecasts of a HistoryStore"""
+    return fit_corrections(
+        store.load(start_hour, end_hour),
+        load_reference(reference_path, store.catalog["locations"]),
+        service_names=store.catalog["services"],
+        location_names=store.catalog["locations"],
+        **kwargs,
+    )
+
+
+_default_corrections = None
+_default_corrections_lock = threading.Lock()
+
+
+def default_corrections():
+    """Corrections saved at the BIAS_CORRECTIONS path, if set"""
+    global _default_corrections
+    path = os.getenv("BIAS_CORRECTIONS")
+    if not path:
+        return None
+    with _default_corrections_lock:
+        if _default_corrections is None or _default_corrections[0] != path:
+            _default_corrections = (path, BiasCorrections.load(path))
+        return _default_corrections[1]
@@ -26,3 +26,15 @@ class MissingAPIKey(Exception):
     """Did not find the API keys in the environment variables"""
 
     pass
+
+
+class InvalidSetting(Exception):
+    """A setting found in the environment variables has an unexpected value"""
+
+    pass
+
+
+class MissingDependency(Exception):
+    """An optional dependency is required for this feature"""
+
+    pass
@@ -1,19 +1,100 @@
+import numpy as np
+import pendulum
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 from .services import BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC
+from .locations import location_name
+from .correction import default_corrections
 from .exceptions import OutOfRange, HttpError, BadResponse
-from .utils.time import local_string_to_range_of_local_strings
-from decimal import Decimal
+from .utils.time import (
+    hour_grid,
+    epoch_hour_to_utc_string,
+    local_string_to_target_keys,
+    utc_string_to_utc_datetime,
+    hours_since_utc_datetime,
+    decaminutes_since_utc_datetime,
+)
+from .utils.responses import derive
+from .utils.numeric import ARRAY_DTYPE, to_output
+from .aggregation import (
+    soothing,
+    sumproduct,
+    aggregate_cube,
+    indexes_to_cube,
+    indexes_to_ages,
+    age_weights,
+    weighted_average,
+    robust_statistics,
+    cell_statistics,
+    RunningAggregate,
+    RunningWeightedAverage,
+)
 
 
-def soothing(hours):
-    """A soothing factors to compute exponentially decaying data
-    i.e. older forecasts shouldn't count as much as more recent forecasts
+def refresh_forecast_age(metadata):
+    """Recomputes the age of a forecast from its issue time"""
+    issue_time = metadata.get("forecast_issue_time")
+    if issue_time is None:
+        return metadata
+    issue_datetime = utc_string_to_utc_datetime(issue_time)
+    return {
+        **metadata,
+        "forecast_age_hours": hours_since_utc_datetime(issue_datetime),
+        "forecast_age_decaminutes": decaminutes_since_utc_datetime(issue_datetime),
+    }
+
+
+def retrieve_index(service, location_object):
+    """Retrieves a service's document for a location and indexes it
+    Returns None when the service could not be reached or its document
+    could not be read
+
+    The document is only indexed again when the service's raw response
+    changed since the last call; "changed" is False otherwise
     """
-    return 2 / (Decimal(hours) + 1)
+    try:
+        document = service.retrieve_document(location_object)
+    except HttpError:
+        # Accuweather may raise a 503
+        # Likely happens when quotas has been reached
+        from .utils.api_keys_rotation import KeyHandler
 
+        key = KeyHandler()
+        key.refresh("ACCUWEATHER")
+        try:
+            document = service.retrieve_document(location_object)
+        except HttpError:
+            # Trying again one last time
+            try:
+                document = service.retrieve_document(location_object)
+            except HttpError:
+                # Accuweather may raise a 503
+                # Likely happens when quotas has been reached
+                from .utils.api_keys_rotation import KeyHandler
 
-def sumproduct(*lists):
-    """Excel-style sumproduct function"""
-    return sum([x * y for x, y in zip(*lists)])
+                key = KeyHandler()
+                key.refresh("ACCUWEATHER")
+                try:
+                    document = service.retrieve_document(location_object)
+                except HttpError:
+                    # Rotating the key did not help
+                    # Service may be actually down
+                    return None
+    try:
+        index, changed = derive(
+            service.__name__,
+            location_object,
+            "index",
+            lambda: service.index_document(
+                location_object=location_object, document=document
+            ),
+        )
+    except BadResponse as e:
+        print("BadResponse:")
+        print(e)
+        return None
+    if not changed:
+        index = {**index, "metadata": refresh_forecast_age(index["metadata"])}
+    return {**index, "changed": changed}
 
 
 class Forecast:
@@ -29,10 +110,16 @@ class Forecast:
             ACCUWEATHER,
             YRNO,
         ],  # Adding WEATHERCOM, GWC would require a .retrieve() method
+        corrections=None,
+        name=None,
     ):
         self.location_object = location_object
+        self.location_name = name or location_name(location_object)
         self.local_date = local_date
         self.services = services
+        # BiasCorrections, defaults to the ones saved at BIAS_CORRECTIONS
+        self.corrections = corrections or default_corrections()
+        self.fetched_hour = pendulum.now().int_timestamp // 3600
         self.detailed = self._fetch_forecast()
         self.aggregated = self._compute_aggregates()
 
@@ -80,16 +167,53 @@ class Forecast:
         return forecast_object
 
     def _compute_aggregates(self):
-        """"""
-        agg_object = {}
-        temperatures = [
-            elt["temperature_celcius"] for elt in self.detailed["forecasts"]
-        ]
-        agg_object["average"] = round(sum(temperatures) / len(temperatures), 2)
-        agg_object["max"] = max(temperatures)
-        agg_object["min"] = min(temperatures)
+        """Statistics of the services' temperatures
+
+        Output:
+            {
+                "average": Decimal("14.60"),
+                "min": Decimal("14.30"),
+                "max": Decimal("14.80"),
+                "median": Decimal("14.70"),
+                "std": Decimal("0.22"),
+                "spread": Decimal("0.50"),
+                "count": 3,
+                "trimmed_mean": Decimal("14.70"),
+                "mad_mean": Decimal("14.60"),
+                "huber_mean": Decimal("14.62"),
+                "weighted_average": Decimal("14.65")
+            }
+        """
+        forecasts = self.detailed["forecasts"]
+        temperatures = np.array(
+            [[[elt["temperature_celcius"] for elt in forecasts]]], dtype=ARRAY_DTYPE
+        )
+        mask = np.ones(temperatures.shape, dtype=bool)
+        service_names = [elt["service"] for elt in forecasts]
+        if self.corrections is not None:
+            epoch_hour = local_string_to_target_keys(
+                time_local=self.local_date, timezone=self.location_object["timezone"]
+            )["epoch_hour"]
+            temperatures = self.corrections.apply(
+                temperatures,
+                location_names=[self.location_name],
+                epoch_hours=[[epoch_hour]],
+                service_names=service_names,
+                fetched_hours=[self.fetched_hour],
+            )
+        # Unknown ages (None) become NaN
+        ages = np.array(
+            [[elt.get("forecast_age_hours") for elt in forecasts]], dtype=np.float64
+        )
 
-        return agg_object
+        aggregated = aggregate_cube(temperatures, mask)
+        aggregated.update(robust_statistics(temperatures, mask))
+        aggregated["weighted_average"] = weighted_average(
+            temperatures,
+            mask,
+            age_weights(ages, service_names),
+        )
+        return cell_statistics(aggregated, 0, 0)
 
 
 class HourlyForecast:
@@ -102,100 +226,307 @@ class HourlyForecast:
         local_date_end=None,
         next_n_hours=None,
         services=[BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC],
+        corrections=None,
+        name=None,
+        indexed=None,
     ):
+        """
+        Input:
+            indexed (optional)
+                The services' indexes when they were already retrieved, e.g.
+                by a pyweather.parallel.ShardedExecutor
+        """
         self.location_object = location_object
+        self.location_name = name or location_name(location_object)
         self.local_date_start = local_date_start
         self.local_date_end = local_date_end
         self.next_n_hours = next_n_hours
         self.services = services
-        self.local_dates = local_string_to_range_of_local_strings(
+        # BiasCorrections, defaults to the ones saved at BIAS_CORRECTIONS
+        self.corrections = corrections or default_corrections()
+        self.hour_grid = hour_grid(
+            timezone=self.location_object["timezone"],
             time_local_start=self.local_date_start,
             time_local_end=self.local_date_end,
             next_n_hours=self.next_n_hours,
         )
-        self.detailed = self._fetch_forecast()
+        self.local_dates = list(self.hour_grid.local_strings)
+        self.fetched_hour = pendulum.now().int_timestamp // 3600
+        self.indexed = indexed if indexed is not None else self._fetch_forecast()
+        self._detailed = None
+        self._aggregated = None
 
     def _fetch_forecast(self):
         """Forecasts the weather by calling all services
+        Each service's document is indexed by epoch hour
 
         Output:
             {
-                "aggregated": {
-                    "average": 14.6,
-                    "min": 14.3,
-                    "max": 14.8
-                },
-                "forecasts": [
-                    {
-                        "ok": True,
-                        "time_utc": "2020-04-13T03:00:00Z",
-                        "temperature_celcius": 15.79,
+                "pyweather.api.met": {
+                    "metadata": {
                         "forecast_age_hours": 1,
-                        "forecast_issue_time": "2020-04-12T12:00Z"
+                        "forecast_age_decaminutes": 8.3,
+                        "forecast_issue_time": "2020-04-12T12:00:00Z"
                     },
-                    {
-                        "ok": True,
-                        "time_utc": "2020-04-13T03:00:00Z",
-                        "temperature_celcius": 15.84,
-                        "forecast_age_hours": 3,
-                        "forecast_issue_time": "2020-04-12T12:00Z"
+                    "temperatures": {
+                        440763: Decimal("15.79"),
+                        440764: Decimal("15.84"),
                     },
-                ]
+                    "changed": True
+                },
             }
         """
-        forecast_object = {"services": [], "forecasts": {}}
-
-        for hour in self.local_dates:
-            forecast_object["forecasts"][hour] = {}
+        indexed = {}
 
         for service in self.services:
-            forecast_object["services"].append(service.__name__)
-            try:
-                document = service.retrieve_document(self.location_object)
-            except HttpError:
-                # Accuweather may raise a 503
-                # Likely happens when quotas has been reached
-                from .utils.api_keys_rotation import KeyHandler
+            index = retrieve_index(service, self.location_object)
+            if index is not None:
+                indexed[service.__name__] = index
 
-                key = KeyHandler()
-                key.refresh("ACCUWEATHER")
-                try:
-                    document = service.retrieve_document(self.location_object)
-                except HttpError:
-                    # Trying again one last time
-                    try:
-                        document = service.retrieve_document(self.location_object)
-                    except HttpError:
-                        # Accuweather may raise a 503
-                        # Likely happens when quotas has been reached
-                        from .utils.api_keys_rotation import KeyHandler
-
-                        key = KeyHandler()
-                        key.refresh("ACCUWEATHER")
-                        try:
-                            document = service.retrieve_document(self.location_object)
-                        except HttpError:
-                            # Rotating the key did not help
-                            # Service may be actually down
-                            continue
-            for hour in self.local_dates:
-                try:
-                    response = service.find_in_document(
-                        location_object=self.location_object,
-                        target_local_time=hour,
-                        document=document,
-                    )
-                    response["service"] = service.__name__
-                    forecast_object["forecasts"][hour][service.__name__] = response
-                except OutOfRange as e:
-                    continue
-                except BadResponse as e:
-                    print("BadResponse:")
-                    print(e)
+        return indexed
+
+    @property
+    def changed(self):
+        """True when any service's response changed since the last fetch"""
+        return any(index["changed"] for index in self.indexed.values())
+
+    @property
+    def detailed(self):
+        """Compatibility layer composing the forecasts by local date
+        The time strings are only produced here, at the output boundary
+
+        Output:
+            {
+                "services": ["pyweather.api.met", "pyweather.api.yrno"],
+                "forecasts": {
+                    "2020-04-13T13:00": {
+                        "pyweather.api.met": {
+                            "ok": True,
+                            "time_utc": "2020-04-13T03:00:00Z",
+                            "temperature_celcius": 15.79,
+                            "forecast_age_hours": 1,
+                            "forecast_age_decaminutes": 8.3,
+                            "forecast_issue_time": "2020-04-12T12:00:00Z",
+                            "service": "pyweather.api.met"
+                        },
+                    },
+                }
+            }
+        """
+        if self._detailed is not None:
+            return self._detailed
+
+        forecast_object = {
+            "services": [service.__name__ for service in self.services],
+            "forecasts": {},
+        }
+        for hour, epoch_hour in zip(self.local_dates, self.hour_grid.epoch_hours):
+            forecast_object["forecasts"][hour] = {}
+            for service_name, index in self.indexed.items():
+                temperature = index["temperatures"].get(epoch_hour)
+                if temperature is None:
                     continue
+                forecast_object["forecasts"][hour][service_name] = {
+                    "ok": True,
+                    "time_utc": epoch_hour_to_utc_string(epoch_hour),
+                    "temperature_celcius": to_output(temperature),
+                    **index["metadata"],
+                    "service": service_name,
+                }
 
+        self._detailed = forecast_object
         return forecast_object
 
+    @property
+    def aggregated(self):
+        """Statistics of the services' temperatures for every hour,
+        computed for all the hours at once
+
+        Output:
+            {
+                "2020-04-13T13:00": {
+                    "average": Decimal("14.60"),
+                    "min": Decimal("14.30"),
+                    "max": Decimal("14.80"),
+                    "median": Decimal("14.70"),
+                    "std": Decimal("0.22"),
+                    "spread": Decimal("0.50"),
+                    "count": 3,
+                    "trimmed_mean": Decimal("14.70"),
+                    "mad_mean": Decimal("14.60"),
+                    "huber_mean": Decimal("14.62"),
+                    "weighted_average": Decimal("14.65")
+                },
+            }
+            The trimmed, MAD-filtered and Huber means resist a broken service
+            "weighted_average" weighs the services by the age of their
+            forecasts and the configured SERVICE_WEIGHTS
+            The services' temperatures are bias-corrected first, if
+            corrections are set
+        """
+        if self._aggregated is not None:
+            return self._aggregated
+
+        service_names = list(self.indexed)
+        temperatures, mask = indexes_to_cube(
+            indexes=[self.indexed],
+            epoch_hours=[self.hour_grid.epoch_hours],
+            service_names=service_names,
+        )
+        if self.corrections is not None:
+            temperatures = self.corrections.apply(
+                temperatures,
+                location_names=[self.location_name],
+                epoch_hours=[self.hour_grid.epoch_hours],
+                service_names=service_names,
+                fetched_hours=[self.fetched_hour],
+            )
+        aggregated = aggregate_cube(temperatures, mask)
+        aggregated.update(robust_statistics(temperatures, mask))
+        aggregated["weighted_average"] = weighted_average(
+            temperatures,
+            mask,
+            age_weights(indexes_to_ages([self.indexed], service_names), service_names),
+        )
+
+        self._aggregated = {
+            hour: cell_statistics(aggregated, 0, h)
+            for h, hour in enumerate(self.local_dates)
+        }
+        return self._aggregated
+
+
+class StreamingForecast:
+    """Forecast of several services for a range of hours and single location,
+    aggregated incrementally as the services' results arrive
+    """
+
+    def __init__(
+        self,
+        location_object,
+        local_date_start,
+        local_date_end=None,
+        next_n_hours=None,
+        services=[BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC],
+        max_workers=None,
+        corrections=None,
+        name=None,
+    ):
+        self.location_object = location_object
+        self.location_name = name or location_name(location_object)
+        self.local_date_start = local_date_start
+        self.local_date_end = local_date_end
+        self.next_n_hours = next_n_hours
+        self.services = services
+        self.max_workers = max_workers or len(services)
+        self.corrections = corrections or default_corrections()
+        self.hour_grid = hour_grid(
+            timezone=self.location_object["timezone"],
+            time_local_start=self.local_date_start,
+            time_local_end=self.local_date_end,
+            next_n_hours=self.next_n_hours,
+        )
+        self.local_dates = list(self.hour_grid.local_strings)
+        self.fetched_hour = pendulum.now().int_timestamp // 3600
+        self.indexed = {}
+        self.running = RunningAggregate(1, len(self.local_dates))
+        self.running_weighted = RunningWeightedAverage(1, len(self.local_dates))
+
+    def _add(self, service_name, index):
+        """Updates the running aggregates with a service's indexed document"""
+        self.indexed[service_name] = index
+        temperatures, mask = indexes_to_cube(
+            indexes=[{service_name: index}],
+            epoch_hours=[self.hour_grid.epoch_hours],
+            service_names=[service_name],
+        )
+        if self.corrections is not None:
+            temperatures = self.corrections.apply(
+                temperatures,
+                location_names=[self.location_name],
+                epoch_hours=[self.hour_grid.epoch_hours],
+                service_names=[service_name],
+                fetched_hours=[self.fetched_hour],
+            )
+        ages = indexes_to_ages([{service_name: index}], [service_name])
+        self.running.add(temperatures[..., 0], mask[..., 0])
+        self.running_weighted.add(
+            service_name, temperatures[..., 0], mask[..., 0], ages[:, 0]
+        )
+
+    def stream(self, timeout=None):
+        """Calls all services concurrently and yields their results as they
+        complete, the running aggregates being updated before each yield
+
+        Input:
+            timeout (optional)
+                Seconds after which the services still pending are given up
+
+        Output (for each service):
+            {
+                "service": "pyweather.api.met",
+                "index": {"metadata": {...}, "temperatures": {...}},
+                "changed": True,
+                "services_count": 2
+            }
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {
+            executor.submit(retrieve_index, service, self.location_object): service
+            for service in self.services
+        }
+        try:
+            for future in as_completed(futures, timeout=timeout):
+                index = future.result()
+                if index is None:
+                    continue
+                service_name = futures[future].__name__
+                self._add(service_name, index)
+                yield {
+                    "service": service_name,
+                    "index": index,
+                    "changed": index["changed"],
+                    "services_count": len(self.indexed),
+                }
+        except TimeoutError:
+            return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def aggregate(self, min_services=None, timeout=None):
+        """Returns a "good enough" aggregate, as soon as `min_services`
+        services have answered or `timeout` seconds have elapsed,
+        whichever comes first. Waits for all services by default
+        """
+        for result in self.stream(timeout=timeout):
+            if min_services and result["services_count"] >= min_services:
+                break
+        return self.aggregated
+
+    @property
+    def aggregated(self):
+        """Current statistics of the services' temperatures for every hour
+
+        Output:
+            {
+                "2020-04-13T13:00": {
+                    "average": Decimal("14.60"),
+                    "min": Decimal("14.30"),
+                    "max": Decimal("14.80"),
+                    "std": Decimal("0.22"),
+                    "spread": Decimal("0.50"),
+                    "count": 3,
+                    "weighted_average": Decimal("14.65")
+                },
+            }
+        """
+        aggregated = self.running.statistics()
+        aggregated["weighted_average"] = self.running_weighted.weighted_average
+        return {
+            hour: cell_statistics(aggregated, 0, h)
+            for h, hour in enumerate(self.local_dates)
+        }
+
 
 if __name__ == "__main__":
     from pyweather.forecast import Forecast
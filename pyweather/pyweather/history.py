@@ -0,0 +1,308 @@
+import json
+import threading
+import uuid
+import numpy as np
+import pendulum
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .utils.time import utc_string_to_utc_datetime
+
+HISTORY_DTYPE = np.dtype(
+    [
+        ("service", np.uint16),
+        ("location", np.uint32),
+        ("fetched_at", np.int64),  # Timestamp (UTC)
+        ("issued_at", np.int64),  # Timestamp (UTC), -1 when unknown
+        ("target_hour", np.int64),  # Epoch hour
+        ("temperature", np.float32),
+    ]
+)
+
+BATCH_SIZE = 100000
+
+
+def issue_time_to_timestamp(issue_time):
+    """
+    Input:
+        '2020-04-11T09:00:00Z'
+        None
+
+    Output:
+        1586595600
+        -1
+    """
+    if not issue_time:
+        return -1
+    return utc_string_to_utc_datetime(issue_time).int_timestamp
+
+
+def target_months(target_hours):
+    """Partition of every target hour
+
+    Input:
+        array([440721, 441469])
+
+    Output:
+        array(['2020-04', '2020-05'])
+    """
+    seconds = np.asarray(target_hours, dtype=np.int64) * 3600
+    return np.datetime_as_string(seconds.astype("datetime64[s]"), unit="M")
+
+
+class HistoryStore:
+    """Append-only store of every fetched forecast, as NumPy segments
+    partitioned by location and target month
+
+        <path>/catalog.json
+        <path>/<location code>/<YYYY-MM>/<fetched_at>-<id>.npy
+
+    Each segment is sorted by target hour and memory-mapped when scanned
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._catalog_path = self.path / "catalog.json"
+        if self._catalog_path.exists():
+            self.catalog = json.loads(self._catalog_path.read_text())
+        else:
+            self.catalog = {"services": [], "locations": []}
+
+    def _code(self, kind, name):
+        with self._lock:
+            names = self.catalog[kind]
+            if name not in names:
+                names.append(name)
+                temporary = self._catalog_path.with_suffix(".tmp")
+                temporary.write_text(json.dumps(self.catalog))
+                temporary.replace(self._catalog_path)
+            return names.index(name)
+
+    def service_code(self, service_name):
+        return self._code("services", service_name)
+
+    def location_code(self, location_name):
+        return self._code("locations", location_name)
+
+    def service_name(self, code):
+        return self.catalog["services"][code]
+
+    def location_name(self, code):
+        return self.catalog["locations"][code]
+
+    def write_segment(self, rows):
+        """Writes a batch of rows (HISTORY_DTYPE), one segment per partition"""
+        if not len(rows):
+            return
+        fetched_at = int(rows["fetched_at"].max())
+        for location in np.unique(rows["location"]):
+            located = rows[rows["location"] == location]
+            months = target_months(located["target_hour"])
+            for month in np.unique(months):
+                selected = located[months == month]
+                selected = selected[np.argsort(selected["target_hour"], kind="stable")]
+                directory = self.path / str(location) / str(month)
+                directory.mkdir(parents=True, exist_ok=True)
+                filename = f"{fetched_at}-{uuid.uuid4().hex[:12]}.npy"
+                temporary = directory / (filename + ".tmp")
+                with open(temporary, "wb") as f:
+                    np.save(f, selected)
+                temporary.replace(directory / filename)
+
+    def segments(self, location_code, start_hour=None, end_hour=None):
+        """Lists the segments of a location that may hold the target hours"""
+        directory = self.path / str(location_code)
+        if not directory.exists():
+            return []
+        first, last = target_months(
+            [
+                start_hour if start_hour is not None else 0,
+                end_hour if end_hour is not None else 10 ** 7,
+            ]
+        )
+        return sorted(
+            segment
+            for month in directory.iterdir()
+            if first <= month.name <= last
+            for segment in month.glob("*.npy")
+        )
+
+    def scan(self, location_name, start_hour=None, end_hour=None, services=None):
+        """Returns the rows of a location targeting [start_hour, end_hour]
+
+        Input:
+            location_name
+                'SYDNEY'
+            start_hour, end_hour (optional)
+                Epoch hours
+            services (optional)
+                ["pyweather.api.met"]
+
+        Output:
+            Array of HISTORY_DTYPE rows
+        """
+        if location_name not in self.catalog["locations"]:
+            return np.empty(0, dtype=HISTORY_DTYPE)
+        location_code = self.catalog["locations"].index(location_name)
+        parts = []
+        for segment in self.segments(location_code, start_hour, end_hour):
+            rows = np.load(segment, mmap_mode="r")
+            first, last = 0, len(rows)
+            if start_hour is not None:
+                first = np.searchsorted(rows["target_hour"], start_hour, side="left")
+            if end_hour is not None:
+                last = np.searchsorted(rows["target_hour"], end_hour, side="right")
+            if first < last:
+                parts.append(np.array(rows[first:last]))
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=HISTORY_DTYPE)
+
+        if services is not None:
+            codes = [
+                self.catalog["services"].index(elt)
+                for elt in services
+                if elt in self.catalog["services"]
+            ]
+            rows = rows[np.isin(rows["service"], codes)]
+        return rows
+
+    def load(self, start_hour=None, end_hour=None):
+        """Returns the rows of all locations targeting [start_hour, end_hour]"""
+        parts = [
+            self.scan(location_name, start_hour, end_hour)
+            for location_name in self.catalog["locations"]
+        ]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=HISTORY_DTYPE)
+
+    def writer(self, batch_size=BATCH_SIZE, background=True):
+        return HistoryWriter(self, batch_size=batch_size, background=background)
+
+
+class HistoryWriter:
+    """Buffers the forecasts and writes them to a HistoryStore in batches,
+    in a background thread by default so the fetch loop isn't slowed down
+    """
+
+    def __init__(self, store, batch_size=BATCH_SIZE, background=True):
+        self.store = store
+        self.batch_size = batch_size
+        self._buffer = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self._pending = []
+
+    def append(
+        self,
+        service_name,
+        location_name,
+        target_hours,
+        temperatures,
+        issued_at=-1,
+        fetched_at=None,
+    ):
+        """Appends the forecasts of a service for a location
+
+        Input:
+            service_name
+                'pyweather.api.met'
+            location_name
+                'SYDNEY'
+            target_hours
+                Sequence of epoch hours
+            temperatures
+                Sequence of temperatures
+            issued_at (optional)
+                Timestamp of the forecast issue time
+            fetched_at (optional)
+                Timestamp of the fetch, defaults to now
+        """
+        if fetched_at is None:
+            fetched_at = pendulum.now().int_timestamp
+        rows = np.empty(len(target_hours), dtype=HISTORY_DTYPE)
+        rows["service"] = self.store.service_code(service_name)
+        rows["location"] = self.store.location_code(location_name)
+        rows["fetched_at"] = fetched_at
+        rows["issued_at"] = issued_at
+        rows["target_hour"] = np.fromiter(target_hours, dtype=np.int64, count=len(rows))
+        rows["temperature"] = np.fromiter(
+            temperatures, dtype=np.float32, count=len(rows)
+        )
+        with self._lock:
+            self._buffer.append(rows)
+            self._buffered += len(rows)
+            full = self._buffered >= self.batch_size
+        if full:
+            self.flush()
+
+    def append_indexed(self, location_name, indexed, fetched_at=None):
+        """Appends the indexed documents of a location
+
+        Input:
+            location_name
+                'SYDNEY'
+            indexed
+                {service_name: index}, as in HourlyForecast.indexed
+        Skips the documents that did not change since the last fetch
+        """
+        for service_name, index in indexed.items():
+            if not index.get("changed", True):
+                continue
+            temperatures = index["temperatures"]
+            self.append(
+                service_name=service_name,
+                location_name=location_name,
+                target_hours=list(temperatures),
+                temperatures=[float(elt) for elt in temperatures.values()],
+                issued_at=issue_time_to_timestamp(
+                    index["metadata"].get("forecast_issue_time")
+                ),
+                fetched_at=fetched_at,
+            )
+
+    def append_hourly_forecast(self, location_name, hourly_forecast, fetched_at=None):
+        """Appends all the forecasts fetched by an HourlyForecast object"""
+        self.append_indexed(location_name, hourly_forecast.indexed, fetched_at)
+
+    def flush(self):
+        """Writes the buffered rows
+        In the background, raises the error of an earlier write that failed
+        """
+        with self._lock:
+            if not self._buffer:
+                return
+            rows = np.concatenate(self._buffer)
+            self._buffer, self._buffered = [], 0
+        if self._executor:
+            self._pending.append(self._executor.submit(self.store.write_segment, rows))
+            self._raise_failed_writes()
+        else:
+            self.store.write_segment(rows)
+
+    def _raise_failed_writes(self):
+        """Forgets the completed writes, raising the first error among them"""
+        done, pending = [], []
+        for future in self._pending:
+            (done if future.done() else pending).append(future)
+        self._pending = pending
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def close(self):
+        """Flushes and waits for all the writes to complete, raising the
+        first error among them
+        """
+        try:
+            self.flush()
+        finally:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+        if self._executor:
+            self._raise_failed_writes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
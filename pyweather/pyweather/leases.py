@@ -0,0 +1,373 @@
+"""Coordination of several worker hosts, so that every (service, location)
+is fetched by a single node per refresh slot and its index shared with all
+
+    store = SqliteLeaseStore("/shared/leases.db")
+    retriever = CoordinatedRetriever(store)
+    scheduler = Scheduler(LOCATIONS, retriever=retriever.retrieve_index)
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from .locations import location_name
+from .utils.settings import service_key
+from .scheduler import SERVICE_CADENCES
+from .forecast import retrieve_index, refresh_forecast_age
+from .exceptions import MissingDependency, InvalidSetting
+from .utils.numeric import to_number
+from .utils.responses import content_hash
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Seconds a node may hold a lease before another one takes over
+LEASE_SECONDS = 120
+# Seconds between two looks at the shared cache, while another node fetches
+POLL_SECONDS = 0.5
+
+
+class MemoryLeaseStore:
+    """Lease store of a single process, standing in for the shared ones in
+    tests and on a single node
+    """
+
+    def __init__(self):
+        self._leases = {}  # {key: (owner, expires_at)}
+        self._values = {}  # {key: (value, expires_at)}
+        self._lock = threading.Lock()
+
+    def claim(self, key, owner, seconds):
+        """Takes the lease of `key` for `seconds`, returns True when it was
+        free, expired or already held by `owner`
+        """
+        now = time.time()
+        with self._lock:
+            holder = self._leases.get(key)
+            if holder is not None and holder[1] > now and holder[0] != owner:
+                return False
+            self._leases[key] = (owner, now + seconds)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            if self._leases.get(key, (None,))[0] == owner:
+                del self._leases[key]
+
+    def put(self, key, value, seconds):
+        with self._lock:
+            self._values[key] = (value, time.time() + seconds)
+
+    def get(self, key):
+        with self._lock:
+            value, expires_at = self._values.get(key, (None, 0))
+        return value if expires_at > time.time() else None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shared (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SqliteLeaseStore:
+    """Lease store in a SQLite database on a volume shared by the nodes
+
+    Claims are single upserts, which SQLite serializes. The volume must
+    support file locks (a local disk or a properly configured NFS mount)
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def claim(self, key, owner, seconds):
+        now = time.time()
+        with self._lock, self.connection:
+            cursor = self.connection.execute(
+                """
+                INSERT INTO leases VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE
+                SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.expires_at <= ? OR leases.owner = excluded.owner
+                """,
+                (key, owner, now + seconds, now),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, key, owner):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner)
+            )
+
+    def put(self, key, value, seconds):
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO shared VALUES (?, ?, ?)",
+                (key, value, now + seconds),
+            )
+            # Expired entries go away with the writes
+            self.connection.execute("DELETE FROM shared WHERE expires_at <= ?", (now,))
+            self.connection.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT value FROM shared WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+
+# Deletes a lease only if it is still held by the caller
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLeaseStore:
+    """Lease store in a Redis-compatible server, requires `pip install redis`"""
+
+    def __init__(self, url, prefix="pyweather:"):
+        if redis is None:
+            raise MissingDependency(
+                {"module": "redis", "message": "pip install redis"}
+            )
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._release = self.client.register_script(RELEASE_SCRIPT)
+
+    def claim(self, key, owner, seconds):
+        key = f"{self.prefix}lease:{key}"
+        milliseconds = int(seconds * 1000)
+        if self.client.set(key, owner, nx=True, px=milliseconds):
+            return True
+        if self.client.get(key) == owner:
+            # Extending our own lease
+            return bool(self.client.set(key, owner, xx=True, px=milliseconds))
+        return False
+
+    def release(self, key, owner):
+        self._release(keys=[f"{self.prefix}lease:{key}"], args=[owner])
+
+    def put(self, key, value, seconds):
+        self.client.set(f"{self.prefix}shared:{key}", value, px=int(seconds * 1000))
+
+    def get(self, key):
+        return self.client.get(f"{self.prefix}shared:{key}")
+
+
+def lease_store(url):
+    """Lease store from a URL
+
+    Input:
+        'memory://'
+        'sqlite:////shared/leases.db'
+        'redis://cache.internal:6379/0'
+    """
+    if url.startswith("memory:"):
+        return MemoryLeaseStore()
+    if url.startswith("sqlite://"):
+        return SqliteLeaseStore(url[len("sqlite://") :])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisLeaseStore(url)
+    raise InvalidSetting(
+        {
+            "setting": "LEASE_STORE",
+            "value": url,
+            "allowed": ["memory://", "sqlite://", "redis://"],
+        }
+    )
+
+
+def dump_index(index):
+    """JSON form of an index, temperatures being kept as exact strings"""
+    return json.dumps(
+        {
+            "metadata": index["metadata"],
+            "temperatures": [
+                [epoch_hour, str(temperature)]
+                for epoch_hour, temperature in index["temperatures"].items()
+            ],
+            "changed": index["changed"],
+        }
+    )
+
+
+def index_digest(index):
+    """Hash of an index's forecasts, leaving out their ages which change
+    with time only
+    """
+    metadata = {
+        key: value
+        for key, value in index["metadata"].items()
+        if not key.startswith("forecast_age_")
+    }
+    temperatures = [
+        [epoch_hour, str(temperature)]
+        for epoch_hour, temperature in index["temperatures"].items()
+    ]
+    return content_hash(json.dumps([metadata, temperatures], sort_keys=True))
+
+
+def load_index(raw_string):
+    document = json.loads(raw_string)
+    return {
+        "metadata": document["metadata"],
+        "temperatures": {
+            epoch_hour: to_number(temperature)
+            for epoch_hour, temperature in document["temperatures"]
+        },
+        "changed": document["changed"],
+    }
+
+
+class CoordinatedRetriever:
+    """retrieve_index() shared by several nodes through a lease store
+
+    Time is cut into refresh slots, as long as each service's cadence. In
+    every slot, the node claiming a (service, location) fetches it and puts
+    its index in the shared cache; the other nodes wait for it there. When
+    the claiming node fails, the lease expires and another node takes over
+
+    Every node remembers the forecast it last consumed. Asking again within
+    a slot, as a Scheduler does when a new run is due, looks for a forecast
+    issued after that one instead of the slot's first, and "changed" tells
+    whether the node got a different forecast from last time
+    """
+
+    def __init__(
+        self,
+        store,
+        node_id=None,
+        lease_seconds=LEASE_SECONDS,
+        cadences=None,
+        wait_seconds=None,
+    ):
+        """
+        Input:
+            store
+                MemoryLeaseStore, SqliteLeaseStore or RedisLeaseStore
+            node_id (optional)
+                Defaults to the host name and a random suffix
+            cadences (optional)
+                {"BOM": 3}, hours, defaults to SERVICE_CADENCES
+            wait_seconds (optional)
+                How long to wait for another node's index, defaults to
+                twice the lease
+        """
+        self.store = store
+        self.node_id = node_id or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds
+        self.cadences = {**SERVICE_CADENCES, **(cadences or {})}
+        self.wait_seconds = wait_seconds or 2 * lease_seconds
+        # {(service_name, location_key): (issue time, digest)}
+        self._consumed = {}
+        self._lock = threading.Lock()
+
+    def slot_seconds(self, service_name):
+        return int(self.cadences.get(service_key(service_name), 1) * 3600)
+
+    def keys(self, service_name, location_key, now=None, after=None):
+        """Keys of the lease and of the shared index for the current slot
+
+        Input:
+            after (optional)
+                Issue time of the forecast the node already has, to get a
+                later one
+
+        Output:
+            ("lease:pyweather.api.met:SYDNEY:440721:2020-04-11T09:00:00Z",
+             "index:pyweather.api.met:SYDNEY:440721:2020-04-11T09:00:00Z")
+        """
+        slot = int(now or time.time()) // self.slot_seconds(service_name)
+        key = f"{service_name}:{location_key}:{slot}:{after or ''}"
+        return f"lease:{key}", f"index:{key}"
+
+    def _consume(self, service_name, location_key, index):
+        """Sets "changed" from the forecast the node consumed before"""
+        digest = index_digest(index)
+        issue_time = index["metadata"].get("forecast_issue_time")
+        with self._lock:
+            previous = self._consumed.get((service_name, location_key))
+            self._consumed[(service_name, location_key)] = (issue_time, digest)
+        return {
+            **index,
+            "changed": previous is None or previous[1] != digest,
+        }
+
+    def retrieve_index(self, service, location_object):
+        """Same as pyweather.forecast.retrieve_index(), a single node fetching
+        every (service, location, slot)
+        Returns None when the index could not be retrieved in time
+        """
+        location_key = location_name(location_object) or ",".join(
+            str(elt) for elt in location_object["coordinates"]
+        )
+        service_name = service.__name__
+        with self._lock:
+            after = self._consumed.get((service_name, location_key), (None,))[0]
+        lease_key, index_key = self.keys(service_name, location_key, after=after)
+        deadline = time.time() + self.wait_seconds
+        while True:
+            shared = self.store.get(index_key)
+            if shared is not None:
+                index = load_index(shared)
+                index["metadata"] = refresh_forecast_age(index["metadata"])
+                return self._consume(service_name, location_key, index)
+            if self.store.claim(lease_key, self.node_id, self.lease_seconds):
+                index = retrieve_index(service, location_object)
+                if index is not None:
+                    issue_time = index["metadata"].get("forecast_issue_time")
+                    if after is not None and issue_time == after:
+                        # No new run yet: the nodes may look again soon
+                        seconds = self.lease_seconds
+                    else:
+                        seconds = self.slot_seconds(service_name) + self.lease_seconds
+                    self.store.put(index_key, dump_index(index), seconds)
+                    self.store.release(lease_key, self.node_id)
+                    return self._consume(service_name, location_key, index)
+                # On failure, the lease is kept until it expires, so that the
+                # nodes don't all try again at once
+                return None
+            if time.time() >= deadline:
+                return None
+            time.sleep(POLL_SECONDS)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def default_lease_store():
+    """Lease store at the LEASE_STORE URL, if set"""
+    global _default_store
+    url = os.getenv("LEASE_STORE")
+    if not url:
+        return None
+    with _default_store_lock:
+        if _default_store is None or _default_store[0] != url:
+            _default_store = (url, lease_store(url))
+        return _default_store[1]
@@ -209,3 +209,11 @@ LOCATIONS = {
         "timezone": "Australia/Brisbane",
     },
 }
+
+
+def location_name(location_object):
+    """Name of a location object in LOCATIONS, None if it is not listed"""
+    for name, elt in LOCATIONS.items():
+        if elt == location_object:
+            return name
+    return None
@@ -0,0 +1,161 @@
+import os
+import zlib
+import importlib
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .services import BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC
+from .forecast import retrieve_index
+from .utils.numeric import to_number
+from .utils.grid import coarsest_cell
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0)) or os.cpu_count()
+# Locations handled by a worker per task, results arrive chunk by chunk
+CHUNK_SIZE = 8
+
+
+def pack_index(index):
+    """Compact form of an index, cheap to send between processes
+
+    Output:
+        {
+            "epoch_hours": array([440763, 440764]),
+            "temperatures": array([15.79, 15.84]),
+            "metadata": {"forecast_age_hours": 1, ...},
+            "changed": True
+        }
+    """
+    temperatures = index["temperatures"]
+    count = len(temperatures)
+    return {
+        "epoch_hours": np.fromiter(temperatures, dtype=np.int64, count=count),
+        "temperatures": np.fromiter(
+            (float(elt) for elt in temperatures.values()),
+            dtype=np.float64,
+            count=count,
+        ),
+        "metadata": index["metadata"],
+        "changed": index["changed"],
+    }
+
+
+def unpack_index(packed):
+    """Index from its compact form, as returned by retrieve_index()
+    Decimals come back from their shortest representation, which is exact
+    for the temperatures published by the services
+    """
+    epoch_hours = packed["epoch_hours"].tolist()
+    values = [to_number(repr(elt)) for elt in packed["temperatures"].tolist()]
+    return {
+        "metadata": packed["metadata"],
+        "temperatures": dict(zip(epoch_hours, values)),
+        "changed": packed["changed"],
+    }
+
+
+def index_shard(service_names, locations):
+    """Runs in a worker process: retrieves and indexes every service for
+    every location, parsing included
+
+    Input:
+        ["pyweather.api.met", "pyweather.api.yrno"]
+        [("SYDNEY", {...}), ("MELBOURNE", {...})]
+
+    Output:
+        [("SYDNEY", "pyweather.api.met", packed index or None), ...]
+    """
+    services = [importlib.import_module(elt) for elt in service_names]
+    results = []
+    for location_name, location_object in locations:
+        for service in services:
+            try:
+                index = retrieve_index(service, location_object)
+            except Exception as e:
+                print(f"{service.__name__} ({location_name}):")
+                print(e)
+                index = None
+            packed = pack_index(index) if index is not None else None
+            results.append((location_name, service.__name__, packed))
+    return results
+
+
+class ShardedExecutor:
+    """Retrieves the services' indexes in worker processes, so that parsing
+    the BOM HTML and Yr.no XML documents uses every core
+
+    Every location always lands on the same worker, whose response cache
+    then tells which documents changed, along with the other locations of
+    its grid cell so that they share their requests (see utils.grid). The
+    workers are kept across runs and only compact arrays are sent back
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or WORKER_PROCESSES
+        # A single-process pool per shard, as a ProcessPoolExecutor can't
+        # choose the process running a task
+        self._pools = [
+            ProcessPoolExecutor(max_workers=1) for _ in range(self.processes)
+        ]
+
+    def shard(self, location_object, service_names):
+        """Worker of a location, the one of its grid cell, stable across runs"""
+        cell = coarsest_cell(service_names, location_object["coordinates"])
+        cell = ",".join(str(float(elt)) for elt in cell)
+        return zlib.crc32(cell.encode("utf-8")) % self.processes
+
+    def indexes(
+        self, locations, services=[BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC]
+    ):
+        """Yields the indexes of every location as soon as its chunk completes
+
+        Input:
+            {"SYDNEY": {...}, "MELBOURNE": {...}}, as in LOCATIONS
+
+        Output:
+            ("SYDNEY", {"pyweather.api.met": {...}, "pyweather.api.yrno": {...}})
+            Services that could not be retrieved are left out
+        """
+        service_names = [service.__name__ for service in services]
+        shards = [[] for _ in range(self.processes)]
+        for location_name, location_object in locations.items():
+            shard = self.shard(location_object, service_names)
+            shards[shard].append((location_name, location_object))
+        futures = [
+            self._pools[i].submit(
+                index_shard, service_names, shard[start : start + CHUNK_SIZE]
+            )
+            for i, shard in enumerate(shards)
+            for start in range(0, len(shard), CHUNK_SIZE)
+        ]
+        for future in as_completed(futures):
+            indexed = {}
+            for location_name, service_name, packed in future.result():
+                location_indexed = indexed.setdefault(location_name, {})
+                if packed is not None:
+                    location_indexed[service_name] = unpack_index(packed)
+            yield from indexed.items()
+
+    def shutdown(self):
+        for pool in self._pools:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+
+
+def default_executor():
+    """ShardedExecutor shared by the whole process, with WORKER_PROCESSES
+    workers started on first use
+    """
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ShardedExecutor()
+        return _default_executor
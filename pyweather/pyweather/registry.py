@@ -0,0 +1,225 @@
+import math
+import heapq
+import threading
+import numpy as np
+from .locations import LOCATIONS
+
+EARTH_RADIUS_KM = 6371.0088
+# Points scanned at once at the bottom of the tree
+LEAF_SIZE = 16
+
+
+def to_unit_vectors(coordinates):
+    """Points of the unit sphere, where the straight-line distance grows
+    with the great-circle distance
+
+    Input:
+        [(-33.86, 151.21), (-37.83, 144.98)], (latitude, longitude)
+
+    Output:
+        Array of shape (2, 3)
+    """
+    radians = np.radians(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+    latitudes, longitudes = radians[:, 0], radians[:, 1]
+    return np.column_stack(
+        (
+            np.cos(latitudes) * np.cos(longitudes),
+            np.cos(latitudes) * np.sin(longitudes),
+            np.sin(latitudes),
+        )
+    )
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(distance_km):
+    angle = min(distance_km / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+class LocationRegistry:
+    """Locations indexed by their coordinates in a KD-tree, answering the
+    nearest and radius queries in logarithmic time
+
+    The tree is built over the unit-sphere points of the coordinates, so
+    the distances are great-circle ones, the antimeridian and poles included
+    """
+
+    def __init__(self, locations=LOCATIONS):
+        """
+        Input:
+            locations
+                {"SYDNEY": {"coordinates": (-33.86, 151.21), ...}}, as in
+                LOCATIONS or a LocationCatalog; tens of thousands of them
+                are fine
+        """
+        self.locations = locations
+        self.names = list(locations)
+        coordinates = getattr(locations, "coordinates", None)
+        if coordinates is None:
+            coordinates = [locations[name]["coordinates"] for name in self.names]
+        self.points = to_unit_vectors(coordinates)
+        self._build()
+
+    def _build(self):
+        """Median splits along the widest axis, every node keeping the
+        bounding box of its points
+        """
+        self._order = np.arange(len(self.names))
+        self._nodes = []  # [start, end, left, right]
+        lows, highs = [], []
+
+        def build(start, end):
+            node = len(self._nodes)
+            points = self.points[self._order[start:end]]
+            low, high = points.min(axis=0), points.max(axis=0)
+            self._nodes.append([start, end, -1, -1])
+            lows.append(low)
+            highs.append(high)
+            if end - start > LEAF_SIZE:
+                axis = int(np.argmax(high - low))
+                middle = (start + end) // 2
+                split = np.argpartition(points[:, axis], middle - start)
+                self._order[start:end] = self._order[start:end][split]
+                self._nodes[node][2] = build(start, middle)
+                self._nodes[node][3] = build(middle, end)
+            return node
+
+        if self.names:
+            build(0, len(self.names))
+        # Plain floats, faster than NumPy for 3 coordinates at a time
+        self._boxes = [
+            tuple(zip(low.tolist(), high.tolist())) for low, high in zip(lows, highs)
+        ]
+
+    def _bound(self, node, point):
+        """Smallest distance between a point and a node's bounding box"""
+        total = 0.0
+        for value, (low, high) in zip(point.tolist(), self._boxes[node]):
+            if value < low:
+                total += (low - value) ** 2
+            elif value > high:
+                total += (value - high) ** 2
+        return math.sqrt(total)
+
+    def _leaf_distances(self, start, end, point):
+        members = self._order[start:end]
+        differences = self.points[members] - point
+        return members, np.sqrt(np.einsum("ij,ij->i", differences, differences))
+
+    def _nearest(self, point, k):
+        """(chord, position) of the k nearest points, nearest first"""
+        best = []  # Max-heap of (-chord, position)
+        pending = [(0.0, 0)]  # Min-heap of (bound, node)
+        while pending:
+            bound, node = heapq.heappop(pending)
+            if len(best) == k and bound > -best[0][0]:
+                break
+            start, end, left, right = self._nodes[node]
+            if left == -1:
+                members, chords = self._leaf_distances(start, end, point)
+                for position, chord in zip(members.tolist(), chords.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-chord, position))
+                    elif chord < -best[0][0]:
+                        heapq.heapreplace(best, (-chord, position))
+                continue
+            for child in (left, right):
+                heapq.heappush(pending, (self._bound(child, point), child))
+        return sorted((-chord, position) for chord, position in best)
+
+    def nearest(self, latitude, longitude, k=1):
+        """The k locations nearest to a point
+
+        Output:
+            [("SYDNEY", 3.2), ("WOLLONGONG", 68.1)], (name, distance in km)
+        """
+        if not self.names:
+            return []
+        point = to_unit_vectors([(latitude, longitude)])[0]
+        return [
+            (self.names[position], float(chord_to_km(chord)))
+            for chord, position in self._nearest(point, k)
+        ]
+
+    def within(self, latitude, longitude, radius_km):
+        """Locations within a radius of a point, nearest first
+
+        Output:
+            [("SYDNEY", 3.2), ("WOLLONGONG", 68.1)], (name, distance in km)
+        """
+        if not self.names:
+            return []
+        point = to_unit_vectors([(latitude, longitude)])[0]
+        radius = km_to_chord(radius_km)
+        found = []
+        pending = [0]
+        while pending:
+            node = pending.pop()
+            if self._bound(node, point) > radius:
+                continue
+            start, end, left, right = self._nodes[node]
+            if left == -1:
+                members, chords = self._leaf_distances(start, end, point)
+                inside = chords <= radius
+                found.extend(zip(chords[inside].tolist(), members[inside].tolist()))
+            else:
+                pending.extend((left, right))
+        return [
+            (self.names[position], float(chord_to_km(chord)))
+            for chord, position in sorted(found)
+        ]
+
+    def resolve(self, latitude, longitude, max_distance_km=None):
+        """Location object serving a point: the nearest location's BOM page,
+        Accuweather key and timezone, with the point's own coordinates
+        Returns None when no location is within `max_distance_km`
+
+        Output:
+            {
+                "name": "SYDNEY",
+                "distance_km": 3.2,
+                "accuweather_location_key": 12481,
+                "bom.gov.au": "http://www.bom.gov.au/places/nsw/sydney/...",
+                "coordinates": (-33.87, 151.18),
+                "timezone": "Australia/Sydney"
+            }
+        """
+        nearest = self.nearest(latitude, longitude, k=1)
+        if not nearest:
+            return None
+        name, distance_km = nearest[0]
+        if max_distance_km is not None and distance_km > max_distance_km:
+            return None
+        return {
+            "name": name,
+            "distance_km": distance_km,
+            **self.locations[name],
+            "coordinates": (latitude, longitude),
+        }
+
+    def resolve_many(self, coordinates, max_distance_km=None):
+        """Same as resolve(), for a catalog of points
+
+        Input:
+            [(-33.87, 151.18), (-37.81, 144.96)]
+        """
+        return [
+            self.resolve(latitude, longitude, max_distance_km)
+            for latitude, longitude in coordinates
+        ]
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def default_registry():
+    """LocationRegistry of LOCATIONS, built on first use"""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = LocationRegistry()
+        return _default_registry
@@ -0,0 +1,222 @@
+import os
+import heapq
+import random
+import threading
+import pendulum
+from concurrent.futures import ThreadPoolExecutor, wait
+from .services import BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC
+from .utils.settings import parse_service_values, service_key
+from .forecast import retrieve_index
+from .utils.time import utc_string_to_utc_datetime
+
+# Hours between two runs of each service, when it can't be observed
+DEFAULT_CADENCES = {
+    "BOM": 3,
+    "MET": 1,
+    "YRNO": 6,
+    "ACCUWEATHER": 1,
+    "WEATHERCOM": 1,
+    "GWC": 3,
+    "AERIS": 1,
+}
+SERVICE_CADENCES = {
+    **DEFAULT_CADENCES,
+    **parse_service_values(os.getenv("SERVICE_CADENCES", "")),
+}
+# Maximum random delay added to every fetch, so they don't all land at once
+SCHEDULER_JITTER_SECONDS = int(os.getenv("SCHEDULER_JITTER_SECONDS", 300))
+# Delay between a run being issued and its forecasts being served
+PUBLICATION_DELAY_SECONDS = 5 * 60
+# Delay before checking again for a run that is late, or after a failure
+RETRY_SECONDS = 15 * 60
+
+
+def issue_timestamp(issue_time):
+    """
+    Input:
+        '2020-04-11T09:00:00Z'
+        None
+
+    Output:
+        1586595600
+        None
+    """
+    if not issue_time:
+        return None
+    return utc_string_to_utc_datetime(issue_time).int_timestamp
+
+
+class Scheduler:
+    """Long-running scheduler fetching every (service, location) only when
+    new forecasts are likely to be available
+
+    Every pair is due again at its announced next issue time (Yr.no), at its
+    last issue time plus its cadence when the service tells its issue time
+    (MET), or after its configured cadence otherwise. Cadences are learnt
+    from the interval between the issue times observed
+    """
+
+    def __init__(
+        self,
+        locations,
+        services=[BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC],
+        on_index=None,
+        max_workers=4,
+        cadences=None,
+        jitter_seconds=SCHEDULER_JITTER_SECONDS,
+        retriever=retrieve_index,
+    ):
+        """
+        Input:
+            locations
+                {"SYDNEY": {...}, "MELBOURNE": {...}}, as in LOCATIONS
+            on_index (optional)
+                Called with (location_name, service_name, index) after every
+                successful fetch, e.g. to feed a HistoryWriter
+            cadences (optional)
+                {"BOM": 3}, hours, defaults to SERVICE_CADENCES
+            retriever (optional)
+                Called with (service, location_object) instead of
+                retrieve_index(), e.g. CoordinatedRetriever.retrieve_index
+                to share the fetches with other nodes
+        """
+        self.locations = locations
+        self.services = {service.__name__: service for service in services}
+        self.on_index = on_index
+        self.max_workers = max_workers
+        self.cadences = {**SERVICE_CADENCES, **(cadences or {})}
+        self.jitter_seconds = jitter_seconds
+        self.retriever = retriever
+        self.states = {}
+        self._timetable = []
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        now = pendulum.now().int_timestamp
+        for location_name in locations:
+            for service_name in self.services:
+                self.states[(service_name, location_name)] = {
+                    "issued_at": None,
+                    "cadence": self.cadences.get(service_key(service_name), 1) * 3600,
+                    "failures": 0,
+                }
+                # Spreading the first fetches too
+                self.schedule(service_name, location_name, now + self.jitter())
+
+    def jitter(self):
+        return random.uniform(0, self.jitter_seconds)
+
+    def schedule(self, service_name, location_name, due):
+        with self._condition:
+            heapq.heappush(self._timetable, (due, service_name, location_name))
+            self._condition.notify()
+
+    def timetable(self):
+        """Upcoming fetches, soonest first
+
+        Output:
+            [("2020-04-11T09:04:12Z", "pyweather.api.met", "SYDNEY"), ...]
+        """
+        with self._condition:
+            entries = sorted(self._timetable)
+        return [
+            (
+                pendulum.from_timestamp(due).format("YYYY-MM-DDTHH:mm:ss[Z]"),
+                service_name,
+                location_name,
+            )
+            for due, service_name, location_name in entries
+        ]
+
+    def next_due(self, state, metadata, now):
+        """Timestamp of the next fetch of a (service, location), before jitter"""
+        next_issued_at = issue_timestamp(metadata.get("forecast_next_issue_time"))
+        if next_issued_at is not None:
+            due = next_issued_at + PUBLICATION_DELAY_SECONDS
+        elif state["issued_at"] is not None:
+            due = state["issued_at"] + state["cadence"] + PUBLICATION_DELAY_SECONDS
+        else:
+            due = now + state["cadence"]
+        if due <= now:
+            # The next run is late, checking again soon
+            due = now + min(RETRY_SECONDS, state["cadence"])
+        return due
+
+    def update(self, service_name, location_name, index, now):
+        """Updates the state of a (service, location) from its latest index
+        and returns the timestamp of its next fetch
+        """
+        state = self.states[(service_name, location_name)]
+        if index is None:
+            state["failures"] += 1
+            backoff = RETRY_SECONDS * 2 ** (state["failures"] - 1)
+            return now + min(backoff, max(state["cadence"], RETRY_SECONDS))
+        state["failures"] = 0
+
+        metadata = index["metadata"]
+        issued_at = issue_timestamp(metadata.get("forecast_issue_time"))
+        if issued_at is not None:
+            if state["issued_at"] is not None and issued_at > state["issued_at"]:
+                state["cadence"] = issued_at - state["issued_at"]
+            state["issued_at"] = issued_at
+        return self.next_due(state, metadata, now)
+
+    def fetch(self, service_name, location_name):
+        """Fetches a (service, location) and schedules its next fetch"""
+        try:
+            index = self.retriever(
+                self.services[service_name], self.locations[location_name]
+            )
+        except Exception as e:
+            # Such as a missing API key or a connection error, retried later
+            print(f"{service_name} ({location_name}):")
+            print(e)
+            index = None
+        if index is not None and self.on_index is not None:
+            self.on_index(location_name, service_name, index)
+        now = pendulum.now().int_timestamp
+        due = self.update(service_name, location_name, index, now)
+        self.schedule(service_name, location_name, due + self.jitter())
+        return index
+
+    def pop_due(self, now):
+        """Removes and returns the (service, location) pairs that are due"""
+        due = []
+        with self._condition:
+            while self._timetable and self._timetable[0][0] <= now:
+                _, service_name, location_name = heapq.heappop(self._timetable)
+                due.append((service_name, location_name))
+        return due
+
+    def run_pending(self, executor=None):
+        """Fetches all the (service, location) pairs that are due"""
+        due = self.pop_due(pendulum.now().int_timestamp)
+        if executor is None:
+            for service_name, location_name in due:
+                self.fetch(service_name, location_name)
+        else:
+            wait([executor.submit(self.fetch, *elt) for elt in due])
+        return len(due)
+
+    def run(self):
+        """Runs until stop() is called"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                with self._condition:
+                    if self._stopped:
+                        return
+                    if self._timetable:
+                        delay = self._timetable[0][0] - pendulum.now().int_timestamp
+                    else:
+                        delay = None
+                    if delay is None or delay > 0:
+                        self._condition.wait(timeout=delay)
+                        continue
+                # Every fetch schedules the next one once it completes
+                for due in self.pop_due(pendulum.now().int_timestamp):
+                    executor.submit(self.fetch, *due)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
@@ -0,0 +1,460 @@
+"""Local HTTP/JSON forecast server
+
+    python -m pyweather.serve --port 8080
+
+    GET /forecast?location=SYDNEY&time=2020-04-14T13:00
+    GET /hourly?location=SYDNEY&start=2020-04-14T13:00&hours=12
+    GET /hourly?location=SYDNEY&start=2020-04-14T13:00&end=2020-04-14T18:00
+    GET /multi?locations=SYDNEY,MELBOURNE&start=2020-04-14T13:00&hours=12
+    GET /changes?locations=SYDNEY,MELBOURNE  (server-sent events)
+
+Times are local to each location. Forecasts are served from the materialized
+view, which is refreshed when older than SERVER_REFRESH_SECONDS
+"""
+import os
+import json
+import asyncio
+import argparse
+import threading
+import pendulum
+from urllib.parse import urlsplit, parse_qsl
+from . import services as services_module
+from .services import BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC
+from .locations import LOCATIONS
+from .catalog import default_locations
+from .forecast import retrieve_index
+from .views import MaterializedView
+from .scheduler import Scheduler
+from .leases import CoordinatedRetriever, default_lease_store
+from .utils.time import (
+    hour_grid,
+    hours_between_datetimes,
+    local_string_to_target_keys,
+)
+from .utils.numeric import to_output
+from .utils.responses import content_hash
+
+SERVER_REFRESH_SECONDS = int(os.getenv("SERVER_REFRESH_SECONDS", 600))
+CACHED_RESPONSES = 1024
+# Longest range of hours a query may ask for, the horizon of the services
+MAX_QUERY_HOURS = 240
+# Seconds between two comments keeping an idle change stream open
+HEARTBEAT_SECONDS = 15
+# Changes kept for a slow client, the oldest being dropped first
+CHANGES_QUEUE_SIZE = 1000
+
+REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class BadQuery(Exception):
+    """The query is missing a parameter or has an invalid one"""
+
+    pass
+
+
+class UnknownEndpoint(Exception):
+    """No endpoint at this path"""
+
+    pass
+
+
+def to_json(value):
+    if hasattr(value, "is_nan"):  # Decimal
+        return float(value)
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+class ForecastServer:
+    """Answers the queries from a MaterializedView, refreshing a location's
+    services when they are older than `refresh_seconds`
+
+    Concurrent refreshes of a location and concurrent identical queries are
+    coalesced, and responses are cached until the locations they cover change
+    """
+
+    def __init__(
+        self,
+        locations=LOCATIONS,
+        services=[BOM, MET, ACCUWEATHER, YRNO, WEATHERCOM, GWC],
+        view=None,
+        refresh_seconds=SERVER_REFRESH_SECONDS,
+        retriever=retrieve_index,
+    ):
+        self.locations = locations
+        self.services = services
+        self.view = view or MaterializedView()
+        self.refresh_seconds = refresh_seconds
+        self.retriever = retriever
+        self.refreshed_at = {}
+        # {location_name: {service_name: timestamp}}, fetched by a Scheduler
+        self.service_refreshed_at = {}
+        self._refreshed_lock = threading.Lock()
+        self._refreshing = {}
+        self._inflight = {}
+        self._responses = {}
+
+    # Refreshing
+
+    async def refresh(self, location_name):
+        """Fetches all the services of a location, once at a time"""
+        task = self._refreshing.get(location_name)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(location_name))
+            self._refreshing[location_name] = task
+            task.add_done_callback(
+                lambda _: self._refreshing.pop(location_name, None)
+            )
+        await task
+
+    async def _refresh(self, location_name):
+        loop = asyncio.get_running_loop()
+        location_object = self.locations[location_name]
+        indexes = await asyncio.gather(
+            *[
+                loop.run_in_executor(None, self.retriever, service, location_object)
+                for service in self.services
+            ],
+            return_exceptions=True,
+        )
+        for service, index in zip(self.services, indexes):
+            if isinstance(index, Exception):
+                print(f"{service.__name__} ({location_name}):")
+                print(index)
+            elif index is not None:
+                self.view.update(location_name, service.__name__, index)
+        self.refreshed_at[location_name] = pendulum.now().int_timestamp
+
+    def service_refreshed(self, location_name, service_name, index):
+        """Scheduler callback: updates the view with a service's index
+        The location only counts as refreshed once all its services have
+        reported, as of the oldest of them
+        """
+        self.view.update(location_name, service_name, index)
+        with self._refreshed_lock:
+            timestamps = self.service_refreshed_at.setdefault(location_name, {})
+            timestamps[service_name] = pendulum.now().int_timestamp
+            if all(elt.__name__ in timestamps for elt in self.services):
+                self.refreshed_at[location_name] = min(timestamps.values())
+
+    async def ensure_fresh(self, location_names):
+        now = pendulum.now().int_timestamp
+        stale = [
+            elt
+            for elt in location_names
+            if now - self.refreshed_at.get(elt, 0) >= self.refresh_seconds
+        ]
+        if stale:
+            await asyncio.gather(*[self.refresh(elt) for elt in stale])
+
+    # Queries
+
+    def location_names(self, query, key):
+        if key not in query:
+            raise BadQuery(f"Missing parameter: {key}")
+        names = [elt.strip().upper() for elt in query[key].split(",") if elt.strip()]
+        if not names:
+            raise BadQuery(f"Missing parameter: {key}")
+        unknown = [elt for elt in names if elt not in self.locations]
+        if unknown:
+            raise BadQuery(f"Unknown locations: {', '.join(unknown)}")
+        return names
+
+    def hour_forecast(self, location_name, epoch_hour, snapshot=None):
+        """Statistics and services' temperatures of a location for an hour
+
+        Input:
+            snapshot (optional)
+                The view's snapshot of the location, taken if not given
+        """
+        if snapshot is None:
+            snapshot = self.view.snapshot(location_name)
+        services = {}
+        for service_name, index in snapshot["indexed"].items():
+            temperature = index["temperatures"].get(epoch_hour)
+            if temperature is not None:
+                services[service_name] = to_output(temperature)
+        return {
+            "aggregated": snapshot["aggregates"].get(epoch_hour),
+            "services": services,
+        }
+
+    def query_hours(self, query):
+        """Number of hours of a range query, at most MAX_QUERY_HOURS"""
+        if "start" not in query:
+            raise BadQuery("Missing parameter: start")
+        if query.get("end"):
+            hours = hours_between_datetimes(
+                start=pendulum.parse(query["start"]), end=pendulum.parse(query["end"])
+            )
+        else:
+            hours = int(query.get("hours", 24))
+        if not 0 <= hours <= MAX_QUERY_HOURS:
+            raise BadQuery(f"The range must be of 0 to {MAX_QUERY_HOURS} hours")
+        return hours
+
+    def range_forecast(self, location_name, query, snapshot=None):
+        hours = self.query_hours(query)
+        grid = hour_grid(
+            timezone=self.locations[location_name]["timezone"],
+            time_local_start=query["start"],
+            next_n_hours=hours,
+        )
+        if snapshot is None:
+            snapshot = self.view.snapshot(location_name)
+        return {
+            local_string: self.hour_forecast(location_name, epoch_hour, snapshot)
+            for local_string, epoch_hour in zip(grid.local_strings, grid.epoch_hours)
+        }
+
+    def query_locations(self, path, query):
+        """Locations covered by a query, once its parameters are checked"""
+        if path == "/forecast":
+            names = self.location_names(query, "location")[:1]
+            if "time" not in query:
+                raise BadQuery("Missing parameter: time")
+            return names
+        if path == "/hourly":
+            names = self.location_names(query, "location")[:1]
+            self.query_hours(query)
+            return names
+        if path == "/multi":
+            names = self.location_names(query, "locations")
+            self.query_hours(query)
+            return names
+        raise UnknownEndpoint(path)
+
+    def build_answer(self, path, query, snapshots):
+        """Body of a checked query, built from the view's snapshots of its
+        locations, as the scheduler's threads may update the view meanwhile
+        """
+        if path == "/forecast":
+            (location_name,) = snapshots
+            epoch_hour = local_string_to_target_keys(
+                time_local=query["time"],
+                timezone=self.locations[location_name]["timezone"],
+            )["epoch_hour"]
+            return {
+                "location": location_name,
+                "time": query["time"],
+                **self.hour_forecast(
+                    location_name, epoch_hour, snapshots[location_name]
+                ),
+            }
+        if path == "/hourly":
+            (location_name,) = snapshots
+            return {
+                "location": location_name,
+                "forecasts": self.range_forecast(
+                    location_name, query, snapshots[location_name]
+                ),
+            }
+        return {
+            "forecasts": {
+                elt: self.range_forecast(elt, query, snapshot)
+                for elt, snapshot in snapshots.items()
+            }
+        }
+
+    async def answer(self, path, query):
+        """Returns the body of a query"""
+        names = self.query_locations(path, query)
+        await self.ensure_fresh(names)
+        snapshots = {elt: self.view.snapshot(elt) for elt in names}
+        return self.build_answer(path, query, snapshots)
+
+    async def respond(self, path, query):
+        """Returns (body, etag), identical concurrent queries sharing the work"""
+        key = (path, tuple(sorted(query.items())))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._respond(key, path, query))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await task
+
+    async def _respond(self, key, path, query):
+        names = self.query_locations(path, query)
+        await self.ensure_fresh(names)
+        # Only the locations of the query invalidate its response
+        cached = self._responses.get(key)
+        if cached is not None and cached[0] == self.view.versions_of(names):
+            return cached[1], cached[2]
+        snapshots = {elt: self.view.snapshot(elt) for elt in names}
+        answer = self.build_answer(path, query, snapshots)
+        versions = tuple(
+            sorted((name, snapshot["version"]) for name, snapshot in snapshots.items())
+        )
+        body = json.dumps(answer, default=to_json).encode("utf-8")
+        etag = f'"{content_hash(body)}"'
+        if len(self._responses) >= CACHED_RESPONSES:
+            self._responses.clear()
+        self._responses[key] = (versions, body, etag)
+        return body, etag
+
+    # HTTP
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1").strip()
+                if not line:
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                method, target, _ = request_line.split(" ", 2)
+            except ValueError:
+                return await self.send(writer, 400, {"error": "Malformed request"})
+            if method != "GET":
+                return await self.send(writer, 405, {"error": "Only GET is allowed"})
+
+            url = urlsplit(target)
+            query = dict(parse_qsl(url.query))
+            try:
+                if url.path == "/changes":
+                    return await self.stream_changes(reader, writer, query)
+                body, etag = await self.respond(url.path, query)
+            except (BadQuery, ValueError) as e:
+                # Including the times and numbers that can't be parsed
+                return await self.send(writer, 400, {"error": str(e)})
+            except UnknownEndpoint:
+                return await self.send(writer, 404, {"error": "Unknown endpoint"})
+            except Exception as e:
+                return await self.send(writer, 500, {"error": str(e)})
+
+            if headers.get("if-none-match") == etag:
+                return await self.send(writer, 304, None, etag=etag)
+            await self.send(writer, 200, body, etag=etag)
+        finally:
+            writer.close()
+
+    async def stream_changes(self, reader, writer, query):
+        """Pushes the deltas of the view as server-sent events, until the
+        client disconnects
+        """
+        if "locations" in query:
+            location_names = set(self.location_names(query, "locations"))
+        else:
+            location_names = None
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=CHANGES_QUEUE_SIZE)
+
+        def enqueue(delta):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(delta)
+
+        def on_change(delta):
+            # Called from the thread updating the view
+            if location_names is None or delta["location"] in location_names:
+                loop.call_soon_threadsafe(enqueue, delta)
+
+        unsubscribe = self.view.subscribe(on_change)
+        # Completes when the client disconnects
+        closed = asyncio.ensure_future(reader.read())
+        try:
+            lines = [
+                "HTTP/1.1 200 OK",
+                "Content-Type: text/event-stream",
+                "Cache-Control: no-cache",
+                "Connection: keep-alive",
+            ]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, closed},
+                    timeout=HEARTBEAT_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter in done:
+                    data = json.dumps(getter.result(), default=to_json)
+                    writer.write(f"event: change\ndata: {data}\n\n".encode("utf-8"))
+                else:
+                    getter.cancel()
+                    if closed in done:
+                        return
+                    writer.write(b": heartbeat\n\n")
+                await writer.drain()
+        except ConnectionError:
+            # The client went away while being written to
+            pass
+        finally:
+            closed.cancel()
+            unsubscribe()
+
+    async def send(self, writer, status, body, etag=None):
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        lines = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body) if body else 0}",
+            "Cache-Control: no-cache",
+            "Connection: close",
+        ]
+        if etag:
+            lines.append(f"ETag: {etag}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if body:
+            writer.write(body)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pyweather forecast server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--services",
+        default="BOM,MET,ACCUWEATHER,YRNO,WEATHERCOM,GWC",
+        help="Comma-separated services, as in pyweather.services",
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store_true",
+        help="Keeps the forecasts up to date in the background with a Scheduler",
+    )
+    arguments = parser.parse_args()
+    services = [
+        getattr(services_module, elt.strip().upper())
+        for elt in arguments.services.split(",")
+    ]
+    store = default_lease_store()
+    if store is not None:
+        # Sharing the fetches with the other nodes using the same LEASE_STORE
+        retriever = CoordinatedRetriever(store).retrieve_index
+    else:
+        retriever = retrieve_index
+    server = ForecastServer(
+        locations=default_locations(), services=services, retriever=retriever
+    )
+    if arguments.schedule:
+        scheduler = Scheduler(
+            server.locations,
+            services,
+            on_index=server.service_refreshed,
+            retriever=retriever,
+        )
+        threading.Thread(target=scheduler.run, daemon=True).start()
+    print(f"Serving on http://{arguments.host}:{arguments.port}")
+    asyncio.run(server.serve(arguments.host, arguments.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,4 +6,15 @@ ACCUWEATHER = api.accuweather
 YRNO = api.yrno
 WEATHERCOM = api.weathercom
 GWC = api.gwc
-AERIS = api.aeris
\ No newline at end of file
+AERIS = api.aeris
+
+# Every service by name, as accepted on the command line
+SERVICES = {
+    "BOM": BOM,
+    "MET": MET,
+    "ACCUWEATHER": ACCUWEATHER,
+    "YRNO": YRNO,
+    "WEATHERCOM": WEATHERCOM,
+    "GWC": GWC,
+    "AERIS": AERIS,
+}
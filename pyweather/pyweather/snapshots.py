@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+import pendulum
+from .history import issue_time_to_timestamp
+from .utils.time import local_string_to_target_keys, epoch_hour_to_utc_string
+from .utils.numeric import to_output
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    location TEXT NOT NULL,
+    target_time INTEGER NOT NULL,
+    service TEXT NOT NULL,
+    fetched_at INTEGER NOT NULL,
+    issued_at INTEGER,
+    temperature REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_by_location_target_time
+    ON snapshots (location, target_time, service, fetched_at, temperature, issued_at);
+DROP INDEX IF EXISTS snapshots_by_service_fetched_at;
+CREATE INDEX IF NOT EXISTS snapshots_by_service_fetched_at_covering
+    ON snapshots (service, fetched_at, location, target_time, issued_at, temperature);
+"""
+
+
+class SnapshotStore:
+    """SQLite store of the forecast snapshots, in WAL mode
+
+    Every row is a temperature forecast by a service for a location and a
+    target time (epoch hour), fetched at a given time (timestamp).
+    The covering indexes answer the point and range queries without reading
+    the table
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def insert_many(self, rows):
+        """Inserts the rows in a single transaction
+
+        Input:
+            [
+                ("SYDNEY", 440721, "pyweather.api.met", 1586600000, 1586595600, 17.81),
+            ]
+            (location, target_time, service, fetched_at, issued_at, temperature)
+        """
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def latest(self, location_name, target_time):
+        """Latest forecast of every service for a location and target time
+
+        Input:
+            location_name
+                'SYDNEY'
+            target_time
+                Epoch hour
+
+        Output:
+            {
+                "pyweather.api.met": {
+                    "time_utc": "2020-04-11T09:00:00Z",
+                    "temperature_celcius": Decimal("17.81"),
+                    "fetched_at": 1586600000,
+                    "issued_at": 1586595600
+                },
+            }
+        """
+        with self._lock:
+            rows = self.connection.execute(
+                """
+                SELECT service, MAX(fetched_at), temperature, issued_at
+                FROM snapshots
+                WHERE location = ? AND target_time = ?
+                GROUP BY service
+                """,
+                (location_name, target_time),
+            ).fetchall()
+        return {
+            service: {
+                "time_utc": epoch_hour_to_utc_string(target_time),
+                "temperature_celcius": to_output(temperature),
+                "fetched_at": fetched_at,
+                "issued_at": issued_at,
+            }
+            for service, fetched_at, temperature, issued_at in rows
+        }
+
+    def latest_local(self, location_name, timezone, target_local_time):
+        """Same as latest(), for a local time
+
+        Input:
+            'SYDNEY', 'Australia/Sydney', '2020-04-11T14:00'
+        """
+        target_time = local_string_to_target_keys(
+            time_local=target_local_time, timezone=timezone
+        )["epoch_hour"]
+        return self.latest(location_name, target_time)
+
+    def evolution(self, location_name, target_time, service_name):
+        """Every forecast of a service for a location and target time,
+        from the oldest fetch to the latest
+
+        Output:
+            [(fetched_at, issued_at, temperature), ...]
+        """
+        with self._lock:
+            return self.connection.execute(
+                """
+                SELECT fetched_at, issued_at, temperature
+                FROM snapshots
+                WHERE location = ? AND target_time = ? AND service = ?
+                ORDER BY fetched_at
+                """,
+                (location_name, target_time, service_name),
+            ).fetchall()
+
+    def fetched_between(self, service_name, start, end):
+        """Every snapshot of a service fetched within [start, end] (timestamps)
+
+        Output:
+            [(location, target_time, fetched_at, issued_at, temperature), ...]
+        """
+        with self._lock:
+            return self.connection.execute(
+                """
+                SELECT location, target_time, fetched_at, issued_at, temperature
+                FROM snapshots
+                WHERE service = ? AND fetched_at BETWEEN ? AND ?
+                """,
+                (service_name, start, end),
+            ).fetchall()
+
+    def writer(self):
+        return SnapshotWriter(self)
+
+    def close(self):
+        self.connection.close()
+
+
+class SnapshotWriter:
+    """Collects the snapshots of a run and commits them all at once"""
+
+    def __init__(self, store):
+        self.store = store
+        self.rows = []
+
+    def append_indexed(self, location_name, indexed, fetched_at=None):
+        """Appends the indexed documents of a location
+
+        Input:
+            location_name
+                'SYDNEY'
+            indexed
+                {service_name: index}, as in HourlyForecast.indexed
+        Skips the documents that did not change since the last fetch
+        """
+        if fetched_at is None:
+            fetched_at = pendulum.now().int_timestamp
+        for service_name, index in indexed.items():
+            if not index.get("changed", True):
+                continue
+            issued_at = issue_time_to_timestamp(
+                index["metadata"].get("forecast_issue_time")
+            )
+            issued_at = None if issued_at == -1 else issued_at
+            self.rows.extend(
+                (
+                    location_name,
+                    target_time,
+                    service_name,
+                    fetched_at,
+                    issued_at,
+                    float(temperature),
+                )
+                for target_time, temperature in index["temperatures"].items()
+            )
+
+    def append_hourly_forecast(self, location_name, hourly_forecast, fetched_at=None):
+        """Appends all the forecasts fetched by an HourlyForecast object"""
+        self.append_indexed(location_name, hourly_forecast.indexed, fetched_at)
+
+    def commit(self):
+        """Inserts the collected snapshots in a single transaction"""
+        rows, self.rows = self.rows, []
+        if rows:
+            self.store.insert_many(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.commit()
@@ -1,15 +1,15 @@
-from decimal import Decimal
+from .numeric import to_number, number
 
 
 def farenheit_to_celcius(temperature):
     """Converts a farenheit temperature to celcius
     """
-    temperature = str(temperature)
-    return (Decimal(temperature) - Decimal("32")) * (Decimal("5") / Decimal("9"))
+    temperature = to_number(temperature)
+    return (temperature - number("32")) * (number("5") / number("9"))
 
 
 def celcius_to_farenheit(temperature):
     """Converts a celcius temperature to farenheit
     """
-    temperature = str(temperature)
-    return (Decimal(temperature) * (Decimal("9") / Decimal("5"))) + Decimal("32")
\ No newline at end of file
+    temperature = to_number(temperature)
+    return (temperature * (number("9") / number("5"))) + number("32")
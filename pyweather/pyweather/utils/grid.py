@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from .settings import parse_service_values, service_key
+
+# Degrees between two query points of the services queried by coordinates,
+# finer than the models they serve Australia with. 0 disables the snapping
+DEFAULT_GRID_DEGREES = {
+    "MET": 0.05,
+    "YRNO": 0.05,
+    "WEATHERCOM": 0.05,
+    "GWC": 0.05,
+    "AERIS": 0.05,
+}
+GRID_DEGREES = {
+    **DEFAULT_GRID_DEGREES,
+    **parse_service_values(os.getenv("GRID_DEGREES", "")),
+}
+# Seconds a response is shared with the other locations of its grid cell
+SHARED_RESPONSE_SECONDS = 60
+
+# {(service_name, cell coordinates, part): (fetched_at, response, locations)}
+_responses = {}
+# {key: [lock, number of callers using it]}, dropped with the responses
+_locks = {}
+_lock = threading.Lock()
+
+
+def snap(service_name, coordinates):
+    """Query point of the grid cell containing the coordinates
+
+    Input:
+        'pyweather.api.met', (-33.86, 151.21)
+
+    Output:
+        (-33.85, 151.2)
+    """
+    return _snap_to(GRID_DEGREES.get(service_key(service_name), 0), coordinates)
+
+
+def _snap_to(step, coordinates):
+    if not step:
+        return tuple(coordinates)
+    return tuple(round(round(elt / step) * step, 6) for elt in coordinates)
+
+
+def coarsest_cell(service_names, coordinates):
+    """Cell of the coarsest grid among the services, which holds the
+    query points of the other services for the coordinates when their
+    grids are multiples of each other (as the default ones)
+
+    Input:
+        ['pyweather.api.met', 'pyweather.api.yrno'], (-33.86, 151.21)
+
+    Output:
+        (-33.85, 151.2)
+    """
+    step = max(
+        (GRID_DEGREES.get(service_key(elt), 0) for elt in service_names), default=0
+    )
+    return _snap_to(step, coordinates)
+
+
+def fetch_shared(service_name, location_object, request, part=""):
+    """Calls `request()` once for all the locations of a grid cell
+    Concurrent calls for the same cell wait for the first one. A successful
+    response is shared for SHARED_RESPONSE_SECONDS with the locations of
+    the cell that did not receive it yet; a location asking again gets a
+    new one
+
+    Input:
+        service_name
+            'pyweather.api.met'
+        location_object
+            {"coordinates": (-33.86, 151.21), ...}
+        request
+            Makes the request for the snapped coordinates, returns a
+            requests.Response
+        part (optional)
+            Distinguishes the requests of services calling several endpoints
+    """
+    coordinates = tuple(location_object["coordinates"])
+    key = (service_name, snap(service_name, coordinates), part)
+    with _lock:
+        holder = _locks.setdefault(key, [threading.Lock(), 0])
+        holder[1] += 1
+    try:
+        with holder[0]:
+            now = time.time()
+            shared = _responses.get(key)
+            if (
+                shared is not None
+                and now - shared[0] < SHARED_RESPONSE_SECONDS
+                and coordinates not in shared[2]
+            ):
+                shared[2].add(coordinates)
+                return shared[1]
+            response = request()
+            if response.ok:
+                with _lock:
+                    _evict(now)
+                    _responses[key] = (now, response, {coordinates})
+            return response
+    finally:
+        with _lock:
+            holder[1] -= 1
+            if not holder[1] and key not in _responses:
+                del _locks[key]
+
+
+def _evict(now):
+    """Drops the expired responses, and the locks of their cells unless a
+    caller is using them. Called with _lock held
+    """
+    for key in [
+        elt
+        for elt, (fetched_at, _, _) in _responses.items()
+        if now - fetched_at >= SHARED_RESPONSE_SECONDS
+    ]:
+        del _responses[key]
+        if not _locks[key][1]:
+            del _locks[key]
+
+
+def clear():
+    with _lock:
+        _responses.clear()
+        for key in [elt for elt, (_, users) in _locks.items() if not users]:
+            del _locks[key]
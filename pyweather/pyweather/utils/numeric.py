@@ -0,0 +1,73 @@
+import os
+import numpy as np
+from decimal import Decimal
+from ..exceptions import InvalidSetting
+
+DECIMAL_PLACES = int(os.getenv("DECIMAL_PLACES", 2))
+NUMERIC_BACKEND = os.getenv("NUMERIC_BACKEND", "decimal").strip().lower()
+
+BACKENDS = {
+    "decimal": np.float64,  # Exact values, the arrays are still float64
+    "float64": np.float64,
+    "float32": np.float32,
+}
+if NUMERIC_BACKEND not in BACKENDS:
+    raise InvalidSetting(
+        {
+            "setting": "NUMERIC_BACKEND",
+            "value": NUMERIC_BACKEND,
+            "allowed": list(BACKENDS),
+        }
+    )
+
+ARRAY_DTYPE = BACKENDS[NUMERIC_BACKEND]
+
+
+def to_number(value):
+    """Converts a temperature found in a response to the configured backend
+
+    Input:
+        "16"
+        15.8
+
+    Output:
+        Decimal("16"), Decimal("15.8") with NUMERIC_BACKEND = decimal
+        16.0, 15.8 with NUMERIC_BACKEND = float64 (or float32)
+    """
+    if NUMERIC_BACKEND == "decimal":
+        return value if isinstance(value, Decimal) else Decimal(str(value))
+    return ARRAY_DTYPE(value)
+
+
+def number(value):
+    """Converts a constant used in the computations to the configured backend
+
+    Input:
+        "32"
+
+    Output:
+        Decimal("32") or 32.0
+    """
+    if NUMERIC_BACKEND == "decimal":
+        return Decimal(value)
+    return ARRAY_DTYPE(value)
+
+
+def to_output(value):
+    """Rounds a temperature, only when it is output
+
+    Input:
+        Decimal("14.8333"), 14.8333
+
+    Output:
+        Decimal("14.83") with NUMERIC_BACKEND = decimal
+        14.83 with NUMERIC_BACKEND = float64 (or float32)
+        None for a missing (None or NaN) value
+    """
+    if value is None or (not isinstance(value, Decimal) and np.isnan(value)):
+        return None
+    if NUMERIC_BACKEND == "decimal":
+        if not isinstance(value, Decimal):
+            value = Decimal(repr(float(value)))
+        return round(value, DECIMAL_PLACES)
+    return round(float(value), DECIMAL_PLACES)
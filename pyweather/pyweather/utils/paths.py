@@ -0,0 +1,22 @@
+import os
+from pathlib import Path
+
+
+def cache_path(filename):
+    """Where the library keeps a file across runs: the cache directory of
+    PROJECT_PATH when set (next to its variables.env), ~/.cache/pyweather
+    otherwise. The directory is created if needed
+
+    Input:
+        'accuweather_keys.db'
+
+    Output:
+        PosixPath('/home/user/.cache/pyweather/accuweather_keys.db')
+    """
+    project_path = os.getenv("PROJECT_PATH")
+    if project_path:
+        directory = Path(project_path) / "cache"
+    else:
+        directory = Path.home() / ".cache" / "pyweather"
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / filename
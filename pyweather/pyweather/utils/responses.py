@@ -0,0 +1,129 @@
+import hashlib
+import threading
+
+_entries = {}
+# Derived values shared by the locations of a grid cell receiving the same
+# responses: {(service_name, cell, timezone): (digests, derived)}
+_shared = {}
+_lock = threading.Lock()
+
+
+def _key(service_name, location_object):
+    return service_name, tuple(location_object["coordinates"])
+
+
+def _shared_derived(service_name, location_object, digests):
+    """Derived values of the locations of the same grid cell and timezone
+    whose last responses are the same
+    """
+    from .grid import snap
+
+    key = (
+        service_name,
+        snap(service_name, location_object["coordinates"]),
+        location_object.get("timezone"),
+    )
+    digests = tuple(sorted(digests.items()))
+    shared = _shared.get(key)
+    if shared is None or shared[0] != digests:
+        shared = _shared[key] = (digests, {})
+    return shared[1]
+
+
+def content_hash(content):
+    """
+    Input:
+        b'{"features": ...}'
+
+    Output:
+        '5f1d3c0a8b2e4f6a9c7d1e3b5a7f9c2d'
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def record_response(service_name, location_object, content, part=""):
+    """Records the hash of a raw response
+    Returns True when it differs from the last one for this service and
+    location, in which case everything derived from the previous response
+    is dropped
+    Locations of the same grid cell receiving the same responses share
+    their derived values, each one keeping track of its own changes
+    Also archives the response when RESPONSE_ARCHIVE is set
+
+    Input:
+        service_name
+            'pyweather.api.met'
+        location_object
+            {"coordinates": (-33.86, 151.21), ...}
+        content
+            Raw body of the response
+        part (optional)
+            Distinguishes the responses of services calling several endpoints
+    """
+    from ..archive import default_archive
+
+    try:
+        archive = default_archive()
+        if archive is not None:
+            # Compressed and written in the background
+            archive.submit(service_name, location_object, content, part=part)
+    except Exception as e:
+        # Losing an archived response must not lose the forecast
+        print(f"Archive ({service_name}):")
+        print(e)
+
+    digest = content_hash(content)
+    key = _key(service_name, location_object)
+    with _lock:
+        entry = _entries.setdefault(
+            key, {"digests": {}, "derived": {}, "returned": set()}
+        )
+        if entry["digests"].get(part) == digest:
+            return False
+        entry["digests"][part] = digest
+        entry["derived"] = _shared_derived(
+            service_name, location_object, entry["digests"]
+        )
+        entry["returned"] = set()
+        return True
+
+
+def derive(service_name, location_object, stage, compute):
+    """Returns the value derived from the last recorded responses at
+    `stage`, computing it only when missing
+
+    Output:
+        (value, new)
+        new is True the first time the value is returned for this location
+        since its responses changed, even when it was derived for another
+        location of its grid cell
+    """
+    key = _key(service_name, location_object)
+    with _lock:
+        entry = _entries.get(key)
+        derived = entry["derived"] if entry is not None else None
+        if derived is not None and stage in derived:
+            new = stage not in entry["returned"]
+            entry["returned"].add(stage)
+            return derived[stage], new
+    value = compute()
+    if derived is not None:
+        with _lock:
+            # Unless the responses changed in the meantime
+            if entry["derived"] is derived:
+                derived.setdefault(stage, value)
+                entry["returned"].add(stage)
+    return value, True
+
+
+def cached(service_name, location_object, stage, compute):
+    """Same as derive(), returning the value only"""
+    return derive(service_name, location_object, stage, compute)[0]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _shared.clear()
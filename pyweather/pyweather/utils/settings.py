@@ -0,0 +1,29 @@
+def service_key(service_name):
+    """Name of a service as found in pyweather.services
+
+    Input:
+        'pyweather.api.yrno'
+
+    Output:
+        'YRNO'
+    """
+    return service_name.rsplit(".", 1)[-1].upper()
+
+
+def parse_service_values(raw_string):
+    """Parses a number per service, as found in the environment variables
+    (SERVICE_WEIGHTS, SERVICE_CADENCES, GRID_DEGREES)
+
+    Input:
+        'MET=1.5, YRNO=0.8'
+
+    Output:
+        {"MET": 1.5, "YRNO": 0.8}
+    """
+    values = {}
+    for pair in raw_string.split(","):
+        if not pair.strip():
+            continue
+        service, value = pair.split("=")
+        values[service.strip().upper()] = float(value)
+    return values
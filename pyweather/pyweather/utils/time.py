@@ -1,3 +1,4 @@
+from functools import lru_cache
 import pendulum
 
 
@@ -53,6 +54,48 @@ def decaminutes_since_utc_datetime(then):
     return now.diff(then).in_minutes() / 10
 
 
+def datetime_to_epoch_hour(datetime_utc):
+    """Number of whole hours since the epoch, the internal time representation
+    used to match and index the forecasts
+
+    Input:
+        Pendulum datetime object
+
+    Output:
+        440721 (int)
+    """
+    return datetime_utc.int_timestamp // 3600
+
+
+@lru_cache(maxsize=65536)
+def iso_string_to_epoch_hour(raw_string):
+    """Cached parsing of the ISO 8601 strings found in the API responses
+
+    Input:
+        '2020-04-11T09:00Z'
+        '2020-04-11T09:00:00Z'
+        '2020-05-07T03:00:00+1000'
+        '2020-05-26T03:00:00+10:00'
+
+    Output:
+        440721 (int)
+    """
+    return datetime_to_epoch_hour(pendulum.parse(raw_string))
+
+
+@lru_cache(maxsize=65536)
+def epoch_hour_to_utc_string(epoch_hour):
+    """Formats an epoch hour at the output boundary
+
+    Input:
+        440721
+
+    Expected output:
+        '2020-04-11T09:00:00Z'
+    """
+    return format_standard(timestamp_to_utc_datetime(epoch_hour * 3600))
+
+
 def parse_bomgovau_raw_footer_string_to_utc_datetime(raw_string):
     """Takes an unstructured date string of the type and returns a structured string instead.
     For bom.gov.au
@@ -99,6 +142,31 @@ def parse_bomgovau_merge_date_as_dt_and_hour_as_string(
     return datetime_utc
 
 
+@lru_cache(maxsize=4096)
+def bomgovau_cell_to_epoch_hour(date_attribute, hour_string, target_timezone):
+    """Resolves a cell of the bom.gov.au tables to an epoch hour.
+    Cached, as the same hour labels repeat across days and across all the
+    locations sharing a timezone
+
+    Input:
+        date_attribute
+            'd2020-04-12'
+        hour_string
+            '1:00 AM'
+        target_timezone
+            'Australia/Sydney'
+
+    Expected output:
+        440727 (int)
+    """
+    date_dt = parse_bom_gov(date_attribute, target_timezone)
+    return datetime_to_epoch_hour(
+        parse_bomgovau_merge_date_as_dt_and_hour_as_string(
+            date_dt=date_dt, hour_string=hour_string, target_timezone=target_timezone
+        )
+    )
+
+
 def parse_bom_gov(date_attribute, timezone):
     """
     Input:
@@ -385,6 +453,26 @@ def normalize_gwc(raw_string):
     return stripped
 
 
+@lru_cache(maxsize=65536)
+def gwc_string_to_epoch_hour(raw_string, timezone):
+    """Parses the GWC dates as local dates in the target timezone
+
+    Input:
+        raw_string
+            'Tue May 12 23:00:00 EST 2020'
+
+        timezone
+            'Australia/Sydney'
+
+    Output:
+        441469 (int)
+    """
+    stripped = normalize_gwc(raw_string)
+    parsed = pendulum.from_format(stripped, "ddd MMM DD HH:mm:ss YYYY", tz=timezone)
+
+    return datetime_to_epoch_hour(parsed)
+
+
 def parse_gwc(raw_string, timezone):
     """Parses the GWC
 
@@ -402,3 +490,107 @@ def parse_gwc(raw_string, timezone):
     parsed = pendulum.from_format(stripped, "ddd MMM DD HH:mm:ss YYYY").in_tz(timezone)
 
     return parsed
+
+
+@lru_cache(maxsize=65536)
+def local_string_to_target_keys(time_local, timezone):
+    """Takes a local date as a string of the format:
+        '2020-04-11T09:00'
+    Returns the keys every service uses to find that hour in its documents.
+    Cached, so the keys are computed once per (hour, timezone) and shared by
+    all the services and all the locations within that timezone
+
+    Expected output:
+        {
+            "standard": '2020-04-10T23:00:00Z',
+            "met": '2020-04-10T23:00Z',
+            "yrno": ('2020-04-10T23:00:00Z', '2020-04-11T00:00:00Z'),
+            "accuweather": 1586559600,
+            "epoch_hour": 440711,
+            "weathercom": '2020-04-11T09:00:00+1000',
+            "aeris": '2020-04-11T09:00:00+10:00',
+            "gwc": 'Sat Apr 11 09:00:00 2020',
+        }
+    """
+    dt_local = pendulum.parse(time_local, tz=timezone)
+    dt_utc = dt_local.in_tz("UTC")
+    return {
+        "standard": format_standard(dt_utc),
+        "met": format_met(dt_utc),
+        "yrno": format_yrno(dt_utc),
+        "accuweather": format_accuweather(dt_utc),
+        "epoch_hour": datetime_to_epoch_hour(dt_utc),
+        "weathercom": dt_local.format("YYYY-MM-DDTHH:mm:ssZZ"),
+        "aeris": dt_local.format("YYYY-MM-DDTHH:mm:ssZ"),
+        "gwc": dt_local.format("ddd MMM DD HH:mm:ss YYYY"),
+    }
+
+
+class HourGrid:
+    """Range of local hours in a single timezone, along with the UTC epochs,
+    epoch hours and every service's keys for each of these hours
+    """
+
+    def __init__(self, timezone, local_strings):
+        self.timezone = timezone
+        self.local_strings = tuple(local_strings)
+        self.keys = tuple(
+            local_string_to_target_keys(time_local=elt, timezone=timezone)
+            for elt in self.local_strings
+        )
+        self.epochs_utc = tuple(elt["accuweather"] for elt in self.keys)
+        self.epoch_hours = tuple(elt["epoch_hour"] for elt in self.keys)
+        self.positions = {elt: i for i, elt in enumerate(self.local_strings)}
+
+    def __len__(self):
+        return len(self.local_strings)
+
+    def __iter__(self):
+        return iter(self.local_strings)
+
+    def keys_for(self, time_local):
+        """Returns the services' keys for a local hour of the grid"""
+        return self.keys[self.positions[time_local]]
+
+    def formatted(self, key):
+        """Returns a single service's keys for all the hours of the grid
+
+        Input:
+            "met"
+
+        Expected output:
+            ('2020-04-10T23:00Z', '2020-04-11T00:00Z', ...)
+        """
+        return tuple(elt[key] for elt in self.keys)
+
+
+@lru_cache(maxsize=256)
+def _cached_hour_grid(timezone, time_local_start, next_n_hours):
+    local_strings = local_string_to_range_of_local_strings(
+        time_local_start=time_local_start, next_n_hours=next_n_hours
+    )
+    return HourGrid(timezone=timezone, local_strings=local_strings)
+
+
+def hour_grid(timezone, time_local_start, time_local_end=None, next_n_hours=None):
+    """Returns the (cached) HourGrid of a range of local hours in a timezone
+    Input:
+        timezone = 'Australia/Sydney'
+        time_local_start = '2020-04-26T13:00'
+
+        End (optional):
+            time_local_end = '2020-04-26T16:00'
+
+        N-hours (optional):
+            next_n_hours = 6
+
+    Expected output:
+        HourGrid object, shared by every caller asking for the same range
+    """
+    if time_local_end:
+        next_n_hours = hours_between_datetimes(
+            start=pendulum.parse(time_local_start), end=pendulum.parse(time_local_end)
+        )
+    if not next_n_hours:
+        return HourGrid(timezone=timezone, local_strings=[])
+    return _cached_hour_grid(timezone, time_local_start, next_n_hours)
@@ -0,0 +1,241 @@
+import threading
+import pendulum
+from .aggregation import (
+    aggregate_cube,
+    indexes_to_cube,
+    indexes_to_ages,
+    age_weights,
+    weighted_average,
+    robust_statistics,
+    cell_statistics,
+)
+from .correction import default_corrections
+from .utils.time import local_string_to_target_keys, epoch_hour_to_utc_string
+from .utils.numeric import to_output
+
+
+def affected_hours(previous, index):
+    """Epoch hours whose statistics change when a service's index is replaced
+
+    Input:
+        previous
+            The service's previous index, None if there is none
+        index
+            Its new index
+
+    Output:
+        {440721, 440722}
+    """
+    if previous is None:
+        return set(index["temperatures"])
+    before, after = previous["temperatures"], index["temperatures"]
+    if previous["metadata"] != index["metadata"]:
+        # The weights of all the service's forecasts may have changed
+        return set(before) | set(after)
+    return {
+        hour
+        for hour in set(before) | set(after)
+        if before.get(hour) != after.get(hour)
+    }
+
+
+def statistics_delta(before, after):
+    """Statistics that differ between two versions of a cell
+
+    Output:
+        {"average": Decimal("14.62"), "count": 4}
+        None when the cell was removed
+    """
+    if after is None:
+        return None
+    before = before or {}
+    return {
+        name: value for name, value in after.items() if before.get(name) != value
+    }
+
+
+class MaterializedView:
+    """Statistics of every (location, epoch hour), kept up to date as the
+    services' documents change
+
+    Only the hours of a location affected by a change are recomputed, reads
+    are dictionary lookups. Feed it with HourlyForecast results or as the
+    on_index callback of a Scheduler
+
+    Subscribers are called with a compact delta after every change:
+        {
+            "location": "SYDNEY",
+            "service": "pyweather.api.met",
+            "aggregates": {
+                "2020-04-13T03:00:00Z": {"average": Decimal("14.62")},
+                "2020-04-10T03:00:00Z": None,  # No forecast anymore
+            },
+            "temperatures": {
+                "2020-04-13T03:00:00Z": Decimal("15.79"),
+            }
+        }
+    """
+
+    def __init__(self, corrections=None, service_weights=None):
+        # BiasCorrections, defaults to the ones saved at BIAS_CORRECTIONS
+        self.corrections = corrections or default_corrections()
+        self.service_weights = service_weights
+        self.indexed = {}  # {location_name: {service_name: index}}
+        self.aggregates = {}  # {location_name: {epoch_hour: statistics}}
+        self.versions = {}  # {location_name: number of updates}
+        self.subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """Calls `callback(delta)` after every change, returns a function
+        that unsubscribes it
+        The callback is called from the thread updating the view
+        """
+        self.subscribers.append(callback)
+        return lambda: self.subscribers.remove(callback)
+
+    def update(self, location_name, service_name, index):
+        """Replaces a service's index for a location and refreshes the
+        affected hours, returns how many were recomputed
+        """
+        if not index.get("changed", True) and service_name in self.indexed.get(
+            location_name, {}
+        ):
+            return 0
+        with self._lock:
+            indexed = self.indexed.setdefault(location_name, {})
+            previous = indexed.get(service_name)
+            hours = affected_hours(previous, index)
+            indexed[service_name] = index
+            if not hours:
+                return 0
+            statistics = self._compute(location_name, indexed, sorted(hours))
+            aggregates = self.aggregates.setdefault(location_name, {})
+            before = {hour: aggregates.get(hour) for hour in hours}
+            aggregates.update(statistics)
+            for hour in hours - set(statistics):
+                aggregates.pop(hour, None)
+            self.versions[location_name] = self.versions.get(location_name, 0) + 1
+
+        if self.subscribers:
+            self._publish(location_name, service_name, previous, index, hours, before)
+        return len(hours)
+
+    def _publish(self, location_name, service_name, previous, index, hours, before):
+        aggregates = self.aggregates.get(location_name, {})
+        old = previous["temperatures"] if previous else {}
+        new = index["temperatures"]
+        delta = {
+            "location": location_name,
+            "service": service_name,
+            "aggregates": {},
+            "temperatures": {},
+        }
+        for hour in sorted(hours):
+            time_utc = epoch_hour_to_utc_string(hour)
+            after = aggregates.get(hour)
+            if before[hour] != after:
+                delta["aggregates"][time_utc] = statistics_delta(before[hour], after)
+            if old.get(hour) != new.get(hour):
+                delta["temperatures"][time_utc] = to_output(new.get(hour))
+        if delta["aggregates"] or delta["temperatures"]:
+            for callback in list(self.subscribers):
+                callback(delta)
+
+    def __call__(self, location_name, service_name, index):
+        """Scheduler callback"""
+        self.update(location_name, service_name, index)
+
+    def update_hourly_forecast(self, location_name, hourly_forecast):
+        """Updates the view with all the forecasts of an HourlyForecast object"""
+        for service_name, index in hourly_forecast.indexed.items():
+            self.update(location_name, service_name, index)
+
+    def _compute(self, location_name, indexed, hours):
+        service_names = list(indexed)
+        temperatures, mask = indexes_to_cube(
+            indexes=[indexed], epoch_hours=[hours], service_names=service_names,
+        )
+        if self.corrections is not None:
+            temperatures = self.corrections.apply(
+                temperatures,
+                location_names=[location_name],
+                epoch_hours=[hours],
+                service_names=service_names,
+                fetched_hours=[pendulum.now().int_timestamp // 3600],
+            )
+        aggregated = aggregate_cube(temperatures, mask)
+        aggregated.update(robust_statistics(temperatures, mask))
+        aggregated["weighted_average"] = weighted_average(
+            temperatures,
+            mask,
+            age_weights(
+                indexes_to_ages([indexed], service_names),
+                service_names,
+                self.service_weights,
+            ),
+        )
+        return {
+            hour: cell_statistics(aggregated, 0, h)
+            for h, hour in enumerate(hours)
+            if aggregated["count"][0, h]
+        }
+
+    def snapshot(self, location_name):
+        """Consistent copy of a location's documents and statistics, safe to
+        read while other threads update the view
+
+        Output:
+            {
+                "indexed": {service_name: index},
+                "aggregates": {epoch_hour: statistics},
+                "version": 12
+            }
+        """
+        with self._lock:
+            return {
+                "indexed": dict(self.indexed.get(location_name, {})),
+                "aggregates": dict(self.aggregates.get(location_name, {})),
+                "version": self.versions.get(location_name, 0),
+            }
+
+    def versions_of(self, location_names):
+        """Versions of locations, as sorted (location_name, version)"""
+        with self._lock:
+            return tuple(
+                sorted((elt, self.versions.get(elt, 0)) for elt in set(location_names))
+            )
+
+    def get(self, location_name, epoch_hour):
+        """Statistics of a location for an epoch hour, None if unknown
+
+        Output:
+            {
+                "average": Decimal("14.60"),
+                "min": Decimal("14.30"),
+                ...
+                "weighted_average": Decimal("14.65")
+            }
+        """
+        return self.aggregates.get(location_name, {}).get(epoch_hour)
+
+    def get_local(self, location_name, timezone, local_time):
+        """Same as get(), for a local time
+
+        Input:
+            'SYDNEY', 'Australia/Sydney', '2020-04-11T14:00'
+        """
+        epoch_hour = local_string_to_target_keys(
+            time_local=local_time, timezone=timezone
+        )["epoch_hour"]
+        return self.get(location_name, epoch_hour)
+
+    def prune(self, before_hour):
+        """Drops the statistics of the hours before an epoch hour"""
+        with self._lock:
+            for location_name, aggregates in self.aggregates.items():
+                self.aggregates[location_name] = {
+                    hour: statistics
+                    for hour, statistics in aggregates.items()
+                    if hour >= before_hour
+                }
@@ -11,6 +11,15 @@ setup(
     "python-dotenv",
     "requests",
     "beautifulsoup4",
-    "pendulum"
-   ]
+    "pendulum",
+    "numpy"
+   ],
+   extras_require = {
+    "archive": ["zstandard"],
+    "parquet": ["pyarrow"],
+    "redis": ["redis"]
+   },
+   entry_points = {
+    "console_scripts": ["pyweather=pyweather.cli:main"]
+   }
 )
\ No newline at end of file
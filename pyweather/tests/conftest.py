@@ -0,0 +1,11 @@
+import os
+
+# pyweather refuses to import without its API keys
+for api_key in [
+    "ACCUWEATHER_API_KEY",
+    "MET_CLIENT_SECRET",
+    "MET_CLIENT_ID",
+    "WEATHERCOM_API_KEY",
+    "GWC_API_KEY",
+]:
+    os.environ.setdefault(api_key, "test")
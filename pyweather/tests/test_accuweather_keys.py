@@ -0,0 +1,98 @@
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pyweather.api.accuweather import LocationKeyCache, geoposition_search
+
+
+@pytest.fixture
+def searches():
+    return []
+
+
+@pytest.fixture
+def search(searches):
+    """search argument of LocationKeyCache.resolve(), numbering the keys in
+    the order of the searches
+    """
+
+    def search(latitude, longitude):
+        searches.append((latitude, longitude))
+        return str(len(searches))
+
+    return search
+
+
+def test_miss_then_hit(tmp_path, search, searches):
+    cache = LocationKeyCache(tmp_path / "keys.db")
+    assert cache.resolve((-33.86, 151.21), search=search) == "1"
+    assert cache.resolve((-33.86, 151.21), search=search) == "1"
+    assert searches == [(-33.86, 151.21)]
+
+
+def test_nearby_coordinates_share_a_key(tmp_path, search, searches):
+    cache = LocationKeyCache(tmp_path / "keys.db")
+    cache.resolve((-33.8612, 151.2093), search=search)
+    assert cache.resolve((-33.8598, 151.2101), search=search) == "1"
+    assert cache.resolve((-37.81, 144.96), search=search) == "2"
+    assert len(searches) == 2
+
+
+def test_kept_across_runs(tmp_path, search, searches):
+    LocationKeyCache(tmp_path / "keys.db").resolve((-33.86, 151.21), search=search)
+    cache = LocationKeyCache(tmp_path / "keys.db")
+    assert cache.get((-33.86, 151.21)) == "1"
+    assert cache.resolve((-33.86, 151.21), search=search) == "1"
+    assert len(searches) == 1
+
+
+def test_concurrent_misses_search_once(tmp_path, search, searches):
+    cache = LocationKeyCache(tmp_path / "keys.db")
+    threads = [
+        threading.Thread(target=cache.resolve, args=((-33.86, 151.21), search))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(searches) == 1
+
+
+@pytest.fixture
+def geoposition_server():
+    """Local server answering the geoposition searches"""
+    queries = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            queries.append(self.path)
+            body = json.dumps({"Key": "12481"}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", queries
+    server.shutdown()
+    server.server_close()
+
+
+def test_geoposition_search(tmp_path, geoposition_server):
+    host, queries = geoposition_server
+    cache = LocationKeyCache(tmp_path / "keys.db")
+
+    def search(latitude, longitude):
+        return geoposition_search(latitude, longitude, host=host)
+
+    assert cache.resolve((-33.86, 151.21), search=search) == "12481"
+    assert cache.resolve((-33.86, 151.21), search=search) == "12481"
+    assert len(queries) == 1
+    assert "q=-33.86,151.21" in queries[0]
@@ -0,0 +1,134 @@
+import warnings
+import numpy as np
+import pytest
+from pyweather.aggregation import (
+    RunningAggregate,
+    RunningWeightedAverage,
+    aggregate_cube,
+    age_weights,
+    huber_mean,
+    mad_filtered_mean,
+    masked_median,
+    trimmed_mean,
+    weighted_average,
+)
+
+SERVICE_NAMES = ["pyweather.api.bom", "pyweather.api.met", "pyweather.api.yrno"]
+
+
+def cube():
+    """2 locations, 3 hours, 3 services, with missing values"""
+    temperatures = np.array(
+        [
+            [[20.0, 10.0, 12.0], [21.0, 11.0, 13.0], [22.0, 12.0, 14.0]],
+            [[15.0, 16.0, 17.0], [15.5, 16.5, 17.5], [16.0, 17.0, 18.0]],
+        ]
+    )
+    mask = np.ones(temperatures.shape, dtype=bool)
+    mask[0, 2, 2] = False
+    mask[1, 0, :] = False
+    return temperatures, mask
+
+
+def test_streaming_weighted_average_matches_batch():
+    temperatures, mask = cube()
+    # BOM reports no age, nor does any service of the second location
+    ages = np.array([[np.nan, 9.0, 3.0], [np.nan, np.nan, np.nan]])
+    running = RunningWeightedAverage(2, 3, service_weights={})
+    for s, service_name in enumerate(SERVICE_NAMES):
+        running.add(service_name, temperatures[..., s], mask[..., s], ages[:, s])
+
+    batch = weighted_average(
+        temperatures, mask, age_weights(ages, SERVICE_NAMES, service_weights={})
+    )
+    np.testing.assert_allclose(running.weighted_average, batch, equal_nan=True)
+    assert np.isnan(running.weighted_average[1, 0])
+
+
+def test_unknown_age_takes_the_median_of_the_known_ones():
+    running = RunningWeightedAverage(1, 1, service_weights={})
+    running.add("pyweather.api.bom", np.array([[20.0]]), np.array([[True]]), [np.nan])
+    running.add("pyweather.api.met", np.array([[10.0]]), np.array([[True]]), [9.0])
+    np.testing.assert_allclose(running.weighted_average, [[15.0]])
+
+
+def masked_out(temperatures, mask):
+    """The cube with NaN for the missing values, for NumPy's nan* functions"""
+    return np.where(mask, temperatures, np.nan)
+
+
+def test_aggregate_cube_matches_numpy():
+    temperatures, mask = cube()
+    aggregated = aggregate_cube(temperatures, mask)
+    values = masked_out(temperatures, mask)
+    with warnings.catch_warnings():
+        # Empty cells, which are NaN as in aggregate_cube()
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected = {
+            "average": np.nanmean(values, axis=-1),
+            "min": np.nanmin(values, axis=-1),
+            "max": np.nanmax(values, axis=-1),
+            "median": np.nanmedian(values, axis=-1),
+            "std": np.nanstd(values, axis=-1),
+        }
+    for name, values in expected.items():
+        np.testing.assert_allclose(aggregated[name], values, equal_nan=True)
+    np.testing.assert_array_equal(aggregated["count"], mask.sum(axis=-1))
+
+
+def test_aggregate_cube_without_services():
+    aggregated = aggregate_cube(np.zeros((2, 3, 0)), np.zeros((2, 3, 0), dtype=bool))
+    assert np.isnan(aggregated["average"]).all()
+    assert np.isnan(aggregated["median"]).all()
+    assert (aggregated["count"] == 0).all()
+
+
+def test_masked_median_even_and_odd_counts():
+    values = np.array([[3.0, 1.0, 2.0, 100.0], [4.0, 1.0, 3.0, 2.0]])
+    mask = np.array([[True, True, True, False], [True, True, True, True]])
+    np.testing.assert_allclose(masked_median(values, mask), [2.0, 2.5])
+
+
+def test_trimmed_mean_drops_the_extremes():
+    temperatures = np.array([[[10.0, 15.0, 15.2, 15.4, 30.0]]])
+    mask = np.ones(temperatures.shape, dtype=bool)
+    np.testing.assert_allclose(trimmed_mean(temperatures, mask), [[15.2]])
+
+
+def test_running_aggregate_matches_batch():
+    temperatures, mask = cube()
+    running = RunningAggregate(2, 3)
+    for s in range(temperatures.shape[-1]):
+        running.add(temperatures[..., s], mask[..., s])
+    statistics = running.statistics()
+    aggregated = aggregate_cube(temperatures, mask)
+    for name in ["average", "min", "max", "std", "spread"]:
+        np.testing.assert_allclose(
+            statistics[name], aggregated[name], equal_nan=True, atol=1e-9
+        )
+    np.testing.assert_array_equal(statistics["count"], aggregated["count"])
+
+
+def one_cell(*temperatures):
+    temperatures = np.array([[temperatures]], dtype=np.float64)
+    return temperatures, np.ones(temperatures.shape, dtype=bool)
+
+
+@pytest.mark.parametrize("estimator", [mad_filtered_mean, huber_mean, trimmed_mean])
+def test_robust_estimators_resist_an_outlier(estimator):
+    temperatures, mask = one_cell(15.0, 15.2, 15.4, 15.6, 35.0)
+    assert abs(estimator(temperatures, mask)[0, 0] - 15.3) < 0.15
+
+
+@pytest.mark.parametrize("estimator", [mad_filtered_mean, huber_mean])
+def test_robust_estimators_keep_close_services(estimator):
+    # Two identical temperatures must not make the third one an outlier
+    temperatures, mask = one_cell(15.0, 15.0, 15.3)
+    np.testing.assert_allclose(estimator(temperatures, mask), [[15.1]])
+
+
+@pytest.mark.parametrize("estimator", [mad_filtered_mean, huber_mean, trimmed_mean])
+def test_robust_estimators_without_forecasts(estimator):
+    temperatures, mask = one_cell(15.0, 16.0)
+    assert np.isnan(estimator(temperatures, np.zeros_like(mask))).all()
+    assert np.isnan(estimator(np.zeros((1, 2, 0)), np.zeros((1, 2, 0), bool))).all()
@@ -0,0 +1,108 @@
+import numpy as np
+from pyweather.backtest import (
+    backtest,
+    backtest_records,
+    backtest_store,
+    load_reference,
+)
+from pyweather.history import HISTORY_DTYPE, HistoryStore
+
+# Epoch hour of 2020-04-22T00:00Z, when the forecasts are fetched
+FETCHED_HOUR = 440976
+SERVICE_NAMES = ["pyweather.api.met", "pyweather.api.yrno"]
+LOCATION_NAMES = ["SYDNEY", "MELBOURNE"]
+REFERENCE = """location,time_utc,temperature_celcius
+SYDNEY,2020-04-22T00:00:00Z,14.0
+SYDNEY,2020-04-22T03:00:00Z,15.0
+SYDNEY,2020-04-22T08:00:00Z,16.0
+PERTH,2020-04-22T03:00:00Z,20.0
+"""
+
+
+def rows(*forecasts):
+    """HISTORY_DTYPE rows of forecasts fetched at FETCHED_HOUR
+
+    Input:
+        (service code, location code, lead hours, temperature), ...
+    """
+    rows = np.zeros(len(forecasts), dtype=HISTORY_DTYPE)
+    for i, (service, location, lead, temperature) in enumerate(forecasts):
+        target_hour = FETCHED_HOUR + lead
+        rows[i] = (service, location, FETCHED_HOUR * 3600, -1, target_hour, temperature)
+    return rows
+
+
+def reference(tmp_path):
+    path = tmp_path / "observed.csv"
+    path.write_text(REFERENCE)
+    return path
+
+
+def test_load_reference(tmp_path):
+    loaded = load_reference(reference(tmp_path), LOCATION_NAMES)
+    assert loaded["location"].tolist() == [0, 0, 0, -1]
+    assert loaded["target_hour"].tolist() == [
+        FETCHED_HOUR,
+        FETCHED_HOUR + 3,
+        FETCHED_HOUR + 8,
+        FETCHED_HOUR + 3,
+    ]
+
+    path = tmp_path / "epoch_hours.csv"
+    path.write_text(
+        f"location,epoch_hour,temperature_celcius\nSYDNEY,{FETCHED_HOUR},14.0\n"
+    )
+    assert load_reference(path, LOCATION_NAMES)["target_hour"].tolist() == [
+        FETCHED_HOUR
+    ]
+
+
+def test_backtest_scores_by_service_location_and_lead(tmp_path):
+    scores = backtest(
+        rows(
+            (0, 0, 3, 16.0),  # 1 degree warm, as warm as persistence
+            (0, 0, 8, 15.0),  # 1 degree cold, half persistence's error
+            (1, 0, 3, 15.0),  # Spot on
+            (1, 0, 20, 18.0),  # Not observed yet
+        ),
+        load_reference(reference(tmp_path), LOCATION_NAMES),
+        services_count=2,
+        locations_count=2,
+        lead_buckets=[0, 6],
+    )
+    assert scores["count"].tolist() == [[[1, 1], [0, 0]], [[1, 0], [0, 0]]]
+    np.testing.assert_allclose(scores["bias"][:, 0], [[1.0, -1.0], [0.0, np.nan]])
+    np.testing.assert_allclose(scores["mae"][0, 0], [1.0, 1.0])
+    np.testing.assert_allclose(scores["skill"][:, 0], [[0.0, 0.75], [1.0, np.nan]])
+    assert np.isnan(scores["rmse"][:, 1]).all()
+
+
+def test_backtest_without_forecasts(tmp_path):
+    scores = backtest(
+        rows(),
+        load_reference(reference(tmp_path), LOCATION_NAMES),
+        services_count=2,
+        locations_count=2,
+    )
+    assert not scores["count"].any()
+    assert backtest_records(scores, SERVICE_NAMES, LOCATION_NAMES) == []
+
+
+def test_backtest_store_records(tmp_path):
+    store = HistoryStore(tmp_path / "history")
+    with store.writer(background=False) as writer:
+        for service_name, temperature in zip(SERVICE_NAMES, [16.0, 15.0]):
+            writer.append(
+                service_name,
+                "SYDNEY",
+                [FETCHED_HOUR + 3],
+                [temperature],
+                fetched_at=FETCHED_HOUR * 3600,
+            )
+    scores = backtest_store(store, reference(tmp_path))
+    records = backtest_records(scores, SERVICE_NAMES, ["SYDNEY"])
+    assert [(elt["service"], elt["lead_hours"]) for elt in records] == [
+        ("pyweather.api.met", "[0, 6)"),
+        ("pyweather.api.yrno", "[0, 6)"),
+    ]
+    assert [elt["rmse"] for elt in records] == [1.0, 0.0]
@@ -0,0 +1,93 @@
+import types
+import numpy as np
+from decimal import Decimal
+from pyweather.correction import BiasCorrections
+from pyweather.forecast import Forecast, HourlyForecast
+from pyweather.locations import LOCATIONS
+from pyweather.utils.time import local_string_to_target_keys
+
+LOCAL_DATE = "2020-04-14T13:00"
+TEMPERATURES = {"pyweather.api.met": "15.00", "pyweather.api.yrno": "17.00"}
+
+
+def corrections(offsets):
+    """BiasCorrections of SYDNEY, a single lead bucket and the same offset
+    at every hour
+    """
+    table = np.zeros((len(offsets), 1, 24, 1))
+    for s, offset in enumerate(offsets.values()):
+        table[s] = offset
+    return BiasCorrections(table, list(offsets), ["SYDNEY"], [0])
+
+
+def service(service_name):
+    """Service module of the single-hour Forecast, answering from TEMPERATURES"""
+
+    def retrieve(location_object, local_date):
+        return {
+            "ok": True,
+            "temperature_celcius": Decimal(TEMPERATURES[service_name]),
+            "forecast_age_hours": 1,
+        }
+
+    return types.SimpleNamespace(__name__=service_name, retrieve=retrieve)
+
+
+def indexed():
+    epoch_hour = local_string_to_target_keys(LOCAL_DATE, "Australia/Sydney")[
+        "epoch_hour"
+    ]
+    return {
+        service_name: {
+            "metadata": {"forecast_age_hours": 1},
+            "temperatures": {epoch_hour: Decimal(temperature)},
+            "changed": True,
+        }
+        for service_name, temperature in TEMPERATURES.items()
+    }
+
+
+def test_corrections_are_subtracted():
+    bias = corrections({"pyweather.api.met": 1.0, "pyweather.api.yrno": -1.0})
+    temperatures = np.array([[[15.0, 17.0]]])
+    corrected = bias.apply(
+        temperatures,
+        location_names=["SYDNEY"],
+        epoch_hours=[[440721]],
+        service_names=["pyweather.api.met", "pyweather.api.yrno"],
+        fetched_hours=[440700],
+    )
+    np.testing.assert_allclose(corrected, [[[14.0, 18.0]]])
+
+
+def test_unknown_location_and_service_are_left_alone():
+    bias = corrections({"pyweather.api.met": 1.0})
+    temperatures = np.array([[[15.0, 17.0]], [[15.0, 17.0]]])
+    corrected = bias.apply(
+        temperatures,
+        location_names=["SYDNEY", None],
+        epoch_hours=[[440721], [440721]],
+        service_names=["pyweather.api.met", "pyweather.api.bom"],
+        fetched_hours=[440700, 440700],
+    )
+    np.testing.assert_allclose(corrected, [[[14.0, 17.0]], [[15.0, 17.0]]])
+
+
+def test_forecast_and_hourly_forecast_agree():
+    bias = corrections({"pyweather.api.met": 2.0, "pyweather.api.yrno": 0.5})
+    forecast = Forecast(
+        LOCATIONS["SYDNEY"],
+        LOCAL_DATE,
+        services=[service(elt) for elt in TEMPERATURES],
+        corrections=bias,
+    )
+    hourly_forecast = HourlyForecast(
+        LOCATIONS["SYDNEY"],
+        LOCAL_DATE,
+        next_n_hours=1,
+        corrections=bias,
+        indexed=indexed(),
+    )
+    hourly = hourly_forecast.aggregated[LOCAL_DATE]
+    assert forecast.aggregated["average"] == hourly["average"] == Decimal("14.75")
+    assert forecast.aggregated["weighted_average"] == hourly["weighted_average"]
@@ -0,0 +1,78 @@
+import pytest
+from decimal import Decimal
+from pyweather.forecast import HourlyForecast, StreamingForecast
+from pyweather.locations import LOCATIONS
+from pyweather.utils.time import hour_grid
+
+LOCAL_DATE_START = "2020-04-14T13:00"
+# The third hour is forecast by no service, BOM skips the second one
+TEMPERATURES = {
+    "pyweather.api.bom": ["14.00", None, None],
+    "pyweather.api.met": ["15.00", "16.00", None],
+    "pyweather.api.yrno": ["17.00", "15.00", None],
+}
+AGES = {"pyweather.api.bom": None, "pyweather.api.met": 2, "pyweather.api.yrno": 6}
+
+
+def indexed():
+    epoch_hours = hour_grid(
+        timezone="Australia/Sydney",
+        time_local_start=LOCAL_DATE_START,
+        next_n_hours=3,
+    ).epoch_hours
+    return {
+        service_name: {
+            "metadata": {"forecast_age_hours": AGES[service_name]},
+            "temperatures": {
+                epoch_hour: Decimal(temperature)
+                for epoch_hour, temperature in zip(epoch_hours, temperatures)
+                if temperature is not None
+            },
+            "changed": True,
+        }
+        for service_name, temperatures in TEMPERATURES.items()
+    }
+
+
+@pytest.fixture
+def hourly_forecast():
+    return HourlyForecast(
+        LOCATIONS["SYDNEY"], LOCAL_DATE_START, next_n_hours=3, indexed=indexed()
+    )
+
+
+def test_hourly_forecast_aggregates_every_hour(hourly_forecast):
+    first, second, third = hourly_forecast.aggregated.values()
+    assert (first["count"], second["count"], third["count"]) == (3, 2, 0)
+    assert first["average"] == Decimal("15.33")
+    assert (first["min"], first["max"], first["spread"]) == (
+        Decimal("14.00"),
+        Decimal("17.00"),
+        Decimal("3.00"),
+    )
+    assert second["average"] == Decimal("15.50")
+    # MET's fresher forecast outweighs YRNO's
+    assert Decimal("15.50") < second["weighted_average"] < Decimal("16.00")
+    assert all(value is None for name, value in third.items() if name != "count")
+
+
+def test_streaming_forecast_matches_hourly_forecast(hourly_forecast):
+    streaming_forecast = StreamingForecast(
+        LOCATIONS["SYDNEY"], LOCAL_DATE_START, next_n_hours=3
+    )
+    for service_name, index in indexed().items():
+        streaming_forecast._add(service_name, index)
+    assert list(streaming_forecast.aggregated) == list(hourly_forecast.aggregated)
+    for hour, streamed in streaming_forecast.aggregated.items():
+        batch = hourly_forecast.aggregated[hour]
+        assert streamed == {name: batch[name] for name in streamed}
+
+
+def test_streaming_forecast_without_services():
+    streaming_forecast = StreamingForecast(
+        LOCATIONS["SYDNEY"], LOCAL_DATE_START, next_n_hours=3
+    )
+    for statistics in streaming_forecast.aggregated.values():
+        assert statistics["count"] == 0
+        assert statistics["average"] is None
+        assert statistics["weighted_average"] is None
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from decimal import Decimal
+from pyweather.history import HistoryStore, issue_time_to_timestamp
+
+# 2020-04-30T22:00Z, the next two hours are in May
+APRIL_30 = 441190
+
+
+def test_scan_returns_the_target_hours_across_months(tmp_path):
+    store = HistoryStore(tmp_path)
+    with store.writer() as writer:
+        writer.append(
+            "pyweather.api.met",
+            "SYDNEY",
+            target_hours=[APRIL_30 + 2, APRIL_30, APRIL_30 + 1],
+            temperatures=[17.0, 15.0, 16.0],
+            fetched_at=1588280000,
+        )
+        writer.append("pyweather.api.met", "MELBOURNE", [APRIL_30], [12.0])
+    assert sorted(elt.parent.name for elt in store.segments(0)) == [
+        "2020-04",
+        "2020-05",
+    ]
+
+    rows = store.scan("SYDNEY", APRIL_30 + 1, APRIL_30 + 2)
+    assert rows["target_hour"].tolist() == [APRIL_30 + 1, APRIL_30 + 2]
+    assert rows["temperature"].tolist() == [16.0, 17.0]
+    assert len(store.load()) == 4
+    assert len(store.scan("BRISBANE")) == 0
+
+
+def test_catalog_survives_reopening(tmp_path):
+    with HistoryStore(tmp_path).writer(background=False) as writer:
+        writer.append("pyweather.api.yrno", "SYDNEY", [APRIL_30], [15.0])
+        writer.append("pyweather.api.met", "SYDNEY", [APRIL_30], [16.0])
+    store = HistoryStore(tmp_path)
+    assert store.catalog["services"] == ["pyweather.api.yrno", "pyweather.api.met"]
+    rows = store.scan("SYDNEY", services=["pyweather.api.met"])
+    assert rows["temperature"].tolist() == [16.0]
+
+
+def test_unchanged_documents_are_skipped(tmp_path):
+    store = HistoryStore(tmp_path)
+    indexed = {
+        "pyweather.api.met": {
+            "metadata": {"forecast_issue_time": "2020-04-30T18:00:00Z"},
+            "temperatures": {APRIL_30: Decimal("15.00")},
+            "changed": True,
+        },
+        "pyweather.api.yrno": {
+            "metadata": {},
+            "temperatures": {APRIL_30: Decimal("16.00")},
+            "changed": False,
+        },
+    }
+    with store.writer(background=False) as writer:
+        writer.append_indexed("SYDNEY", indexed)
+    rows = store.scan("SYDNEY")
+    assert store.catalog["services"] == ["pyweather.api.met"]
+    assert rows["issued_at"].tolist() == [
+        issue_time_to_timestamp("2020-04-30T18:00:00Z")
+    ]
+
+
+def test_batches_are_written_once_full(tmp_path):
+    store = HistoryStore(tmp_path)
+    writer = store.writer(batch_size=2, background=False)
+    writer.append("pyweather.api.met", "SYDNEY", [APRIL_30], [15.0])
+    assert len(store.scan("SYDNEY")) == 0
+    writer.append("pyweather.api.yrno", "SYDNEY", [APRIL_30], [16.0])
+    assert len(store.scan("SYDNEY")) == 2
+    writer.close()
+
+
+def test_a_failed_background_write_is_raised(tmp_path, monkeypatch):
+    store = HistoryStore(tmp_path)
+
+    def write_segment(rows):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(store, "write_segment", write_segment)
+    writer = store.writer()
+    writer.append("pyweather.api.met", "SYDNEY", [APRIL_30], np.array([15.0]))
+    with pytest.raises(OSError):
+        writer.close()
@@ -0,0 +1,126 @@
+import types
+import pytest
+from decimal import Decimal
+from pyweather import leases
+from pyweather.leases import (
+    MemoryLeaseStore,
+    SqliteLeaseStore,
+    CoordinatedRetriever,
+    dump_index,
+    load_index,
+)
+
+SERVICE = types.SimpleNamespace(__name__="pyweather.api.met")
+LOCATION = {"coordinates": (-33.86, 151.21), "timezone": "Australia/Sydney"}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryLeaseStore()
+    return SqliteLeaseStore(tmp_path / "leases.db")
+
+
+def index(issue_time):
+    return {
+        "metadata": {"forecast_issue_time": issue_time, "forecast_age_hours": 0},
+        "temperatures": {440721: Decimal("15.1"), 440722: Decimal("15.3")},
+        "changed": True,
+    }
+
+
+def serve(monkeypatch, issue_time="2020-04-11T09:00:00Z"):
+    """Makes leases.retrieve_index() return a document issued at issue_time
+    Returns the list of the services it is called with
+    """
+    calls = []
+
+    def retrieve_index(service, location_object):
+        calls.append(service.__name__)
+        return index(issue_time)
+
+    monkeypatch.setattr(leases, "retrieve_index", retrieve_index)
+    return calls
+
+
+def test_claim_is_exclusive(store):
+    assert store.claim("lease:a", "node-1", 60)
+    assert store.claim("lease:a", "node-1", 60)  # Extending its own lease
+    assert not store.claim("lease:a", "node-2", 60)
+
+
+def test_claim_after_expiry(store):
+    assert store.claim("lease:a", "node-1", 0)
+    assert store.claim("lease:a", "node-2", 60)
+    assert not store.claim("lease:a", "node-1", 60)
+
+
+def test_release(store):
+    store.claim("lease:a", "node-1", 60)
+    store.release("lease:a", "node-2")  # Not its lease
+    assert not store.claim("lease:a", "node-2", 60)
+    store.release("lease:a", "node-1")
+    assert store.claim("lease:a", "node-2", 60)
+
+
+def test_shared_values_expire(store):
+    store.put("index:a", "value", 60)
+    store.put("index:b", "value", 0)
+    assert store.get("index:a") == "value"
+    assert store.get("index:b") is None
+
+
+def test_dump_load_index():
+    document = index("2020-04-11T09:00:00Z")
+    assert load_index(dump_index(document)) == document
+
+
+def test_single_fetch_across_nodes(store, monkeypatch):
+    calls = serve(monkeypatch)
+    nodes = [CoordinatedRetriever(store, node_id=f"node-{i}") for i in range(3)]
+    indexes = [node.retrieve_index(SERVICE, LOCATION) for node in nodes]
+    assert calls == [SERVICE.__name__]
+    assert all(index["changed"] for index in indexes)
+    assert len({str(index["temperatures"]) for index in indexes}) == 1
+
+
+def test_changed_is_per_node(store, monkeypatch):
+    serve(monkeypatch)
+    nodes = [CoordinatedRetriever(store, node_id=f"node-{i}") for i in range(2)]
+    nodes[0].retrieve_index(SERVICE, LOCATION)
+    # Asked again without a new run
+    assert not nodes[0].retrieve_index(SERVICE, LOCATION)["changed"]
+    # The other node never saw it
+    assert nodes[1].retrieve_index(SERVICE, LOCATION)["changed"]
+    assert not nodes[1].retrieve_index(SERVICE, LOCATION)["changed"]
+
+
+def test_new_run_within_slot(store, monkeypatch):
+    serve(monkeypatch)
+    nodes = [CoordinatedRetriever(store, node_id=f"node-{i}") for i in range(2)]
+    for node in nodes:
+        node.retrieve_index(SERVICE, LOCATION)
+    calls = serve(monkeypatch, issue_time="2020-04-11T10:00:00Z")
+    indexes = [node.retrieve_index(SERVICE, LOCATION) for node in nodes]
+    assert calls == [SERVICE.__name__]
+    assert all(index["changed"] for index in indexes)
+    assert {
+        index["metadata"]["forecast_issue_time"] for index in indexes
+    } == {"2020-04-11T10:00:00Z"}
+
+
+def test_ages_are_refreshed(store, monkeypatch):
+    serve(monkeypatch)
+    nodes = [CoordinatedRetriever(store, node_id=f"node-{i}") for i in range(2)]
+    nodes[0].retrieve_index(SERVICE, LOCATION)
+    index = nodes[1].retrieve_index(SERVICE, LOCATION)
+    # Stored with an age of 0, issued years ago
+    assert index["metadata"]["forecast_age_hours"] > 0
+
+
+def test_failed_fetch_keeps_the_lease(store, monkeypatch):
+    monkeypatch.setattr(leases, "retrieve_index", lambda *args: None)
+    node = CoordinatedRetriever(store, node_id="node-1")
+    assert node.retrieve_index(SERVICE, LOCATION) is None
+    other = CoordinatedRetriever(store, node_id="node-2", wait_seconds=0.01)
+    assert other.retrieve_index(SERVICE, LOCATION) is None
@@ -0,0 +1,67 @@
+import pytest
+from pyweather.utils import responses
+
+MET = "pyweather.api.met"
+SYDNEY = {"coordinates": (-33.86, 151.21), "timezone": "Australia/Sydney"}
+# In the same MET grid cell as SYDNEY
+SYDNEY_CBD = {"coordinates": (-33.87, 151.21), "timezone": "Australia/Sydney"}
+
+
+@pytest.fixture(autouse=True)
+def clear_responses(monkeypatch):
+    monkeypatch.delenv("RESPONSE_ARCHIVE", raising=False)
+    responses.clear()
+    yield
+    responses.clear()
+
+
+def counter():
+    """compute() argument of derive(), returning how many times it was called"""
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return len(calls)
+
+    return compute
+
+
+def test_only_changed_responses_are_recorded():
+    assert responses.record_response(MET, SYDNEY, b'{"temperature": 15}')
+    assert not responses.record_response(MET, SYDNEY, '{"temperature": 15}')
+    assert responses.record_response(MET, SYDNEY, b'{"temperature": 16}')
+    # Each part of a response is compared with its own last content
+    assert responses.record_response(MET, SYDNEY, b'{"temperature": 16}', part="2")
+
+
+def test_derived_values_are_dropped_when_the_response_changes():
+    compute = counter()
+    responses.record_response(MET, SYDNEY, b'{"temperature": 15}')
+    assert responses.derive(MET, SYDNEY, "index", compute) == (1, True)
+    assert responses.derive(MET, SYDNEY, "index", compute) == (1, False)
+
+    responses.record_response(MET, SYDNEY, b'{"temperature": 15}')
+    assert responses.derive(MET, SYDNEY, "index", compute) == (1, False)
+
+    responses.record_response(MET, SYDNEY, b'{"temperature": 16}')
+    assert responses.derive(MET, SYDNEY, "index", compute) == (2, True)
+
+
+def test_locations_of_a_cell_share_their_derived_values():
+    compute = counter()
+    for location_object in [SYDNEY, SYDNEY_CBD]:
+        responses.record_response(MET, location_object, b'{"temperature": 15}')
+    assert responses.derive(MET, SYDNEY, "index", compute) == (1, True)
+    # Computed once, but new to the second location
+    assert responses.derive(MET, SYDNEY_CBD, "index", compute) == (1, True)
+    assert responses.derive(MET, SYDNEY_CBD, "index", compute) == (1, False)
+
+    responses.record_response(MET, SYDNEY_CBD, b'{"temperature": 16}')
+    assert responses.derive(MET, SYDNEY_CBD, "index", compute) == (2, True)
+    assert responses.derive(MET, SYDNEY, "index", compute) == (1, False)
+
+
+def test_unrecorded_locations_are_never_cached():
+    compute = counter()
+    assert responses.cached(MET, SYDNEY, "index", compute) == 1
+    assert responses.cached(MET, SYDNEY, "index", compute) == 2